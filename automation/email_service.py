@@ -1,16 +1,25 @@
 import smtplib
 import os
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
 class EmailService:
+    REMINDER_SUBJECTS = {
+        'document_upload': 'Document Upload Reminder',
+        'orientation': 'Orientation Session Reminder',
+        'compliance': 'Compliance Renewal Reminder'
+    }
+    
     def __init__(self):
         # In production, use environment variables
-        self.smtp_server = "smtp.gmail.com"
-        self.smtp_port = 587
+        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+        self.smtp_port = int(os.getenv('SMTP_PORT', '587'))
         self.email = os.getenv('EMAIL_ADDRESS', 'noreply@ndis.com')
         self.password = os.getenv('EMAIL_PASSWORD', 'your-app-password')
+        # 'print' (demo default) or 'smtp' to actually deliver
+        self.delivery = os.getenv('EMAIL_DELIVERY', 'print')
+        self.use_tls = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
     
     def send_welcome_email(self, to_email, staff_name, staff_id):
         """Send welcome email to new staff"""
@@ -44,13 +53,7 @@ class EmailService:
     
     def send_reminder_email(self, to_email, reminder_type, details):
         """Send reminder emails"""
-        subjects = {
-            'document_upload': 'Document Upload Reminder',
-            'orientation': 'Orientation Session Reminder',
-            'compliance': 'Compliance Renewal Reminder'
-        }
-        
-        subject = subjects.get(reminder_type, 'NDIS Platform Reminder')
+        subject = self.REMINDER_SUBJECTS.get(reminder_type, 'NDIS Platform Reminder')
         
         body = f"""
         Hello,
@@ -67,31 +70,77 @@ class EmailService:
         
         return self._send_email(to_email, subject, body)
     
+    def render_digest(self, items):
+        """Subject and body for one recipient's queued (category, details)
+        items; a single item reads like the individual reminder did"""
+        if len(items) == 1:
+            category, details = items[0]
+            return self.REMINDER_SUBJECTS.get(category, 'NDIS Platform Reminder'), f"""
+        Hello,
+        
+        This is a friendly reminder regarding: {category.replace('_', ' ').title()}
+        
+        Details: {details}
+        
+        Please take action as soon as possible to ensure compliance.
+        
+        Best regards,
+        NDIS Platform Team
+        """
+        
+        lines = '\n'.join(
+            f"        - {category.replace('_', ' ').title()}: {details}" for category, details in items
+        )
+        return f"You have {len(items)} NDIS Platform reminders", f"""
+        Hello,
+        
+        The following items need your attention:
+        
+{lines}
+        
+        Please take action as soon as possible to ensure compliance.
+        
+        Best regards,
+        NDIS Platform Team
+        """
+    
     def _send_email(self, to_email, subject, body):
         """Internal method to send email"""
         try:
-            # For demo purposes, just print the email
-            print(f"\n📧 EMAIL SENT")
-            print(f"To: {to_email}")
-            print(f"Subject: {subject}")
-            print(f"Body: {body}")
-            print(f"Sent at: {datetime.now()}")
-            print("=" * 50)
-            
-            # In production, uncomment this:
-            # msg = MimeMultipart()
-            # msg['From'] = self.email
-            # msg['To'] = to_email
-            # msg['Subject'] = subject
-            # msg.attach(MimeText(body, 'plain'))
-            # 
-            # server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            # server.starttls()
-            # server.login(self.email, self.password)
-            # server.send_message(msg)
-            # server.quit()
-            
-            return True
+            return self.deliver(to_email, subject, body)
         except Exception as e:
             print(f"❌ Email sending failed: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def deliver(self, to_email, subject, body):
+        """Send one message, raising on failure so callers can record why"""
+        if self.delivery == 'smtp':
+            return self._send_smtp(to_email, subject, body)
+        
+        # For demo purposes, just print the email
+        print(f"\n📧 EMAIL SENT")
+        print(f"To: {to_email}")
+        print(f"Subject: {subject}")
+        print(f"Body: {body}")
+        print(f"Sent at: {datetime.now()}")
+        print("=" * 50)
+        
+        return True
+    
+    def _send_smtp(self, to_email, subject, body):
+        """Deliver through the configured SMTP server"""
+        msg = MIMEMultipart()
+        msg['From'] = self.email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            if self.use_tls:
+                server.starttls()
+                server.login(self.email, self.password)
+            server.send_message(msg)
+        finally:
+            server.quit()
+        return True
\ No newline at end of file
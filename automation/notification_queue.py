@@ -0,0 +1,176 @@
+"""Notification queue with per-recipient digests and a dead-letter table.
+
+Workflows enqueue items instead of emailing directly. Each dispatcher run
+sends every recipient one digest of everything queued for them since the
+last run. A digest that fails to send is moved to notification_dead_letters
+with the failure reason and retried with exponential backoff until
+MAX_ATTEMPTS, after which it stays there as 'dead' for someone to look at.
+"""
+import os
+from itertools import groupby
+from psycopg2.extras import execute_values
+
+DIGEST_WINDOW_MINUTES = int(os.getenv('NOTIFICATION_DIGEST_MINUTES', '15'))
+MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '6'))
+RETRY_BASE_MINUTES = 5
+RETRY_MAX_MINUTES = 24 * 60
+# Items claimed by a dispatcher that died mid-run become pending again
+CLAIM_TIMEOUT_MINUTES = 30
+DISPATCH_BATCH = 10000
+
+def retry_delay_minutes(attempts):
+    """5, 10, 20, ... minutes, capped at a day"""
+    return min(RETRY_BASE_MINUTES * 2 ** (attempts - 1), RETRY_MAX_MINUTES)
+
+def enqueue(cursor, items):
+    """Queue notifications in the caller's transaction.
+
+    items are dicts with recipient, category and details, plus optional
+    entity_type, entity_id and dedupe_key. An item whose dedupe_key is
+    already queued or sent is dropped, so a workflow that runs more often
+    than its reminders are due does not send them twice. Returns the
+    number of items queued.
+    """
+    rows = [
+        (item['recipient'], item['category'], item['details'], item.get('entity_type'),
+         item.get('entity_id'), item.get('dedupe_key'))
+        for item in items
+    ]
+    if not rows:
+        return 0
+    queued = execute_values(cursor, """
+        INSERT INTO notification_queue (recipient, category, details, entity_type, entity_id, dedupe_key)
+        VALUES %s
+        ON CONFLICT (dedupe_key) DO NOTHING
+        RETURNING id
+    """, rows, fetch=True)
+    return len(queued)
+
+def _claim(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE notification_queue SET status = 'sending', claimed_at = NOW()
+            WHERE id IN (
+                SELECT id FROM notification_queue
+                WHERE status = 'pending'
+                   OR (status = 'sending' AND claimed_at < NOW() - %s * INTERVAL '1 minute')
+                ORDER BY recipient, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, recipient, category, details
+        """, (CLAIM_TIMEOUT_MINUTES, DISPATCH_BATCH))
+        claimed = cursor.fetchall()
+    conn.commit()
+    return sorted(claimed, key=lambda row: (row[1], row[0]))
+
+def dispatch_pending(conn, email_service):
+    """Send one digest per recipient for everything queued.
+
+    Items are claimed and committed first, so a slow SMTP server never
+    holds row locks and a second dispatcher cannot send the same items.
+    Returns (digests sent, digests dead-lettered).
+    """
+    sent = failed = 0
+    for recipient, group in groupby(_claim(conn), key=lambda row: row[1]):
+        group = list(group)
+        ids = [row[0] for row in group]
+        items = [(category, details) for _, _, category, details in group]
+        subject, body = email_service.render_digest(items)
+        with conn.cursor() as cursor:
+            try:
+                email_service.deliver(recipient, subject, body)
+            except Exception as e:
+                cursor.execute("""
+                    INSERT INTO notification_dead_letters
+                        (recipient, subject, body, item_count, attempts, failure_reason, next_retry_at)
+                    VALUES (%s, %s, %s, %s, 1, %s, NOW() + %s * INTERVAL '1 minute')
+                    RETURNING id
+                """, (recipient, subject, body, len(items), str(e), retry_delay_minutes(1)))
+                dead_letter_id = cursor.fetchone()[0]
+                cursor.execute("""
+                    UPDATE notification_queue SET status = 'failed', dead_letter_id = %s
+                    WHERE id = ANY(%s)
+                """, (dead_letter_id, ids))
+                failed += 1
+            else:
+                cursor.execute("""
+                    UPDATE notification_queue SET status = 'sent', sent_at = NOW()
+                    WHERE id = ANY(%s)
+                """, (ids,))
+                sent += 1
+        conn.commit()
+    return sent, failed
+
+def _claim_dead_letters(conn):
+    # Claimed by pushing the retry out by CLAIM_TIMEOUT_MINUTES, so another
+    # dispatcher skips them and a dispatcher that dies mid-run only delays them
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE notification_dead_letters
+            SET next_retry_at = NOW() + %s * INTERVAL '1 minute'
+            WHERE id IN (
+                SELECT id FROM notification_dead_letters
+                WHERE status = 'retrying' AND next_retry_at <= NOW()
+                ORDER BY next_retry_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, recipient, subject, body, attempts
+        """, (CLAIM_TIMEOUT_MINUTES, DISPATCH_BATCH))
+        claimed = cursor.fetchall()
+    conn.commit()
+    return sorted(claimed)
+
+def retry_dead_letters(conn, email_service):
+    """Resend dead-lettered digests whose retry is due.
+
+    Like dispatch_pending, the digests are claimed and committed before
+    anything is sent, and each result is committed on its own.
+    Returns (delivered, still failing, given up).
+    """
+    delivered = retrying = dead = 0
+    for dead_letter_id, recipient, subject, body, attempts in _claim_dead_letters(conn):
+        with conn.cursor() as cursor:
+            try:
+                email_service.deliver(recipient, subject, body)
+            except Exception as e:
+                attempts += 1
+                gave_up = attempts >= MAX_ATTEMPTS
+                cursor.execute("""
+                    UPDATE notification_dead_letters
+                    SET attempts = %s, failure_reason = %s, status = %s, updated_at = NOW(),
+                        next_retry_at = CASE WHEN %s THEN NULL ELSE NOW() + %s * INTERVAL '1 minute' END
+                    WHERE id = %s
+                """, (attempts, str(e), 'dead' if gave_up else 'retrying', gave_up,
+                      retry_delay_minutes(attempts), dead_letter_id))
+                if gave_up:
+                    dead += 1
+                else:
+                    retrying += 1
+            else:
+                cursor.execute("""
+                    UPDATE notification_dead_letters
+                    SET status = 'delivered', attempts = attempts + 1, next_retry_at = NULL, updated_at = NOW()
+                    WHERE id = %s
+                """, (dead_letter_id,))
+                cursor.execute("""
+                    UPDATE notification_queue SET status = 'sent', sent_at = NOW()
+                    WHERE dead_letter_id = %s
+                """, (dead_letter_id,))
+                delivered += 1
+        conn.commit()
+    return delivered, retrying, dead
+
+def requeue_dead_letter(conn, dead_letter_id):
+    """Give a dead digest another round of retries, e.g. after fixing the
+    address it bounced on"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE notification_dead_letters
+            SET status = 'retrying', attempts = 0, next_retry_at = NOW(), updated_at = NOW()
+            WHERE id = %s AND status = 'dead'
+        """, (dead_letter_id,))
+        requeued = cursor.rowcount
+    conn.commit()
+    return bool(requeued)
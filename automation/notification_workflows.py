@@ -1,35 +1,79 @@
 import schedule
 import time
+import json
 from datetime import datetime, timedelta
 from email_service import EmailService
+from notification_queue import DIGEST_WINDOW_MINUTES, dispatch_pending, enqueue, retry_dead_letters
 import psycopg2
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Tenants placed by TENANT_PLACEMENTS (see backend/tenancy.py) keep their
+# staff, logs and notifications in a schema or database of their own
+TENANT_PLACEMENTS = json.loads(os.getenv('TENANT_PLACEMENTS') or '{}')
+
+def _libpq_url(url):
+    # Placement urls may name a SQLAlchemy driver, which libpq does not know
+    return re.sub(r'^postgresql\+\w+://', 'postgresql://', url)
+
 class NotificationWorkflows:
     def __init__(self):
         self.email_service = EmailService()
         self.db_url = os.getenv('DATABASE_URL')
+        self.placements = sorted((int(tenant_id), placement) for tenant_id, placement in TENANT_PLACEMENTS.items())
     
-    def get_db_connection(self):
-        """Get database connection"""
-        return psycopg2.connect(self.db_url)
+    def get_db_connection(self, placement=None):
+        """Get a connection to the main database, or to a tenant's placement"""
+        if placement is None:
+            return psycopg2.connect(self.db_url)
+        if placement.get('url'):
+            return psycopg2.connect(_libpq_url(placement['url']))
+        return psycopg2.connect(self.db_url, options=f"-csearch_path={placement['schema']},public")
+    
+    def for_each_database(self, description, job):
+        """Run job(conn) on the main database and on each placement, on a
+        connection of its own; returns the results of the runs that succeeded"""
+        results = []
+        for tenant_id, placement in [(None, None), *self.placements]:
+            conn = None
+            try:
+                conn = self.get_db_connection(placement)
+                results.append(job(conn))
+            except Exception as e:
+                where = f" (tenant {tenant_id} placement)" if tenant_id is not None else ""
+                print(f"❌ Error {description}{where}: {str(e)}")
+            finally:
+                if conn:
+                    conn.close()
+        return results
+    
+    def user_emails(self, user_ids):
+        """Login email by user id; users stays in the main database
+        whatever the tenant's placement"""
+        if not user_ids:
+            return {}
+        conn = self.get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, email FROM users WHERE id = ANY(%s)", (sorted(set(user_ids)),))
+                return dict(cursor.fetchall())
+        finally:
+            conn.close()
     
     def send_daily_reminders(self):
-        """Send daily reminder emails"""
+        """Queue daily reminder emails"""
         print(f"🔄 Running daily reminders at {datetime.now()}")
         
-        try:
-            conn = self.get_db_connection()
+        def queue_reminders(conn):
             cursor = conn.cursor()
             
             # Get staff who joined 3 days ago but haven't completed profile
             cursor.execute("""
-                SELECT s.id, s.first_name, s.last_name, u.email, s.hire_date
+                SELECT s.id, s.first_name, s.last_name, s.user_id, s.hire_date
                 FROM staff s
-                JOIN users u ON s.user_id = u.id
                 WHERE s.hire_date >= %s
                 AND s.hire_date <= %s
                 AND s.status = 'active'
@@ -39,39 +83,45 @@ class NotificationWorkflows:
             ))
             
             staff_for_reminders = cursor.fetchall()
+            emails = self.user_emails([user_id for _, _, _, user_id, _ in staff_for_reminders])
+            staff_for_reminders = [
+                (staff_id, first_name, last_name, emails[user_id], hire_date)
+                for staff_id, first_name, last_name, user_id, hire_date in staff_for_reminders
+                if user_id in emails
+            ]
             
-            for staff in staff_for_reminders:
-                staff_id, first_name, last_name, email, hire_date = staff
-                
-                self.email_service.send_reminder_email(
-                    email,
-                    'document_upload',
-                    f"Please complete your profile and upload required documents. Hired on: {hire_date.strftime('%Y-%m-%d')}"
-                )
-                
-                # Log automation activity
-                cursor.execute("""
-                    INSERT INTO automation_logs (workflow_type, entity_type, entity_id, status, details)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    'daily_reminder',
-                    'staff',
-                    staff_id,
-                    'completed',
-                    f"Sent reminder email to {email}"
-                ))
+            # One reminder per staff member; the dedupe key stops reruns
+            # within the window from queueing it again
+            queued = enqueue(cursor, [
+                {
+                    'recipient': email,
+                    'category': 'document_upload',
+                    'details': f"Please complete your profile and upload required documents. Hired on: {hire_date.strftime('%Y-%m-%d')}",
+                    'entity_type': 'staff',
+                    'entity_id': staff_id,
+                    'dedupe_key': f"document_upload:staff:{staff_id}"
+                }
+                for staff_id, first_name, last_name, email, hire_date in staff_for_reminders
+            ])
             
-            conn.commit()
-            print(f"✅ Sent {len(staff_for_reminders)} reminder emails")
+            # Log automation activity
+            cursor.executemany("""
+                INSERT INTO automation_logs (workflow_type, entity_type, entity_id, status, details)
+                VALUES (%s, %s, %s, %s, %s)
+            """, [
+                ('daily_reminder', 'staff', staff_id, 'completed',
+                 json.dumps({'email': email, 'notification': 'queued'}))
+                for staff_id, first_name, last_name, email, hire_date in staff_for_reminders
+            ])
             
-        except Exception as e:
-            print(f"❌ Error in daily reminders: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+            conn.commit()
+            return queued
+        
+        queued = sum(self.for_each_database('in daily reminders', queue_reminders))
+        print(f"✅ Queued {queued} reminder emails")
     
     def check_compliance_renewals(self):
-        """Check for upcoming compliance renewals"""
+        """Queue reminders for upcoming compliance renewals"""
         print(f"🔍 Checking compliance renewals at {datetime.now()}")
         
         # In a real system, this would check document expiry dates
@@ -82,14 +132,107 @@ class NotificationWorkflows:
             {'staff_id': 2, 'email': 'coordinator@ndis.com', 'document': 'First Aid', 'expires': '2024-11-15'},
         ]
         
-        for renewal in simulated_renewals:
-            self.email_service.send_reminder_email(
-                renewal['email'],
-                'compliance',
-                f"{renewal['document']} expires on {renewal['expires']}. Please renew immediately."
-            )
-            
-            print(f"📋 Compliance reminder sent for {renewal['document']} to {renewal['email']}")
+        conn = None
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            queued = enqueue(cursor, [
+                {
+                    'recipient': renewal['email'],
+                    'category': 'compliance',
+                    'details': f"{renewal['document']} expires on {renewal['expires']}. Please renew immediately.",
+                    'entity_type': 'staff',
+                    'entity_id': renewal['staff_id'],
+                    # At most one reminder per document per week
+                    'dedupe_key': f"compliance:staff:{renewal['staff_id']}:{renewal['document']}:"
+                                  f"{datetime.now().strftime('%G-%V')}"
+                }
+                for renewal in simulated_renewals
+            ])
+            conn.commit()
+            print(f"📋 Queued {queued} compliance reminders")
+        except Exception as e:
+            print(f"❌ Error checking compliance renewals: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+    
+    def dispatch_notifications(self):
+        """Send each recipient one digest of their queued notifications"""
+        results = self.for_each_database(
+            'dispatching notifications', lambda conn: dispatch_pending(conn, self.email_service)
+        )
+        sent, failed = (sum(counts) for counts in zip((0, 0), *results))
+        if sent or failed:
+            print(f"📬 Sent {sent} notification digests, {failed} moved to the dead-letter queue")
+    
+    def retry_failed_notifications(self):
+        """Retry dead-lettered digests whose backoff has elapsed"""
+        results = self.for_each_database(
+            'retrying notifications', lambda conn: retry_dead_letters(conn, self.email_service)
+        )
+        delivered, retrying, dead = (sum(counts) for counts in zip((0, 0, 0), *results))
+        if delivered or retrying or dead:
+            print(f"🔁 Retried dead letters: {delivered} delivered, {retrying} rescheduled, {dead} given up")
+    
+    def reconcile_dashboard_counters(self):
+        """Recompute dashboard counters from the base tables"""
+        print(f"🧮 Reconciling dashboard counters at {datetime.now()}")
+        
+        def reconcile(conn):
+            cursor = conn.cursor()
+            cursor.execute("SELECT reconcile_dashboard_counters()")
+            conn.commit()
+        
+        if self.for_each_database('reconciling dashboard counters', reconcile):
+            print("✅ Dashboard counters reconciled")
+    
+    def prune_idempotency_keys(self):
+        """Delete stored Idempotency-Key responses past their TTL"""
+        def prune(conn):
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM idempotency_keys WHERE expires_at < NOW()")
+            conn.commit()
+            return cursor.rowcount
+        
+        pruned = sum(self.for_each_database('pruning idempotency keys', prune))
+        print(f"🧹 Pruned {pruned} expired idempotency keys")
+    
+    def prune_token_revocations(self):
+        """Delete revocations that can no longer match an unexpired token"""
+        # Directory tables, in the main database only
+        conn = None
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM revoked_tokens WHERE expires_at < NOW()")
+            pruned = cursor.rowcount
+            # No token lives longer than 30 days (the refresh token lifetime)
+            cursor.execute("DELETE FROM user_token_revocations WHERE revoked_before < NOW() - INTERVAL '30 days'")
+            conn.commit()
+            print(f"🧹 Pruned {pruned + cursor.rowcount} token revocations")
+        except Exception as e:
+            print(f"❌ Error pruning token revocations: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+    
+    def prune_notifications(self):
+        """Delete sent notifications and delivered dead letters after 30 days"""
+        def prune(conn):
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM notification_queue WHERE status = 'sent' AND sent_at < NOW() - INTERVAL '30 days'")
+            pruned = cursor.rowcount
+            cursor.execute("""
+                DELETE FROM notification_dead_letters d
+                WHERE status = 'delivered' AND updated_at < NOW() - INTERVAL '30 days'
+                AND NOT EXISTS (SELECT 1 FROM notification_queue q WHERE q.dead_letter_id = d.id)
+            """)
+            conn.commit()
+            return pruned + cursor.rowcount
+        
+        pruned = sum(self.for_each_database('pruning notifications', prune))
+        print(f"🧹 Pruned {pruned} old notifications")
     
     def start_scheduler(self):
         """Start the automation scheduler"""
@@ -101,6 +244,18 @@ class NotificationWorkflows:
         # Schedule compliance checks every Monday at 10 AM
         schedule.every().monday.at("10:00").do(self.check_compliance_renewals)
         
+        # Correct any drift in the incrementally maintained dashboard counters
+        schedule.every().hour.do(self.reconcile_dashboard_counters)
+        
+        # Expired idempotency keys are only kept around for replays
+        schedule.every().hour.do(self.prune_idempotency_keys)
+        schedule.every().day.at("03:00").do(self.prune_token_revocations)
+        
+        # Workflows only queue emails; each dispatch sends one digest per recipient
+        schedule.every(DIGEST_WINDOW_MINUTES).minutes.do(self.dispatch_notifications)
+        schedule.every(5).minutes.do(self.retry_failed_notifications)
+        schedule.every().day.at("03:30").do(self.prune_notifications)
+        
         # For demo purposes, run every minute
         schedule.every(1).minutes.do(self.send_daily_reminders)
         schedule.every(2).minutes.do(self.check_compliance_renewals)
@@ -108,6 +263,12 @@ class NotificationWorkflows:
         print("⏰ Scheduler configured:")
         print("  - Daily reminders: Every day at 9:00 AM")
         print("  - Compliance checks: Every Monday at 10:00 AM")
+        print("  - Dashboard counter reconciliation: Every hour")
+        print("  - Idempotency key pruning: Every hour")
+        print("  - Token revocation pruning: Every day at 3:00 AM")
+        print(f"  - Notification digests: Every {DIGEST_WINDOW_MINUTES} minutes")
+        print("  - Dead-letter retries: Every 5 minutes")
+        print("  - Notification pruning: Every day at 3:30 AM")
         print("  - Demo mode: Running every 1-2 minutes")
         
         while True:
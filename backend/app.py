@@ -3,9 +3,13 @@ from flask_cors import CORS
 import os
 import bcrypt
 import json
+from serializers import OrjsonProvider
 
 app = Flask(__name__)
 
+# Encode responses with orjson (falls back to the stdlib encoder if missing)
+app.json = OrjsonProvider(app)
+
 # Enable CORS for frontend communication
 CORS(app, origins=['http://localhost:3000'])
 
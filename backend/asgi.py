@@ -0,0 +1,28 @@
+"""Async (ASGI) variant of the read-heavy API: participant and staff
+lists, participant search and the change stream.
+
+Shares models, queries and serializers with the Flask blueprints but
+waits on asyncpg instead of holding a worker thread per request, so one
+process can keep thousands of slow or streaming clients open:
+
+    hypercorn asgi:app --bind 0.0.0.0:5001
+"""
+import os
+from quart import Quart, jsonify
+from routes.async_routes import async_bp
+from serializers import OrjsonProvider
+
+def create_app():
+    app = Quart(__name__)
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-secret-key')
+    app.json = OrjsonProvider(app)
+
+    app.register_blueprint(async_bp, url_prefix='/api')
+
+    @app.route('/api/health')
+    async def health():
+        return jsonify({'status': 'ok'})
+
+    return app
+
+app = create_app()
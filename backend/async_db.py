@@ -0,0 +1,47 @@
+import threading
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from models import DATABASE_URL, Base
+from tenancy import DIRECTORY_TABLES, TENANT_PLACEMENTS, TenantScopedSession, current_tenant_id
+
+ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername='postgresql+asyncpg')
+
+# Connections are only held while a query runs, so a small pool serves
+# many concurrent (slow) clients
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=10, max_overflow=10)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, sync_session_class=TenantScopedSession)
+# The directory tables stay in the main database whatever the placement,
+# as with TenantSession
+_directory_binds = {Base.metadata.tables[name]: async_engine for name in DIRECTORY_TABLES}
+
+_placement_engines = {}
+_placement_lock = threading.Lock()
+
+def _async_engine(tenant_id):
+    """The async engine of the tenant's placement (see tenancy)"""
+    placement = TENANT_PLACEMENTS.get(tenant_id)
+    if placement is None:
+        return async_engine
+    with _placement_lock:
+        engine = _placement_engines.get(tenant_id)
+        if engine is None:
+            url = make_url(placement['url']).set(drivername='postgresql+asyncpg') \
+                if placement.get('url') else ASYNC_DATABASE_URL
+            connect_args = {}
+            if placement.get('schema'):
+                connect_args['server_settings'] = {'search_path': f"{placement['schema']},public"}
+            engine = create_async_engine(url, pool_size=int(placement.get('pool_size', 5)),
+                                         connect_args=connect_args)
+            _placement_engines[tenant_id] = engine
+        return engine
+
+async def run_read(fn, *args, **kwargs):
+    """Run a sync query helper (fn(db, ...)) on an asyncpg connection.
+
+    run_sync drives the helper through SQLAlchemy's greenlet bridge, so
+    the list/search functions used by the sync routes are shared as-is
+    and only the I/O waits on the event loop. The session is the current
+    tenant's, with the same row scoping as the sync sessions.
+    """
+    async with AsyncSessionLocal(bind=_async_engine(current_tenant_id())) as session:
+        return await session.run_sync(fn, *args, **kwargs)
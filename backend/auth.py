@@ -1,51 +1,102 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import delete, event, or_
+from sqlalchemy.exc import IntegrityError
 from models import User, SessionLocal
+from principals import principal_cache, publish_users_deleted
+from tenancy import ALL_TENANTS
 
 def hash_password(password):
     """Hash password using bcrypt"""
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
+# bcrypt releases the GIL, so bulk hashing spreads over a few threads
+_hash_pool = ThreadPoolExecutor(max_workers=int(os.getenv('PASSWORD_HASH_WORKERS', '4')),
+                                thread_name_prefix='password-hash')
+
+def hash_passwords(passwords):
+    """Hash several passwords in parallel, in order"""
+    return list(_hash_pool.map(hash_password, passwords))
+
 def verify_password(password, hashed):
     """Verify password against hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def _token_claims(user, session_id):
+    return {
+        'email': user.email,
+        'role': user.role,
+        'tid': user.tenant_id,
+        'sid': session_id
+    }
+
+def issue_tokens(user):
+    """Create an access/refresh token pair for a new session.
+
+    Both carry the session id (sid), so logging out can revoke the
+    refresh token through the access token alone.
+    """
+    claims = _token_claims(user, uuid.uuid4().hex)
+    # PyJWT requires the subject to be a string
+    return {
+        'token': create_access_token(identity=str(user.id), additional_claims=claims),
+        'refresh_token': create_refresh_token(identity=str(user.id), additional_claims=claims)
+    }
+
 def authenticate_user(email, password):
-    """Authenticate user and return token"""
+    """Authenticate user and return tokens"""
+    # Repeated attempts against an address with no account skip the query
+    if principal_cache.is_unknown_email(email):
+        return None
+    generation = principal_cache.generation()
     db = SessionLocal()
     try:
-        user = db.query(User).filter(User.email == email).first()
-        if user and verify_password(password, user.password_hash):
-            # Create JWT token
-            token = create_access_token(
-                identity=user.id,
-                additional_claims={
-                    'email': user.email,
-                    'role': user.role
-                }
-            )
+        # Emails are unique across tenants; the user's row names the tenant
+        user = db.query(User).filter(User.email == email).execution_options(**{ALL_TENANTS: True}).first()
+        if user is None:
+            principal_cache.remember_unknown_email(email, generation)
+            return None
+        if user.is_active and verify_password(password, user.password_hash):
             return {
-                'token': token,
+                **issue_tokens(user),
                 'user': {
                     'id': user.id,
                     'email': user.email,
-                    'role': user.role
+                    'role': user.role,
+                    'tenant_id': user.tenant_id
                 }
             }
         return None
     finally:
         db.close()
 
-def create_user(email, password, role='staff'):
-    """Create new user"""
+def refresh_access_token(claims):
+    """Issue a new access token for a (verified, unrevoked) refresh token.
+
+    The user is re-read so deactivation and role changes apply.
+    """
     db = SessionLocal()
     try:
-        # Check if user exists
-        existing_user = db.query(User).filter(User.email == email).first()
-        if existing_user:
+        user = db.query(User).filter(
+            User.id == int(claims['sub'])
+        ).execution_options(**{ALL_TENANTS: True}).first()
+        if not user or not user.is_active:
             return None
-        
-        # Create new user
+        return {'token': create_access_token(
+            identity=str(user.id), additional_claims=_token_claims(user, claims.get('sid'))
+        )}
+    finally:
+        db.close()
+
+def create_user(email, password, role='staff'):
+    """Create new user in the current tenant"""
+    db = SessionLocal()
+    try:
+        # The unique index on email decides whether the address is taken,
+        # which also holds when two registrations race
         hashed_password = hash_password(password)
         new_user = User(
             email=email,
@@ -53,8 +104,67 @@ def create_user(email, password, role='staff'):
             role=role
         )
         db.add(new_user)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return None
         db.refresh(new_user)
         return new_user
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Users live in the main database and a placed tenant's staff in another
+# (see tenancy), so an account and its staff record cannot commit
+# together. Accounts made for staff are committed first, on a session of
+# their own, and deleted again if the transaction writing the staff
+# records rolls back, including when its commit fails. A staff record
+# never points at a missing user, and a failed write leaves no logins
+# behind. (Two-phase commit would need max_prepared_transactions set on
+# every database.)
+
+def create_users(db, accounts, role='staff'):
+    """Commit users for staff records written through db; accounts are
+    (email, password hash) pairs. Returns their ids in order, or None if
+    an email is taken. The users are deleted if db rolls back."""
+    users_db = SessionLocal()
+    try:
+        users = [User(email=email, password_hash=password_hash, role=role)
+                 for email, password_hash in accounts]
+        users_db.add_all(users)
+        try:
+            users_db.flush()
+            user_ids = [user.id for user in users]
+            users_db.commit()
+        except IntegrityError:
+            users_db.rollback()
+            return None
+    finally:
+        users_db.close()
+    discard_users_on_rollback(db, User.id.in_(user_ids))
+    return user_ids
+
+def discard_users_on_rollback(db, condition):
+    """Delete the users matching condition, already committed, if db's
+    transaction rolls back rather than commits"""
+    db.info.setdefault('discard_users', []).append(condition)
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _keep_users(session):
+    session.info.pop('discard_users', None)
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _discard_users(session):
+    conditions = session.info.pop('discard_users', None)
+    if not conditions:
+        return
+    users_db = SessionLocal()
+    try:
+        deleted = users_db.scalars(
+            delete(User).where(or_(*conditions)).returning(User.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        publish_users_deleted(users_db, deleted)
+        users_db.commit()
+    finally:
+        users_db.close()
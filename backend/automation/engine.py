@@ -0,0 +1,273 @@
+"""Declarative multi-step workflows persisted in automation_logs.
+
+A workflow is a graph of steps: each step names an action and the steps
+it runs after. Each run is one automation_logs row whose details hold
+every step's status and output, so a worker that dies mid-run loses at
+most the steps it was executing; they run again on the next tick.
+
+A tick claims a batch of due runs with one query (FOR UPDATE SKIP LOCKED,
+so several workers can tick side by side), executes every ready step of
+the whole batch on a thread pool, and writes the runs back with one
+executemany UPDATE. A tick covers every tenant in one database; the
+worker ticks the main database and each tenant placed elsewhere.
+
+    cd backend && python -m automation.engine
+"""
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from sqlalchemy.orm.attributes import flag_modified
+from models import AutomationLog, SessionLocal
+from log_queries import record_workflow_events
+from tenancy import ALL_TENANTS, placement_databases, tenant_context
+
+TICK_BATCH = int(os.getenv('WORKFLOW_TICK_BATCH', '500'))
+TICK_SECONDS = float(os.getenv('WORKFLOW_TICK_SECONDS', '5'))
+STEP_WORKERS = int(os.getenv('WORKFLOW_STEP_WORKERS', '16'))
+MAX_STEP_ATTEMPTS = 3
+RETRY_SECONDS = 60
+
+# Run statuses; runs in ACTIVE are picked up by ticks once next_run_at passes
+RUNNING, WAITING, COMPLETED, FAILED = 'running', 'waiting', 'completed', 'failed'
+ACTIVE = (RUNNING, WAITING)
+# Step statuses that still have work to do
+OPEN_STEP = ('pending', 'waiting', 'retrying')
+
+class Step:
+    def __init__(self, name, action, after=(), **params):
+        self.name = name
+        self.action = action
+        self.after = tuple(after)
+        self.params = params
+
+class Workflow:
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = {step.name: step for step in steps}
+        for step in steps:
+            unknown = [dep for dep in step.after if dep not in self.steps]
+            if unknown:
+                raise ValueError(f"{name}.{step.name} runs after unknown steps {unknown}")
+        # A step behind a branch only runs on the side the branch takes
+        self.branch_of = {}
+        for step in steps:
+            if step.action == 'branch':
+                for target in (*step.params.get('if_true', ()), *step.params.get('if_false', ())):
+                    self.branch_of[target] = step.name
+
+WORKFLOWS = {}
+ACTIONS = {}
+CONDITIONS = {}
+
+def register_workflow(workflow):
+    WORKFLOWS[workflow.name] = workflow
+    return workflow
+
+def action(name):
+    """Register fn(context, params, outputs) -> JSON-serialisable output"""
+    def decorator(fn):
+        ACTIONS[name] = fn
+        return fn
+    return decorator
+
+def condition(name):
+    """Register fn(context, outputs) -> bool for branch steps"""
+    def decorator(fn):
+        CONDITIONS[name] = fn
+        return fn
+    return decorator
+
+def start_workflow(db, workflow_name, entity_type, entity_id, context):
+    """Queue a run in the caller's transaction; the next tick starts it"""
+    workflow = WORKFLOWS[workflow_name]
+    run = AutomationLog(
+        workflow_type=workflow.name,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        status=RUNNING,
+        details={'context': context, 'steps': {name: {'status': 'pending'} for name in workflow.steps}},
+        next_run_at=datetime.utcnow()
+    )
+    db.add(run)
+    record_workflow_events(db, [(workflow.name, 'started')])
+    return run
+
+def complete_checklist_item(db, run_id, step_name, item):
+    """Tick off a checklist item created by a create_checklist step; the
+    caller commits. Returns False if the run or item does not exist."""
+    run = db.execute(
+        select(AutomationLog).where(AutomationLog.id == run_id).with_for_update()
+    ).scalar_one_or_none()
+    if run is None:
+        return False
+    state = run.details['steps'].get(step_name) or {}
+    items = (state.get('output') or {}).get('items', [])
+    for entry in items:
+        if entry['item'] == item:
+            entry['done'] = True
+            # details is mutated in place, which the ORM cannot see
+            flag_modified(run, 'details')
+            return True
+    return False
+
+def _isoformat(value):
+    return value.isoformat(timespec='seconds')
+
+def _ready_steps(workflow, states, now):
+    """Steps whose dependencies are done and whose time has come.
+
+    Steps on the side of a branch that was not taken, and everything
+    after a skipped step, are marked skipped first.
+    """
+    changed = True
+    while changed:
+        changed = False
+        for name, step in workflow.steps.items():
+            if states[name]['status'] not in OPEN_STEP:
+                continue
+            branch = workflow.branch_of.get(name)
+            not_taken = branch is not None and states[branch]['status'] == 'completed' \
+                and name not in states[branch]['output']['next']
+            if not_taken or any(states[dep]['status'] == 'skipped' for dep in step.after):
+                states[name] = {'status': 'skipped'}
+                changed = True
+
+    due = _isoformat(now)
+    return [
+        name for name, step in workflow.steps.items()
+        if states[name]['status'] in OPEN_STEP
+        and all(states[dep]['status'] == 'completed' for dep in step.after)
+        and states[name].get('not_before', '') <= due
+    ]
+
+def _execute(workflow, step_name, context, outputs):
+    """Run one step; returns the step's new state"""
+    step = workflow.steps[step_name]
+    if step.action == 'wait':
+        return {'status': 'completed', 'output': {'waited_days': step.params['days']}}
+    if step.action == 'branch':
+        taken = bool(CONDITIONS[step.params['condition']](context, outputs))
+        return {'status': 'completed', 'output': {
+            'taken': taken,
+            'next': list(step.params.get('if_true' if taken else 'if_false', ()))
+        }}
+    return {'status': 'completed', 'output': ACTIONS[step.action](context, step.params, outputs)}
+
+def _plan_waits(workflow, states, ready, now):
+    """A wait step starts its clock the first time it becomes ready and
+    completes once that time has passed; returns the steps to execute"""
+    runnable = []
+    for name in ready:
+        step = workflow.steps[name]
+        state = states[name]
+        if step.action == 'wait' and state['status'] != 'waiting':
+            wake_at = now + timedelta(days=step.params['days'])
+            states[name] = {'status': 'waiting', 'not_before': _isoformat(wake_at)}
+        else:
+            runnable.append(name)
+    return runnable
+
+def _run_status(workflow, states, now):
+    """(status, next_run_at, completed_at) for a run after a tick"""
+    statuses = {state['status'] for state in states.values()}
+    if 'failed' in statuses:
+        return FAILED, None, now
+    if statuses <= {'completed', 'skipped'}:
+        return COMPLETED, None, now
+    if _ready_steps(workflow, states, now):
+        # Steps unblocked by this tick run on the next one
+        return RUNNING, now, None
+    # Everything left is behind a waiting or retrying step
+    wake = min(state['not_before'] for state in states.values() if state['status'] in ('waiting', 'retrying'))
+    return WAITING, datetime.fromisoformat(wake), None
+
+def tick(db, executor, limit=TICK_BATCH, now=None):
+    """Advance up to limit due runs; returns how many were advanced"""
+    now = now or datetime.utcnow()
+    runs = db.execute(
+        select(AutomationLog.id, AutomationLog.workflow_type, AutomationLog.details, AutomationLog.tenant_id)
+        .where(AutomationLog.status.in_(ACTIVE), AutomationLog.next_run_at <= now)
+        .order_by(AutomationLog.next_run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .execution_options(**{ALL_TENANTS: True})
+    ).all()
+    if not runs:
+        return 0
+
+    # Every ready step of the whole batch goes to the pool at once, so
+    # independent steps (and independent runs) execute concurrently
+    futures = {}
+    for run_id, workflow_type, details, _ in runs:
+        workflow = WORKFLOWS[workflow_type]
+        states = details['steps']
+        outputs = {name: state.get('output') for name, state in states.items() if state['status'] == 'completed'}
+        for name in _plan_waits(workflow, states, _ready_steps(workflow, states, now), now):
+            futures[run_id, name] = executor.submit(_execute, workflow, name, details['context'], outputs)
+
+    updates, finished = [], defaultdict(list)
+    for run_id, workflow_type, details, tenant_id in runs:
+        workflow = WORKFLOWS[workflow_type]
+        states = details['steps']
+        for name in workflow.steps:
+            future = futures.get((run_id, name))
+            if future is None:
+                continue
+            try:
+                states[name] = future.result()
+            except Exception as e:
+                attempts = states[name].get('attempts', 0) + 1
+                states[name] = {
+                    'status': 'failed' if attempts >= MAX_STEP_ATTEMPTS else 'retrying',
+                    'attempts': attempts,
+                    'error': str(e),
+                    'not_before': _isoformat(now + timedelta(seconds=RETRY_SECONDS * attempts))
+                }
+            states[name]['finished_at'] = _isoformat(now)
+
+        status, next_run_at, completed_at = _run_status(workflow, states, now)
+        if status in (COMPLETED, FAILED):
+            finished[tenant_id].append((workflow_type, status))
+        updates.append({'id': run_id, 'details': details, 'status': status,
+                        'next_run_at': next_run_at, 'completed_at': completed_at})
+
+    # One executemany UPDATE by primary key for the whole batch
+    db.execute(update(AutomationLog), updates, execution_options={ALL_TENANTS: True})
+    for tenant_id, events in finished.items():
+        with tenant_context(tenant_id):
+            record_workflow_events(db, events, now)
+    db.commit()
+    return len(runs)
+
+def _tick_database(executor, tenant_id):
+    """Tick the database tenant_id is placed in"""
+    with tenant_context(tenant_id):
+        db = SessionLocal()
+        try:
+            return tick(db, executor)
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Workflow tick failed (tenant {tenant_id}): {str(e)}")
+            return 0
+        finally:
+            db.close()
+
+def run_worker(tick_seconds=TICK_SECONDS):
+    """Tick forever; ticks back to back while there is a backlog"""
+    print("🤖 Workflow worker started")
+    databases = placement_databases()
+    with ThreadPoolExecutor(max_workers=STEP_WORKERS, thread_name_prefix='workflow-step') as executor:
+        while True:
+            advanced = max(_tick_database(executor, tenant_id) for tenant_id in databases)
+            if advanced < TICK_BATCH:
+                time.sleep(tick_seconds)
+
+if __name__ == '__main__':
+    # Go through the package module: the workflows register themselves
+    # there, not in this __main__ copy
+    import automation.workflows  # noqa: F401
+    from automation.engine import run_worker as worker
+    worker()
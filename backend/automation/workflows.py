@@ -1,4 +1,7 @@
-import os
+from sqlalchemy import select
+from models import AutomationLog
+from automation.engine import (Step, Workflow, action, complete_checklist_item, condition, register_workflow,
+                               start_workflow)
 
 def send_email(to_email, subject, body):
     """Send email notification"""
@@ -8,64 +11,90 @@ def send_email(to_email, subject, body):
     print(f"BODY: {body}")
     print("---")
 
-def trigger_staff_onboarding(staff_id, email):
-    """Automation workflow for new staff onboarding"""
-    print(f"🤖 AUTOMATION TRIGGERED: Staff Onboarding for ID: {staff_id}")
-    
-    # Step 1: Send welcome email
-    send_email(
-        to_email=email,
-        subject="Welcome to NDIS Platform!",
-        body=f"""
+@action('send_email')
+def send_email_step(context, params, outputs):
+    if not context.get('email'):
+        return {'sent': False, 'reason': 'no email address'}
+    send_email(context['email'], params['subject'], params['body'].format(**context))
+    return {'sent': True, 'to': context['email']}
+
+@action('create_checklist')
+def create_checklist_step(context, params, outputs):
+    return {'items': [{'item': item, 'done': False} for item in params['items']]}
+
+@condition('checklist_complete')
+def checklist_complete(context, outputs):
+    return all(entry['done'] for entry in outputs['checklist']['items'])
+
+# Automation workflow for new staff onboarding (Aryan's work)
+STAFF_ONBOARDING = register_workflow(Workflow('staff_onboarding', [
+    Step('welcome_email', 'send_email', subject="Welcome to NDIS Platform!", body="""
         Welcome to our NDIS platform!
-        
+
         Your account has been created. Here's what happens next:
         1. Complete your profile
         2. Upload required documents
         3. Attend orientation session
-        
+
         Staff ID: {staff_id}
-        """
-    )
-    
-    # Step 2: Create onboarding checklist
-    checklist_items = [
+        """),
+    Step('checklist', 'create_checklist', items=[
         "Profile completion",
         "Document upload (ID, qualifications)",
         "WWCC verification",
         "NDIS worker screening",
         "Orientation attendance",
         "System training"
-    ]
-    
-    print(f"📋 ONBOARDING CHECKLIST CREATED:")
-    for i, item in enumerate(checklist_items, 1):
-        print(f"   {i}. {item}")
-    
-    # Step 3: Schedule follow-up notifications
-    print(f"⏰ SCHEDULED REMINDERS:")
-    print(f"   - Day 3: Profile completion reminder")
-    print(f"   - Day 7: Document upload reminder")
-    print(f"   - Day 14: Orientation scheduling")
-    
-    return True
+    ]),
+    Step('wait_3_days', 'wait', after=['welcome_email'], days=3),
+    Step('profile_check', 'branch', after=['wait_3_days', 'checklist'],
+         condition='checklist_complete', if_false=['profile_reminder']),
+    Step('profile_reminder', 'send_email', after=['profile_check'],
+         subject="Profile Completion Reminder",
+         body="Please complete your profile and upload your documents. Staff ID: {staff_id}"),
+    Step('wait_14_days', 'wait', after=['welcome_email'], days=14),
+    Step('orientation_reminder', 'send_email', after=['wait_14_days'],
+         subject="Orientation Session Reminder",
+         body="Please book your orientation session. Staff ID: {staff_id}"),
+]))
 
-def trigger_participant_enrollment(participant_id, email):
-    """Automation workflow for participant enrollment"""
-    print(f"🤖 AUTOMATION TRIGGERED: Participant Enrollment for ID: {participant_id}")
-    
-    send_email(
-        to_email=email,
-        subject="Welcome to NDIS Services",
-        body=f"""
+# Automation workflow for participant enrollment
+PARTICIPANT_ENROLLMENT = register_workflow(Workflow('participant_enrollment', [
+    Step('welcome_email', 'send_email', subject="Welcome to NDIS Services", body="""
         Welcome! We're excited to support your NDIS journey.
-        
+
         Participant ID: {participant_id}
         Next steps:
         1. Schedule initial assessment
         2. Review service options
         3. Create support plan
-        """
-    )
-    
-    return True
\ No newline at end of file
+        """),
+    Step('wait_7_days', 'wait', after=['welcome_email'], days=7),
+    Step('assessment_reminder', 'send_email', after=['wait_7_days'],
+         subject="Initial Assessment Reminder",
+         body="Please book your initial assessment. Participant ID: {participant_id}"),
+]))
+
+def trigger_staff_onboarding(db, staff_id, email):
+    """Start onboarding for a new staff member in the caller's transaction"""
+    return start_workflow(db, STAFF_ONBOARDING.name, 'staff', staff_id,
+                          {'staff_id': staff_id, 'email': email})
+
+def complete_onboarding_item(db, staff_id, item):
+    """Tick off an item of a staff member's latest onboarding checklist;
+    the caller commits. Returns False if there is no such run or item."""
+    run_id = db.scalars(
+        select(AutomationLog.id).where(
+            AutomationLog.workflow_type == STAFF_ONBOARDING.name,
+            AutomationLog.entity_type == 'staff',
+            AutomationLog.entity_id == staff_id
+        ).order_by(AutomationLog.created_at.desc(), AutomationLog.id.desc()).limit(1)
+    ).first()
+    if run_id is None:
+        return False
+    return complete_checklist_item(db, run_id, 'checklist', item)
+
+def trigger_participant_enrollment(db, participant_id, email):
+    """Start enrollment for a new participant in the caller's transaction"""
+    return start_workflow(db, PARTICIPANT_ENROLLMENT.name, 'participant', participant_id,
+                          {'participant_id': participant_id, 'email': email})
@@ -0,0 +1,53 @@
+import csv
+import io
+from itertools import islice
+
+DEFAULT_CHUNK_ROWS = 50000
+READ_SIZE = 1 << 16
+
+class RowStream:
+    """File-like object that renders rows as CSV on demand.
+
+    psycopg2's copy_expert pulls from read(), so rows are generated and
+    encoded as Postgres consumes them and memory stays bounded by the
+    read size rather than the number of rows.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = ''
+        self.count = 0
+
+    def read(self, size=READ_SIZE):
+        if size is None or size < 0:
+            size = READ_SIZE
+        while len(self._pending) < size:
+            batch = list(islice(self._rows, 1000))
+            if not batch:
+                break
+            self._writer.writerows(batch)
+            self.count += len(batch)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+def copy_bytes(value):
+    """Render bytes for a BYTEA column in a COPY row"""
+    return None if value is None else '\\x' + value.hex()
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY an iterable of row tuples into table; returns the row count.
+
+    None is written as an unquoted empty field, which COPY's CSV format
+    reads as NULL.
+    """
+    stream = RowStream(rows)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        stream
+    )
+    return stream.count
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import text
+from models import ChangeEvent, SessionLocal
+from pg_listener import get_listener
+from tenancy import ALL_TENANTS, current_tenant_id
+
+CHANGES_CHANNEL = 'ndis_changes'
+BUFFER_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 500
+RESUME_LIMIT = 5000
+# NOTIFY payloads must stay under 8000 bytes
+MAX_NOTIFY_PAYLOAD = 7500
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def publish_change(db, entity_type, entity_id, action, data=None):
+    """Record a change and queue a NOTIFY for it in the caller's transaction.
+
+    Postgres only delivers the notification once the transaction commits,
+    so subscribers never see changes that were rolled back.
+
+    Clients resume from the id of the last event they saw, which only
+    works if events commit in id order: a transaction holding id N that
+    committed after N+1 would never be replayed. So the id is taken
+    under a lock held until the transaction ends, which serialises the
+    remainder of change-publishing transactions in each database; callers
+    publish last, just before they commit.
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {'key': CHANGES_CHANNEL})
+    event = ChangeEvent(
+        entity_type=entity_type,
+        entity_id=entity_id,
+        action=action,
+        payload=json.loads(json.dumps(data or {}, default=_json_default)),
+        created_at=datetime.utcnow()
+    )
+    db.add(event)
+    db.flush()
+
+    payload = json.dumps(_event_dict(event))
+    if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+        # Too big to notify inline; listeners load it from the table
+        payload = json.dumps({'id': event.id, 'truncated': True})
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {'channel': CHANGES_CHANNEL, 'payload': payload}
+    )
+    return event
+
+def format_sse_event(event):
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['entity_type']}.{event['action']}\n"
+        f"data: {json.dumps(event)}\n\n"
+    )
+
+def _event_dict(event):
+    return {
+        'id': event.id,
+        'tenant_id': event.tenant_id,
+        'entity_type': event.entity_type,
+        'entity_id': event.entity_id,
+        'action': event.action,
+        'data': event.payload,
+        'created_at': event.created_at.isoformat() if event.created_at else None
+    }
+
+class Subscription:
+    def __init__(self, hub):
+        self.hub = hub
+        # Set by ChangeHub.subscribe; only this tenant's events are delivered
+        self.tenant_id = None
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Set when we fell too far behind; the client reconnects and
+        # resumes from its Last-Event-ID instead of us buffering forever
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Called from the listener thread; False if the queue is full"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class AsyncSubscription(Subscription):
+    """Subscription for asyncio handlers: events are handed to the event
+    loop instead of blocking a thread per client"""
+
+    def __init__(self, hub, loop):
+        self.hub = hub
+        self.tenant_id = None
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+            return True
+        except RuntimeError:
+            # Event loop already closed
+            return False
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.close()
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class ChangeHub:
+    """Fans change events from the process listener out to SSE clients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=BUFFER_SIZE)
+        self._started = False
+
+    def _ensure_listening(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        listener = get_listener()
+        listener.on_reconnect.append(self._catch_up)
+        listener.listen(CHANGES_CHANNEL, self._on_notify)
+
+    def _on_notify(self, payload):
+        event = json.loads(payload)
+        if event.get('truncated'):
+            for event in load_events_after(event['id'] - 1, limit=1, tenant_id=ALL_TENANTS):
+                self.publish(event)
+            return
+        self.publish(event)
+
+    def _catch_up(self):
+        """Replay events committed while the listener was disconnected"""
+        with self._lock:
+            last_id = self._recent[-1]['id'] if self._recent else None
+        if last_id is None:
+            return
+        for event in load_events_after(last_id, tenant_id=ALL_TENANTS):
+            self.publish(event)
+
+    def publish(self, event):
+        with self._lock:
+            if self._recent and event['id'] <= self._recent[-1]['id']:
+                if any(e['id'] == event['id'] for e in self._recent):
+                    return
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.tenant_id != event.get('tenant_id'):
+                continue
+            if not subscription.deliver(event):
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    def subscribe(self, last_event_id=None, subscription=None):
+        """Register a client of the current tenant; returns (subscription,
+        events to replay first).
+
+        Pass a subscription to use a different delivery mechanism than
+        the blocking queue (see AsyncSubscription).
+        """
+        self._ensure_listening()
+        subscription = subscription or Subscription(self)
+        subscription.tenant_id = tenant_id = current_tenant_id()
+        with self._lock:
+            self._subscribers.add(subscription)
+            recent = [e for e in self._recent if e.get('tenant_id') == tenant_id]
+
+        if last_event_id is None:
+            return subscription, []
+        if recent and recent[0]['id'] <= last_event_id + 1:
+            return subscription, [e for e in recent if e['id'] > last_event_id]
+
+        # Client is further behind than our buffer - fall back to the table
+        backlog = load_events_after(last_event_id, tenant_id=tenant_id)
+        seen = {e['id'] for e in backlog}
+        return subscription, backlog + [e for e in recent if e['id'] not in seen and e['id'] > last_event_id]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+def load_events_after(last_event_id, limit=RESUME_LIMIT, tenant_id=None):
+    """Load persisted change events newer than last_event_id, of one
+    tenant (the current one by default) or of every tenant (ALL_TENANTS)"""
+    db = SessionLocal()
+    try:
+        query = db.query(ChangeEvent).filter(ChangeEvent.id > last_event_id)
+        if tenant_id == ALL_TENANTS:
+            query = query.execution_options(**{ALL_TENANTS: True})
+        elif tenant_id is not None:
+            query = query.filter(ChangeEvent.tenant_id == tenant_id).execution_options(**{ALL_TENANTS: True})
+        events = query.order_by(ChangeEvent.id).limit(limit).all()
+        return [_event_dict(event) for event in events]
+    finally:
+        db.close()
+
+def prune_change_events(db, before):
+    """Delete change events of every tenant older than the given datetime"""
+    deleted = db.query(ChangeEvent).filter(ChangeEvent.created_at < before).execution_options(
+        **{ALL_TENANTS: True}
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+hub = ChangeHub()
@@ -0,0 +1,302 @@
+"""Plan budget utilisation and bulk payment requests.
+
+A billing run loads every pending line item in the period once, as
+integer columns (cents, hundredths of a unit, day numbers), and prices,
+allocates and formats them with NumPy over the whole period instead of
+looping over rows in Python. Results go back to Postgres with COPY and
+one UPDATE ... FROM per table.
+
+A run locks the lines it loads and skips lines locked by another run,
+so concurrent runs over overlapping periods claim each line once.
+"""
+import csv
+import os
+from decimal import Decimal
+from itertools import repeat
+import numpy as np
+from sqlalchemy import text
+from models import ClaimBatch
+from tenancy import current_tenant_id
+from bulk_copy import copy_rows
+
+CLAIM_FILES_DIR = os.getenv('CLAIM_FILES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'claim_files'))
+REGISTRATION_NUMBER = os.getenv('NDIS_REGISTRATION_NUMBER', '')
+PROVIDER_ABN = os.getenv('PROVIDER_ABN', '')
+# Supports are GST free (P2) unless the provider says otherwise
+GST_CODE = os.getenv('NDIS_GST_CODE', 'P2')
+
+# Column order of the NDIA bulk payment request template
+PAYMENT_REQUEST_COLUMNS = (
+    'RegistrationNumber', 'NDISNumber', 'SupportsDeliveredFrom', 'SupportsDeliveredTo',
+    'SupportNumber', 'ClaimReference', 'Quantity', 'Hours', 'UnitPrice', 'GSTCode',
+    'AuthorisedBy', 'ParticipantApproved', 'InKindFundingProgram', 'ClaimType',
+    'CancellationReason', 'ABN of Support Provider'
+)
+
+NO_BUDGET = 'no_plan_budget'
+BUDGET_EXHAUSTED = 'budget_exhausted'
+
+# Where plans overlap, a line is funded from the most recent one
+PENDING_LINES_SQL = text("""
+    SELECT l.id, l.participant_id, COALESCE(b.id, 0),
+           (l.quantity * 100)::bigint, (l.unit_price * 100)::bigint, (s.price_limit * 100)::bigint,
+           l.service_date - DATE '1970-01-01', l.support_item_code
+    FROM support_line_items l
+    JOIN support_items s ON s.code = l.support_item_code
+    LEFT JOIN LATERAL (
+        SELECT b.id FROM plan_budgets b
+        WHERE b.tenant_id = l.tenant_id
+            AND b.participant_id = l.participant_id
+            AND b.category = s.category
+            AND l.service_date BETWEEN b.starts_on AND b.ends_on
+        ORDER BY b.starts_on DESC, b.id DESC
+        LIMIT 1
+    ) b ON TRUE
+    WHERE l.tenant_id = :tenant_id AND l.claim_status = 'pending' AND l.service_date BETWEEN :start AND :end
+    FOR UPDATE OF l SKIP LOCKED
+""")
+
+def price_lines(quantity, unit_price, price_limit):
+    """Line amounts in cents from quantities in hundredths of a unit.
+
+    Unit prices above the support item's price limit are claimed at the
+    limit, which is all the NDIA will pay.
+    """
+    price = np.minimum(unit_price, price_limit)
+    return price, (quantity * price + 50) // 100
+
+def allocate(line_ids, budget_ids, days, amounts, budget_table, remaining):
+    """Approve lines against their plan budget in service-date order.
+
+    budget_ids of 0 mean no budget covers the line. budget_table is a
+    sorted array of budget ids and remaining holds what is left of each
+    in cents. Within a budget, lines are funded in order until the first
+    one that no longer fits; later lines are rejected with it rather than
+    jumping ahead of an older unpaid claim.
+
+    Returns a boolean approved mask in the input order.
+    """
+    order = np.lexsort((line_ids, days, budget_ids))
+    budgets = budget_ids[order]
+    sorted_amounts = amounts[order]
+
+    # Running total within each budget: one cumsum over everything, minus
+    # the total reached before each budget's first line
+    running = np.cumsum(sorted_amounts)
+    starts = np.flatnonzero(np.r_[True, budgets[1:] != budgets[:-1]])
+    counts = np.diff(np.r_[starts, len(budgets)])
+    spent = running - np.repeat(running[starts] - sorted_amounts[starts], counts)
+
+    group_budgets = budgets[starts]
+    available = np.full(len(group_budgets), -1, dtype=np.int64)
+    if len(budget_table):
+        position = np.minimum(np.searchsorted(budget_table, group_budgets), len(budget_table) - 1)
+        found = budget_table[position] == group_budgets
+        available[found] = remaining[position[found]]
+
+    approved = np.empty(len(order), dtype=bool)
+    approved[order] = spent <= np.repeat(available, counts)
+    return approved
+
+def _load_pending(db, period_start, period_end):
+    rows = db.execute(PENDING_LINES_SQL, {
+        'tenant_id': current_tenant_id(), 'start': period_start, 'end': period_end
+    }).fetchall()
+    if not rows:
+        return None
+    line_ids, participants, budgets, quantity, unit_price, price_limit, days, codes = zip(*rows)
+    return {
+        'line_ids': np.array(line_ids, dtype=np.int64),
+        'participants': np.array(participants, dtype=np.int64),
+        'budgets': np.array(budgets, dtype=np.int64),
+        'quantity': np.array(quantity, dtype=np.int64),
+        'unit_price': np.array(unit_price, dtype=np.int64),
+        'price_limit': np.array(price_limit, dtype=np.int64),
+        'days': np.array(days, dtype=np.int64),
+        'codes': np.array(codes, dtype=object)
+    }
+
+def _lock_budgets(db, budget_ids):
+    """Remaining cents per budget, locking the rows so two runs cannot
+    spend the same money"""
+    rows = db.execute(text("""
+        SELECT id, (amount * 100)::bigint - (claimed_amount * 100)::bigint
+        FROM plan_budgets WHERE id = ANY(:ids) ORDER BY id FOR UPDATE
+    """), {'ids': budget_ids.tolist()}).fetchall()
+    table = np.array([row[0] for row in rows], dtype=np.int64)
+    remaining = np.array([row[1] for row in rows], dtype=np.int64)
+    return table, remaining
+
+def _ndis_numbers(db, participant_ids):
+    """NDIS numbers aligned with participant_ids"""
+    unique, inverse = np.unique(participant_ids, return_inverse=True)
+    numbers = dict(db.execute(
+        text("SELECT id, ndis_number FROM participants WHERE id = ANY(:ids)"),
+        {'ids': unique.tolist()}
+    ).fetchall())
+    lookup = np.array([numbers.get(pid) or '' for pid in unique.tolist()], dtype=object)
+    return lookup[inverse]
+
+def _save_results(db, batch_id, lines, approved, amounts):
+    """Write the results back; returns a mask of the lines that were still
+    pending and so were actually claimed or rejected by this run"""
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS claim_results "
+            "(line_id BIGINT PRIMARY KEY, claimed BOOLEAN, budget_id INTEGER, "
+            "amount_cents BIGINT, reason TEXT) ON COMMIT DELETE ROWS"
+        )
+        cursor.execute("TRUNCATE claim_results")
+        reasons = np.where(approved, '', np.where(lines['budgets'] == 0, NO_BUDGET, BUDGET_EXHAUSTED))
+        copy_rows(cursor, 'claim_results', ('line_id', 'claimed', 'budget_id', 'amount_cents', 'reason'), zip(
+            lines['line_ids'].tolist(), approved.tolist(), lines['budgets'].tolist(),
+            amounts.tolist(), reasons.tolist()
+        ))
+        cursor.execute("""
+            UPDATE support_line_items l
+            SET claim_status = CASE WHEN r.claimed THEN 'claimed' ELSE 'rejected' END,
+                claim_batch_id = %s,
+                plan_budget_id = NULLIF(r.budget_id, 0),
+                claimed_amount = CASE WHEN r.claimed THEN r.amount_cents::numeric / 100 END,
+                rejection_reason = NULLIF(r.reason, '')
+            FROM claim_results r
+            WHERE l.id = r.line_id AND l.claim_status = 'pending'
+            RETURNING l.id
+        """, (batch_id,))
+        saved = np.isin(lines['line_ids'], np.array([row[0] for row in cursor.fetchall()], dtype=np.int64))
+        if not saved.all():
+            # Settled elsewhere since they were loaded: nothing to spend on them
+            cursor.execute("DELETE FROM claim_results WHERE NOT (line_id = ANY(%s))",
+                           (lines['line_ids'][saved].tolist(),))
+        cursor.execute("""
+            UPDATE plan_budgets b
+            SET claimed_amount = b.claimed_amount + t.cents::numeric / 100
+            FROM (
+                SELECT budget_id, SUM(amount_cents) AS cents
+                FROM claim_results WHERE claimed GROUP BY budget_id
+            ) t
+            WHERE b.id = t.budget_id
+        """)
+        return saved
+    finally:
+        cursor.close()
+
+def _format_cents(cents):
+    """'12.30' strings from integer cents, without going through floats"""
+    whole, fraction = np.divmod(cents, 100)
+    return np.char.add(np.char.add(whole.astype(str), '.'), np.char.zfill(fraction.astype(str), 2)).tolist()
+
+def write_payment_request(path, batch_id, ndis_numbers, days, codes, line_ids, quantity, unit_price):
+    """Write approved lines as an NDIA bulk payment request CSV"""
+    count = len(line_ids)
+    # csv writes plain Python strings noticeably faster than numpy scalars
+    delivered = np.datetime_as_string(days.astype('datetime64[D]')).tolist()
+    references = np.char.add(f"{batch_id}-", line_ids.astype(str)).tolist()
+    blank = [''] * count
+    columns = (
+        repeat(REGISTRATION_NUMBER, count), ndis_numbers.tolist(), delivered, delivered,
+        codes.tolist(), references, _format_cents(quantity), blank, _format_cents(unit_price),
+        repeat(GST_CODE, count), blank, blank, blank, blank, blank, repeat(PROVIDER_ABN, count)
+    )
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PAYMENT_REQUEST_COLUMNS)
+        writer.writerows(zip(*columns))
+
+def run_billing(db, period_start, period_end, created_by=None):
+    """Claim every pending line item serviced in the period.
+
+    Records a claim batch, marks each line claimed or rejected, adds the
+    claimed amounts to the plan budgets and writes the bulk payment
+    request file. The caller commits.
+    """
+    batch = ClaimBatch(period_start=period_start, period_end=period_end, created_by=created_by)
+    db.add(batch)
+    db.flush()
+
+    lines = _load_pending(db, period_start, period_end)
+    summary = {
+        'batch_id': batch.id,
+        'period_start': period_start.isoformat(),
+        'period_end': period_end.isoformat(),
+        'claimed': 0,
+        'rejected': 0,
+        'total_amount': '0.00',
+        'participants': 0,
+        'rejections': {},
+        'file_name': None
+    }
+    if lines is None:
+        return summary
+
+    price, amounts = price_lines(lines['quantity'], lines['unit_price'], lines['price_limit'])
+    budget_table, remaining = _lock_budgets(db, np.unique(lines['budgets'][lines['budgets'] != 0]))
+    approved = allocate(lines['line_ids'], lines['budgets'], lines['days'], amounts, budget_table, remaining)
+    saved = _save_results(db, batch.id, lines, approved, amounts)
+    if not saved.all():
+        lines = {name: column[saved] for name, column in lines.items()}
+        approved, price, amounts = approved[saved], price[saved], amounts[saved]
+
+    claimed = np.flatnonzero(approved)
+    total_cents = int(amounts[claimed].sum())
+    batch.claimed_count = len(claimed)
+    batch.rejected_count = len(approved) - len(claimed)
+    batch.total_amount = Decimal(total_cents).scaleb(-2)
+
+    if len(claimed):
+        os.makedirs(CLAIM_FILES_DIR, exist_ok=True)
+        batch.file_name = f"bulk_payment_request_{batch.tenant_id}_{batch.id}_{period_end:%Y%m%d}.csv"
+        write_payment_request(
+            os.path.join(CLAIM_FILES_DIR, batch.file_name), batch.id,
+            _ndis_numbers(db, lines['participants'][claimed]), lines['days'][claimed],
+            lines['codes'][claimed], lines['line_ids'][claimed],
+            lines['quantity'][claimed], price[claimed]
+        )
+
+    rejected = ~approved
+    summary.update({
+        'claimed': batch.claimed_count,
+        'rejected': batch.rejected_count,
+        'total_amount': f"{total_cents // 100}.{total_cents % 100:02d}",
+        'participants': len(np.unique(lines['participants'][claimed])),
+        'rejections': {
+            NO_BUDGET: int(np.count_nonzero(rejected & (lines['budgets'] == 0))),
+            BUDGET_EXHAUSTED: int(np.count_nonzero(rejected & (lines['budgets'] != 0)))
+        },
+        'file_name': batch.file_name
+    })
+    return summary
+
+def participant_utilisation(db, as_of, min_utilisation=None):
+    """Budget, claimed amount and utilisation per participant for the
+    plans active on as_of, totalled across categories"""
+    rows = db.execute(text("""
+        SELECT participant_id, (amount * 100)::bigint, (claimed_amount * 100)::bigint
+        FROM plan_budgets WHERE tenant_id = :tenant_id AND ends_on >= :as_of AND starts_on <= :as_of
+    """), {'tenant_id': current_tenant_id(), 'as_of': as_of}).fetchall()
+    if not rows:
+        return []
+
+    participants, amounts, claimed = (np.array(column, dtype=np.int64) for column in zip(*rows))
+    unique, inverse = np.unique(participants, return_inverse=True)
+    budget = np.bincount(inverse, weights=amounts, minlength=len(unique))
+    spent = np.bincount(inverse, weights=claimed, minlength=len(unique))
+    utilisation = np.divide(spent, budget, out=np.zeros_like(spent), where=budget > 0)
+
+    selected = np.arange(len(unique))
+    if min_utilisation is not None:
+        selected = np.flatnonzero(utilisation >= min_utilisation)
+    return [
+        {
+            'participant_id': pid,
+            'budget': f"{total / 100:.2f}",
+            'claimed': f"{used / 100:.2f}",
+            'remaining': f"{(total - used) / 100:.2f}",
+            'utilisation': round(ratio, 4)
+        }
+        for pid, total, used, ratio in zip(
+            unique[selected].tolist(), budget[selected].tolist(),
+            spent[selected].tolist(), utilisation[selected].tolist()
+        )
+    ]
@@ -0,0 +1,325 @@
+"""Streaming CSV import for participants and staff.
+
+Rows are parsed from a text stream and validated in chunks. Uniqueness
+is checked against an in-memory index of the existing emails and NDIS
+numbers, loaded once per import (participant emails as their blind
+index, see pii.py). Valid rows are COPYed into a temp
+staging table and merged with one INSERT ... SELECT at the end, so
+memory stays bounded by the chunk size whatever the file size. Rejected
+rows are reported with their line number and reason.
+
+Staff logins go to users, which stays in the main database (see
+tenancy). Where the tenant shares it, users and staff are merged in the
+caller's transaction; for a placed tenant the users are committed first
+and deleted again if the caller rolls back (see auth.create_users).
+"""
+import csv
+import secrets
+from collections import Counter
+from itertools import islice
+import msgspec
+from auth import discard_users_on_rollback, hash_password
+from bulk_copy import copy_bytes, copy_rows
+from dashboard import record_created
+from pii import PII_FIELDS, active_key, email_index
+from models import User
+from principals import notify_users_created
+from tenancy import current_tenant_id
+from schemas import ParticipantImport, StaffImport
+
+CHUNK_ROWS = 10000
+INDEX_FETCH_ROWS = 50000
+# Rejected rows returned in the report; the rest are only counted
+MAX_REPORTED_REJECTS = 100
+
+INVALID = 'invalid'
+EMAIL_EXISTS = 'email_exists'
+NDIS_NUMBER_EXISTS = 'ndis_number_exists'
+DUPLICATE_IN_FILE = 'duplicate_in_file'
+
+class ImportSpec:
+    """How one entity is validated, staged and merged"""
+
+    def __init__(self, entity, schema, email_sql, ndis_sql, merge_sql, encrypted=False):
+        self.entity = entity
+        self.schema = schema
+        self.columns = schema.__struct_fields__
+        self.email_sql = email_sql
+        self.ndis_sql = ndis_sql
+        self.merge_sql = merge_sql
+        # PII is encrypted before staging, and emails are matched by
+        # their blind index
+        self.encrypted = encrypted
+
+    def staging_columns(self):
+        """(name, type) of the staging table's columns"""
+        if not self.encrypted:
+            return [(column, 'TEXT') for column in self.columns]
+        columns = [(column, 'BYTEA' if column in PII_FIELDS else 'TEXT') for column in self.columns]
+        return columns + [('email_index', 'BYTEA')]
+
+    def email_key(self, tenant_id, email):
+        """The key email_sql returns for an email"""
+        if self.encrypted:
+            return email_index(tenant_id, email).hex()
+        return email.lower()
+
+PARTICIPANTS = ImportSpec(
+    'participants', ParticipantImport,
+    email_sql="SELECT encode(email_index, 'hex') FROM participants "
+              "WHERE tenant_id = %(tenant_id)s AND email_index IS NOT NULL",
+    ndis_sql="SELECT ndis_number FROM participants WHERE tenant_id = %(tenant_id)s AND ndis_number IS NOT NULL",
+    # ON CONFLICT covers NDIS numbers added after the index was loaded
+    merge_sql="""
+        WITH inserted AS (
+            INSERT INTO participants (tenant_id, first_name, last_name, email, phone, address,
+                                      emergency_contact, email_index, ndis_number, status)
+            SELECT %(tenant_id)s, first_name, last_name, email, phone, address,
+                   emergency_contact, email_index, ndis_number, status
+            FROM import_staging ORDER BY line
+            ON CONFLICT (tenant_id, ndis_number) DO NOTHING
+            RETURNING status
+        )
+        SELECT status, COUNT(*) FROM inserted GROUP BY status
+    """,
+    encrypted=True
+)
+
+STAFF = ImportSpec(
+    'staff', StaffImport,
+    # Emails are unique across tenants
+    email_sql="SELECT lower(email) FROM users",
+    ndis_sql=None,
+    # Imported accounts get a password nobody knows and set theirs through
+    # a reset; users that appeared since the index was loaded are skipped
+    merge_sql="""
+        WITH new_users AS (
+            INSERT INTO users (tenant_id, email, password_hash, role, is_active)
+            SELECT %(tenant_id)s, email, %(password_hash)s, 'staff', status <> 'inactive'
+            FROM import_staging ORDER BY line
+            ON CONFLICT (email) DO NOTHING
+            RETURNING id, email
+        ), inserted AS (
+            INSERT INTO staff (tenant_id, user_id, first_name, last_name, phone, position, status)
+            SELECT %(tenant_id)s, u.id, s.first_name, s.last_name, s.phone, s.position, s.status
+            FROM new_users u JOIN import_staging s ON s.email = u.email
+            RETURNING status
+        )
+        SELECT status, COUNT(*) FROM inserted GROUP BY status
+    """
+)
+
+# A placed tenant's staff merge: the users are created in the main
+# database from import_users, and the staff from the new users' ids
+# copied back next to import_staging
+PLACED_STAFF_USERS_SQL = """
+    WITH new_users AS (
+        INSERT INTO users (tenant_id, email, password_hash, role, is_active)
+        SELECT %(tenant_id)s, email, %(password_hash)s, 'staff', status <> 'inactive'
+        FROM import_users ORDER BY line
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id, email
+    )
+    INSERT INTO import_new_users (id, email) SELECT id, email FROM new_users
+"""
+PLACED_STAFF_MERGE_SQL = """
+    WITH inserted AS (
+        INSERT INTO staff (tenant_id, user_id, first_name, last_name, phone, position, status)
+        SELECT %(tenant_id)s, u.id, s.first_name, s.last_name, s.phone, s.position, s.status
+        FROM import_new_users u JOIN import_staging s ON s.email = u.email
+        RETURNING status
+    )
+    SELECT status, COUNT(*) FROM inserted GROUP BY status
+"""
+
+SPECS = {spec.entity: spec for spec in (PARTICIPANTS, STAFF)}
+
+def _load_index(cursor, sql, params):
+    """Stream one key column into a set with a server-side cursor"""
+    keys = set()
+    if sql is None:
+        return keys
+    cursor.itersize = INDEX_FETCH_ROWS
+    cursor.execute(sql, params)
+    for (key,) in cursor:
+        keys.add(key)
+    return keys
+
+class KeyIndex:
+    """Keys already in the database, loaded once, plus the keys of rows
+    accepted earlier in the file"""
+
+    def __init__(self, existing, exists_reason):
+        self.existing = existing
+        self.exists_reason = exists_reason
+        self.seen = set()
+
+    def conflict(self, key):
+        if key is None:
+            return None
+        if key in self.existing:
+            return self.exists_reason
+        if key in self.seen:
+            return DUPLICATE_IN_FILE
+        return None
+
+    def add(self, key):
+        if key is not None:
+            self.seen.add(key)
+
+def _clean(row, columns):
+    # Empty cells fall back to the schema default (None for optional fields)
+    return {
+        column: value.strip() for column in columns
+        if (value := row.get(column)) is not None and value.strip()
+    }
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.staged = 0
+        self.rejected = Counter()
+        self.rejects = []
+
+    def reject(self, line, reason, detail=None):
+        self.rejected[reason] += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({'line': line, 'reason': reason, 'detail': detail})
+
+def _staged_row(spec, line, item, tenant_id, key):
+    values = [getattr(item, column) for column in spec.columns]
+    if not spec.encrypted:
+        return (line, *values)
+    values = [
+        copy_bytes(key.encrypt(column, value)) if column in PII_FIELDS else value
+        for column, value in zip(spec.columns, values)
+    ]
+    return (line, *values, copy_bytes(email_index(tenant_id, item.email)))
+
+def _validate(spec, chunk, emails, ndis_numbers, report, on_reject, tenant_id, key):
+    """Valid rows of one chunk as tuples for COPY"""
+    accepted = []
+    for line, row in chunk:
+        report.rows += 1
+        try:
+            item = msgspec.convert(_clean(row, spec.columns), spec.schema)
+        except msgspec.ValidationError as e:
+            reason, detail = INVALID, str(e)
+        else:
+            email = spec.email_key(tenant_id, item.email) if item.email else None
+            ndis_number = getattr(item, 'ndis_number', None)
+            reason = emails.conflict(email)
+            detail = item.email
+            if reason is None:
+                reason, detail = ndis_numbers.conflict(ndis_number), ndis_number
+            if reason is None:
+                emails.add(email)
+                ndis_numbers.add(ndis_number)
+                accepted.append(_staged_row(spec, line, item, tenant_id, key))
+                continue
+        report.reject(line, reason, detail)
+        if on_reject is not None:
+            on_reject(line, reason, detail, row)
+    return accepted
+
+def _merge_placed_staff(db, cursor, params):
+    """Merge staged staff of a tenant placed outside the main database;
+    returns {status: created}"""
+    users_connection = db.get_bind(User).raw_connection()
+    try:
+        users_cursor = users_connection.cursor()
+        users_cursor.execute("CREATE TEMP TABLE import_users (line INTEGER, email TEXT, status TEXT) ON COMMIT DROP")
+        users_cursor.execute("CREATE TEMP TABLE import_new_users (id INTEGER, email TEXT) ON COMMIT DROP")
+        with db.connection().connection.cursor('import_users') as staged:
+            staged.itersize = INDEX_FETCH_ROWS
+            staged.execute("SELECT line, email, status FROM import_staging")
+            copy_rows(users_cursor, 'import_users', ('line', 'email', 'status'), staged)
+        users_cursor.execute(PLACED_STAFF_USERS_SQL, params)
+        notify_users_created(users_cursor)
+
+        cursor.execute("CREATE TEMP TABLE import_new_users (id INTEGER, email TEXT) ON COMMIT DROP")
+        with users_connection.cursor('import_new_users') as new_users:
+            new_users.itersize = INDEX_FETCH_ROWS
+            new_users.execute("SELECT id, email FROM import_new_users")
+            copy_rows(cursor, 'import_new_users', ('id', 'email'), new_users)
+        cursor.execute("ANALYZE import_new_users")
+        cursor.execute(PLACED_STAFF_MERGE_SQL, params)
+        created = dict(cursor.fetchall())
+        cursor.execute("DROP TABLE import_new_users")
+
+        users_connection.commit()
+    finally:
+        # Returned to the pool, which rolls back anything not committed
+        users_connection.close()
+    # The password hash is this import's own, so it marks its users
+    discard_users_on_rollback(db, User.password_hash == params['password_hash'])
+    return created
+
+def import_csv(db, entity, stream, chunk_rows=CHUNK_ROWS, on_reject=None):
+    """Import a CSV text stream of participants or staff into the current
+    tenant; the caller commits.
+
+    Columns are matched by header name and unknown columns are ignored.
+    on_reject(line, reason, detail, row) is called for every rejected row.
+    Rows sharing an email or NDIS number with an existing record, or with
+    an earlier row of the file, are rejected rather than merged.
+    """
+    spec = SPECS[entity]
+    report = ImportReport()
+    tenant_id = current_tenant_id()
+    params = {'tenant_id': tenant_id}
+    key = active_key(db) if spec.encrypted else None
+    cursor = db.connection().connection.cursor()
+    # Staff emails are matched against users, in the main database
+    email_connection = db.connection(bind_arguments={'mapper': User}) if spec is STAFF else db.connection()
+    try:
+        # Key sets only; the index is the one thing that grows with the table
+        with email_connection.connection.cursor('import_index') as index_cursor:
+            emails = KeyIndex(_load_index(index_cursor, spec.email_sql, params), EMAIL_EXISTS)
+        with db.connection().connection.cursor('import_index') as index_cursor:
+            ndis_numbers = KeyIndex(_load_index(index_cursor, spec.ndis_sql, params), NDIS_NUMBER_EXISTS)
+
+        staging_columns = spec.staging_columns()
+        cursor.execute(
+            "CREATE TEMP TABLE import_staging (line INTEGER, "
+            + ', '.join(f"{column} {column_type}" for column, column_type in staging_columns)
+            + ") ON COMMIT DROP"
+        )
+        reader = csv.DictReader(stream)
+        # line_num after reading a row is the file line it ended on, which
+        # stays right for quoted fields spanning several lines
+        rows = ((reader.line_num, row) for row in reader)
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            accepted = _validate(spec, chunk, emails, ndis_numbers, report, on_reject, tenant_id, key)
+            report.staged += copy_rows(cursor, 'import_staging',
+                                       ('line', *(column for column, _ in staging_columns)), accepted)
+
+        cursor.execute("ANALYZE import_staging")
+        if spec is STAFF:
+            params['password_hash'] = hash_password(secrets.token_urlsafe(32))
+        if spec is STAFF and email_connection is not db.connection():
+            created = _merge_placed_staff(db, cursor, params)
+        else:
+            cursor.execute(spec.merge_sql, params)
+            created = dict(cursor.fetchall())
+            if spec is STAFF and created:
+                notify_users_created(cursor)
+        for status, count in created.items():
+            record_created(db, entity, status, count)
+        cursor.execute("DROP TABLE import_staging")
+    finally:
+        cursor.close()
+
+    return {
+        'entity': entity,
+        'rows': report.rows,
+        'created': sum(created.values()),
+        # Staged rows that lost a race with a concurrent insert
+        'skipped': report.staged - sum(created.values()),
+        'rejected': sum(report.rejected.values()),
+        'rejections': dict(report.rejected),
+        'rejects': report.rejects
+    }
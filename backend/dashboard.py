@@ -0,0 +1,58 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from models import DashboardCounter
+
+STAFF_STATUSES = ('active', 'inactive', 'on_leave')
+PARTICIPANT_STATUSES = ('active', 'inactive', 'pending')
+
+def bump_counter(db, metric, delta=1):
+    """Adjust one of the current tenant's counters inside the caller's
+    transaction"""
+    now = datetime.utcnow()
+    statement = insert(DashboardCounter).values(metric=metric, value=delta, updated_at=now)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[DashboardCounter.tenant_id, DashboardCounter.metric],
+        set_={
+            'value': DashboardCounter.value + delta,
+            'updated_at': now
+        }
+    ))
+
+def record_created(db, entity, status, count=1):
+    """Count newly created staff members or participants"""
+    bump_counter(db, f"{entity}.status.{status or 'unknown'}", count)
+
+def record_status_change(db, entity, old_status, new_status):
+    """Move one row between status counters if its status changed"""
+    if old_status == new_status:
+        return
+    bump_counter(db, f"{entity}.status.{old_status or 'unknown'}", -1)
+    bump_counter(db, f"{entity}.status.{new_status or 'unknown'}", 1)
+
+def get_summary(db):
+    """Build the dashboard summary from the counters table"""
+    counters = dict(db.query(DashboardCounter.metric, DashboardCounter.value).all())
+
+    def by_status(entity, statuses):
+        prefix = f"{entity}.status."
+        counts = {status: 0 for status in statuses}
+        for metric, value in counters.items():
+            if metric.startswith(prefix):
+                counts[metric[len(prefix):]] = value
+        counts['total'] = sum(counts.values())
+        return counts
+
+    staff = by_status('staff', STAFF_STATUSES)
+    participants = by_status('participants', PARTICIPANT_STATUSES)
+    return {
+        'staff': staff,
+        'participants': participants,
+        'active_staff': staff['active'],
+        'pending_onboarding': participants['pending']
+    }
+
+def reconcile_counters(db):
+    """Recompute all counters from the base tables"""
+    db.execute(text("SELECT reconcile_dashboard_counters()"))
+    db.commit()
@@ -0,0 +1,139 @@
+import os
+import random
+import threading
+import time
+from flask import has_request_context
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from models import engine, SessionLocal
+from tenancy import TENANT_PLACEMENTS, TenantSession, current_tenant_id
+
+# Comma separated list of replica connection strings; empty means every
+# read goes to the primary
+REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+MAX_REPLICA_LAG = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '1'))
+# Long enough that a replica within the lag limit has replayed the write
+READ_YOUR_WRITES_WINDOW = float(os.getenv(
+    'READ_YOUR_WRITES_SECONDS', str(MAX_REPLICA_LAG + LAG_CHECK_INTERVAL)
+))
+
+# A replica whose WAL receive and replay positions match is caught up
+# even if its last replayed transaction is old (idle primary)
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+class Replica:
+    """A replica engine plus its most recently measured replication lag"""
+
+    def __init__(self, url):
+        self.url = url
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.lag = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current_lag(self):
+        """Lag in seconds, re-measured at most every LAG_CHECK_INTERVAL;
+        None while the replica is unreachable"""
+        now = time.monotonic()
+        if now - self.checked_at < LAG_CHECK_INTERVAL:
+            return self.lag
+        with self._lock:
+            if now - self.checked_at >= LAG_CHECK_INTERVAL:
+                try:
+                    with self.engine.connect() as conn:
+                        self.lag = float(conn.execute(REPLICA_LAG_SQL).scalar())
+                except Exception as e:
+                    print(f"⚠️ Replica {self.engine.url.host} unavailable: {e}")
+                    self.lag = None
+                self.checked_at = time.monotonic()
+        return self.lag
+
+    def is_usable(self):
+        lag = self.current_lag()
+        return lag is not None and lag <= MAX_REPLICA_LAG
+
+replicas = [Replica(url) for url in REPLICA_URLS]
+
+class RoutingSession(TenantSession):
+    """Session that reads from the replica it was opened with.
+
+    Flushes always go to the primary, so an accidental write from a
+    read-only handler still lands in the right place. Replicas serve the
+    main database; tenants placed elsewhere read from their placement.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get('replica')
+        if replica is None or self._flushing:
+            return super().get_bind(mapper, clause=clause, **kw)
+        return replica.engine
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+
+# Clients that wrote recently, keyed by JWT identity -> monotonic deadline.
+# Per process: behind several workers a client may land on another
+# process, where the replica lag limit still bounds how stale it can read
+_recent_writers = {}
+_recent_writers_lock = threading.Lock()
+
+def _current_identity():
+    if not has_request_context():
+        return None
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+def mark_recent_write(identity):
+    """Route identity's reads to the primary for READ_YOUR_WRITES_WINDOW"""
+    deadline = time.monotonic() + READ_YOUR_WRITES_WINDOW
+    with _recent_writers_lock:
+        _recent_writers[identity] = deadline
+        if len(_recent_writers) > 10000:
+            now = time.monotonic()
+            for key in [key for key, until in _recent_writers.items() if until < now]:
+                del _recent_writers[key]
+
+def wrote_recently(identity):
+    if identity is None:
+        return False
+    until = _recent_writers.get(identity)
+    return until is not None and until > time.monotonic()
+
+def pick_replica():
+    """A random replica within the lag limit, or None for the primary"""
+    usable = [replica for replica in replicas if replica.is_usable()]
+    return random.choice(usable) if usable else None
+
+def read_session():
+    """Session for read-only handlers.
+
+    Uses a replica unless none is configured or within the lag limit, or
+    the calling client wrote within READ_YOUR_WRITES_WINDOW.
+    """
+    replica = None
+    if replicas and current_tenant_id() not in TENANT_PLACEMENTS and not wrote_recently(_current_identity()):
+        replica = pick_replica()
+    return ReadSessionLocal(info={'replica': replica})
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _remember_flush(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _remember_commit(session):
+    if session.info.pop('wrote', False):
+        identity = _current_identity()
+        if identity is not None:
+            mark_recent_write(identity)
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _forget_flush(session):
+    session.info.pop('wrote', None)
@@ -0,0 +1,210 @@
+"""Filtered, keyset-paginated reads over automation_logs and security_logs.
+
+Pages are ordered newest first on (created_at, id). Each filter has an
+index ending in (created_at, id), so a page is read straight off one
+index whatever the table size. Per-hour counts for charts come from
+log_hourly_counts, which is bumped in the same transaction as every log
+write rather than aggregated at read time. Everything here is the
+current tenant's.
+"""
+import base64
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import cast, delete, func, literal, or_, select, text, tuple_
+from sqlalchemy.dialects.postgresql import JSONPATH, insert
+from models import AutomationLog, LogHourlyCount, SecurityLog
+from serializers import RowEncoder
+from tenancy import current_tenant_id
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# Chart requests cover at most this many hours
+MAX_HOURS = 24 * 90
+# A filter combination no index serves fails fast instead of scanning
+QUERY_TIMEOUT_MS = int(os.getenv('LOG_QUERY_TIMEOUT_MS', '5000'))
+
+AUTOMATION = 'automation'
+SECURITY = 'security'
+
+automation_log_encoder = RowEncoder([
+    ('id', AutomationLog.id),
+    ('workflow_type', AutomationLog.workflow_type),
+    ('entity_type', AutomationLog.entity_type),
+    ('entity_id', AutomationLog.entity_id),
+    ('status', AutomationLog.status),
+    ('details', AutomationLog.details),
+    ('next_run_at', AutomationLog.next_run_at),
+    ('created_at', AutomationLog.created_at),
+    ('completed_at', AutomationLog.completed_at),
+])
+
+security_log_encoder = RowEncoder([
+    ('id', SecurityLog.id),
+    ('event_type', SecurityLog.event_type),
+    ('user_id', SecurityLog.user_id),
+    ('details', SecurityLog.details),
+    ('ip_address', SecurityLog.ip_address),
+    ('user_agent', SecurityLog.user_agent),
+    ('created_at', SecurityLog.created_at),
+])
+
+def encode_cursor(created_at, log_id):
+    raw = json.dumps([created_at.isoformat(), log_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor, or None if it is malformed"""
+    try:
+        created_at, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(log_id)
+    except (ValueError, TypeError):
+        return None
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def record_hourly(db, source, counts, at=None):
+    """Add {label: n} to this hour's counts inside the caller's transaction"""
+    counts = {label: n for label, n in counts.items() if n}
+    if not counts:
+        return
+    hour = hour_of(at or datetime.utcnow())
+    statement = insert(LogHourlyCount).values([
+        {'source': source, 'hour': hour, 'label': label, 'count': n}
+        for label, n in sorted(counts.items())
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[LogHourlyCount.tenant_id, LogHourlyCount.source, LogHourlyCount.hour, LogHourlyCount.label],
+        set_={'count': LogHourlyCount.count + statement.excluded.count}
+    ))
+
+def record_workflow_events(db, events, at=None):
+    """Count workflow runs by (workflow_type, event), e.g.
+    ('staff_onboarding', 'started')"""
+    record_hourly(db, AUTOMATION, Counter(f"{workflow}.{event}" for workflow, event in events), at)
+
+def _page(db, encoder, table, conditions, limit, cursor):
+    """One page newest first; returns (rows, next_cursor)"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    statement = encoder.select().where(*conditions)
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        # Row comparison, so the index range starts right after the cursor
+        statement = statement.where(tuple_(table.created_at, table.id) < tuple_(*position))
+    statement = statement.order_by(table.created_at.desc(), table.id.desc()).limit(limit + 1)
+
+    db.execute(
+        text("SELECT set_config('statement_timeout', :timeout, true)"),
+        {'timeout': str(QUERY_TIMEOUT_MS)}
+    )
+    rows = db.execute(statement).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(encoder.keys, rows[-1]))
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+    return encoder.encode(rows), next_cursor
+
+def _time_range(table, since, until):
+    conditions = []
+    if since is not None:
+        conditions.append(table.created_at >= since)
+    if until is not None:
+        conditions.append(table.created_at < until)
+    return conditions
+
+def find_automation_logs(db, workflow_type=None, entity_type=None, entity_id=None, status=None,
+                         since=None, until=None, details_path=None, limit=DEFAULT_LIMIT, cursor=None):
+    """Workflow runs matching every given filter, newest first.
+
+    details_path is a jsonpath that must match the run's details, e.g.
+    '$.steps.welcome_email ? (@.status == "failed")'; it is answered from
+    the GIN index on details. Returns (logs, next_cursor).
+    """
+    conditions = _time_range(AutomationLog, since, until)
+    if workflow_type is not None:
+        conditions.append(AutomationLog.workflow_type == workflow_type)
+    if entity_type is not None:
+        conditions.append(AutomationLog.entity_type == entity_type)
+    if entity_id is not None:
+        conditions.append(AutomationLog.entity_id == entity_id)
+    if status is not None:
+        conditions.append(AutomationLog.status == status)
+    if details_path is not None:
+        conditions.append(AutomationLog.details.bool_op('@?')(cast(details_path, JSONPATH)))
+    return _page(db, automation_log_encoder, AutomationLog, conditions, limit, cursor)
+
+def find_security_logs(db, event_type=None, user_id=None, since=None, until=None,
+                       limit=DEFAULT_LIMIT, cursor=None):
+    """Security events matching every given filter, newest first.
+
+    Returns (logs, next_cursor).
+    """
+    conditions = _time_range(SecurityLog, since, until)
+    if event_type is not None:
+        conditions.append(SecurityLog.event_type == event_type)
+    if user_id is not None:
+        conditions.append(SecurityLog.user_id == user_id)
+    return _page(db, security_log_encoder, SecurityLog, conditions, limit, cursor)
+
+def hourly_counts(db, source, since, until, label_prefix=None):
+    """[{hour, label, count}] for whole hours in [since, until), read from
+    the rollup; hours without events are omitted"""
+    conditions = [
+        LogHourlyCount.source == source,
+        LogHourlyCount.hour >= hour_of(since),
+        LogHourlyCount.hour < until,
+    ]
+    if label_prefix is not None:
+        conditions.append(or_(
+            LogHourlyCount.label == label_prefix,
+            LogHourlyCount.label.startswith(f"{label_prefix}.", autoescape=True)
+        ))
+    rows = db.execute(
+        select(LogHourlyCount.hour, LogHourlyCount.label, LogHourlyCount.count)
+        .where(*conditions)
+        .order_by(LogHourlyCount.hour, LogHourlyCount.label)
+    ).all()
+    return [{'hour': hour.isoformat(), 'label': label, 'count': count} for hour, label, count in rows]
+
+def rebuild_hourly_counts(db, since, until):
+    """Recompute the rollup for [since, until) from the log tables, e.g.
+    to backfill history; the caller commits.
+
+    Workflow counts only cover the registered workflows, which are all
+    record_workflow_events ever counts; other automation_logs rows (such
+    as the notification sweeps' daily_reminder entries) are left out.
+    """
+    # Imported here: the engine records its events through this module
+    import automation.workflows  # noqa: F401
+    from automation.engine import WORKFLOWS
+    workflow_types = sorted(WORKFLOWS)
+    since, until = hour_of(since), hour_of(until)
+    db.execute(delete(LogHourlyCount).where(LogHourlyCount.hour >= since, LogHourlyCount.hour < until))
+
+    tenant_id = current_tenant_id()
+
+    def rollup(table, source, moment, label, *conditions):
+        hour = func.date_trunc('hour', moment)
+        return select(literal(tenant_id), literal(source), hour, label, func.count()).where(
+            table.tenant_id == tenant_id, moment >= since, moment < until, *conditions
+        ).group_by(hour, label)
+
+    columns = ['tenant_id', 'source', 'hour', 'label', 'count']
+    for query in (
+        rollup(AutomationLog, AUTOMATION, AutomationLog.created_at, AutomationLog.workflow_type + '.started',
+               AutomationLog.workflow_type.in_(workflow_types)),
+        rollup(AutomationLog, AUTOMATION, AutomationLog.completed_at,
+               AutomationLog.workflow_type + '.' + AutomationLog.status,
+               AutomationLog.workflow_type.in_(workflow_types), AutomationLog.status.in_(('completed', 'failed'))),
+        rollup(SecurityLog, SECURITY, SecurityLog.created_at, SecurityLog.event_type),
+    ):
+        db.execute(insert(LogHourlyCount).from_select(columns, query))
+
+def default_range(since, until, hours=24):
+    """Fill in a missing end of a chart range and clamp it to MAX_HOURS"""
+    until = until or datetime.utcnow() + timedelta(hours=1)
+    since = since or until - timedelta(hours=hours)
+    return max(since, until - timedelta(hours=MAX_HOURS)), until
@@ -0,0 +1,42 @@
+from functools import wraps
+import jwt
+from quart import current_app, g, jsonify, request
+from async_db import run_read
+from principals import load_principal, principal_cache
+from revocation import is_revoked
+from tenancy import DEFAULT_TENANT_ID, set_request_tenant
+
+def _decode_token():
+    """Decode the Bearer token the same way flask_jwt_extended issues it"""
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme != 'Bearer' or not token:
+        raise jwt.InvalidTokenError('Missing Bearer token')
+    return jwt.decode(
+        token,
+        current_app.config['JWT_SECRET_KEY'],
+        algorithms=[current_app.config.get('JWT_ALGORITHM', 'HS256')]
+    )
+
+def require_auth(f):
+    """Async counterpart of middleware.security.require_auth"""
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        try:
+            g.jwt_claims = _decode_token()
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Authentication required'}), 401
+        if g.jwt_claims.get('type') != 'access' or is_revoked(g.jwt_claims):
+            return jsonify({'error': 'Authentication required'}), 401
+        principal = principal_cache.cached(g.jwt_claims['sub'])
+        if principal is None:
+            generation = principal_cache.generation()
+            principal = principal_cache.store(await run_read(load_principal, int(g.jwt_claims['sub'])), generation)
+        if principal is None or not principal.is_active:
+            return jsonify({'error': 'Account is inactive'}), 401
+        if principal.tenant_id != g.jwt_claims.get('tid', DEFAULT_TENANT_ID):
+            return jsonify({'error': 'Authentication required'}), 401
+        g.principal = principal
+        set_request_tenant(principal.tenant_id)
+        return await f(*args, **kwargs)
+    return decorated_function
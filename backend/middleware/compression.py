@@ -0,0 +1,139 @@
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Defaults, each can be overridden through app.config
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVELS = {
+    'application/json': {'gzip': 6, 'br': 5, 'zstd': 3},
+    'text/csv': {'gzip': 6, 'br': 6, 'zstd': 6},
+    'text/event-stream': {'gzip': 1, 'br': 1, 'zstd': 1},
+}
+FALLBACK_LEVELS = {'gzip': 6, 'br': 4, 'zstd': 3}
+DEFAULT_MIMETYPES = set(DEFAULT_LEVELS) | {'text/plain', 'text/html'}
+# Streamed bodies are flushed once this much input is pending; event
+# streams are always flushed per chunk so events are not held back
+DEFAULT_STREAM_FLUSH_SIZE = 16 * 1024
+
+def available_encodings():
+    """Encodings we can produce, in server preference order"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best encoding the client accepts, or None for identity"""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def _level_for(mimetype, encoding):
+    levels = current_app.config.get('COMPRESS_LEVELS', DEFAULT_LEVELS)
+    return levels.get(mimetype, FALLBACK_LEVELS).get(encoding, FALLBACK_LEVELS[encoding])
+
+def _compressor(encoding, level):
+    """Return (compress, flush, finish) callables for an incremental compressor"""
+    if encoding == 'gzip':
+        obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return obj.compress, lambda: obj.flush(zlib.Z_SYNC_FLUSH), obj.flush
+    if encoding == 'br':
+        obj = brotli.Compressor(quality=level)
+        return obj.process, obj.flush, obj.finish
+    obj = zstandard.ZstdCompressor(level=level).compressobj()
+    return (
+        obj.compress,
+        lambda: obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        obj.flush,
+    )
+
+def _compress_stream(chunks, encoding, level, flush_size):
+    """Compress a streamed body incrementally, flushing every flush_size
+    bytes of input so clients keep receiving data without us buffering
+    the whole body"""
+    compress, flush, finish = _compressor(encoding, level)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += flush()
+                pending = 0
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _should_compress(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if request.method == 'HEAD' or 'Content-Encoding' in response.headers:
+        return False
+    if response.direct_passthrough and not response.is_streamed:
+        return False
+    mimetypes = current_app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+    return response.mimetype in mimetypes
+
+def compress_response(response):
+    """after_request hook: negotiate and apply gzip/brotli/zstd encoding"""
+    if not _should_compress(response):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    level = _level_for(response.mimetype, encoding)
+
+    if response.is_streamed:
+        flush_size = 0 if response.mimetype == 'text/event-stream' else \
+            current_app.config.get('COMPRESS_STREAM_FLUSH_SIZE', DEFAULT_STREAM_FLUSH_SIZE)
+        response.response = _compress_stream(response.response, encoding, level, flush_size)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < current_app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE):
+            return response
+        compress, _, finish = _compressor(encoding, level)
+        response.set_data(compress(body) + finish())
+
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import and_, delete, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from models import IdempotencyKey, SessionLocal
+from tenancy import current_tenant_id, tenant_context
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+KEY_TTL = timedelta(hours=float(os.getenv('IDEMPOTENCY_TTL_HOURS', '24')))
+# A claim is only good for LOCK_TIMEOUT, but the process handling the
+# request extends it every HEARTBEAT_SECONDS for as long as the handler
+# runs. A claim that lapses therefore belongs to a request whose process
+# died, and the key may be claimed again.
+LOCK_TIMEOUT = timedelta(seconds=60)
+HEARTBEAT_SECONDS = LOCK_TIMEOUT.total_seconds() / 3
+MAX_STORED_RESPONSE_BYTES = 64 * 1024
+CACHE_SIZE = 1024
+
+# Completed responses never change until they expire, so replays are
+# served from memory when they hit the same process
+_completed = OrderedDict()
+_completed_lock = threading.Lock()
+
+def _remember(cache_key, stored):
+    with _completed_lock:
+        _completed[cache_key] = stored
+        _completed.move_to_end(cache_key)
+        while len(_completed) > CACHE_SIZE:
+            _completed.popitem(last=False)
+
+def _recall(cache_key):
+    with _completed_lock:
+        stored = _completed.get(cache_key)
+        if stored is not None and stored['expires_at'] <= datetime.utcnow():
+            del _completed[cache_key]
+            return None
+        return stored
+
+# (tenant_id, scope, key) of the requests this process is handling
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+_heartbeat = None
+
+def _hold(entry):
+    global _heartbeat
+    with _in_flight_lock:
+        _in_flight.add(entry)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_extend_claims, name='idempotency-heartbeat', daemon=True)
+            _heartbeat.start()
+
+def _reset_after_fork():
+    # The heartbeat thread does not survive a fork, and the parent's
+    # requests are not the child's to keep alive
+    global _in_flight, _in_flight_lock, _heartbeat
+    _in_flight = set()
+    _in_flight_lock = threading.Lock()
+    _heartbeat = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _drop(entry):
+    with _in_flight_lock:
+        _in_flight.discard(entry)
+
+def _extend_claims():
+    """Keep the claims of in-flight requests from lapsing"""
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _in_flight_lock:
+            entries = list(_in_flight)
+        by_tenant = defaultdict(list)
+        for tenant_id, scope, key in entries:
+            by_tenant[tenant_id].append((scope, key))
+        for tenant_id, keys in by_tenant.items():
+            # Keys live in the database of the tenant that claimed them
+            with tenant_context(tenant_id):
+                db = SessionLocal()
+                try:
+                    db.execute(
+                        update(IdempotencyKey).where(
+                            tuple_(IdempotencyKey.scope, IdempotencyKey.key).in_(keys),
+                            IdempotencyKey.status_code.is_(None)
+                        ).values(locked_until=datetime.utcnow() + LOCK_TIMEOUT)
+                    )
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    print(f"❌ Idempotency heartbeat failed (tenant {tenant_id}): {str(e)}")
+                finally:
+                    db.close()
+
+def _claim(scope, key, request_hash):
+    """Insert an in-flight claim for the key, taking over expired or
+    abandoned ones. Returns None if we own the key, else the stored row."""
+    now = datetime.utcnow()
+    values = {
+        'scope': scope, 'key': key, 'request_hash': request_hash,
+        'status_code': None, 'content_type': None, 'response_body': None,
+        'locked_until': now + LOCK_TIMEOUT, 'expires_at': now + KEY_TTL, 'created_at': now
+    }
+    statement = insert(IdempotencyKey).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.scope, IdempotencyKey.key],
+        set_={name: statement.excluded[name] for name in values if name not in ('scope', 'key')},
+        where=or_(
+            IdempotencyKey.expires_at < now,
+            and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.locked_until < now)
+        )
+    ).returning(IdempotencyKey.key)
+
+    db = SessionLocal()
+    try:
+        claimed = db.execute(statement).first() is not None
+        row = None
+        if not claimed:
+            row = db.execute(
+                select(IdempotencyKey.request_hash, IdempotencyKey.status_code,
+                       IdempotencyKey.content_type, IdempotencyKey.response_body,
+                       IdempotencyKey.expires_at)
+                .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            ).first()
+        db.commit()
+        return None if row is None else row._asdict()
+    finally:
+        db.close()
+
+def _finish(scope, key, response):
+    """Store a final response for replays, or release the key so the
+    client can retry after a server error"""
+    key_filter = and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+    body = None if response.is_streamed else response.get_data()
+    db = SessionLocal()
+    try:
+        if response.status_code >= 500 or body is None or len(body) > MAX_STORED_RESPONSE_BYTES:
+            db.execute(delete(IdempotencyKey).where(key_filter))
+            db.commit()
+            return None
+        row = db.execute(
+            update(IdempotencyKey).where(key_filter).values(
+                status_code=response.status_code,
+                content_type=response.content_type,
+                response_body=body
+            ).returning(IdempotencyKey.request_hash, IdempotencyKey.expires_at)
+        ).first()
+        db.commit()
+    finally:
+        db.close()
+    if row is None:
+        return None
+    return {
+        'request_hash': row.request_hash, 'status_code': response.status_code,
+        'content_type': response.content_type, 'response_body': body, 'expires_at': row.expires_at
+    }
+
+def _release(scope, key):
+    db = SessionLocal()
+    try:
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key))
+        db.commit()
+    finally:
+        db.close()
+
+def _replay(stored, request_hash):
+    if stored['request_hash'] != request_hash:
+        return jsonify({'error': f"{IDEMPOTENCY_HEADER} was already used with a different request body"}), 422
+    if stored['status_code'] is None:
+        response = jsonify({'error': f"A request with this {IDEMPOTENCY_HEADER} is still in progress"})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+    response = make_response(stored['response_body'], stored['status_code'])
+    response.content_type = stored['content_type']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(f):
+    """Honor an Idempotency-Key header on a create endpoint.
+
+    The first request's response is stored for KEY_TTL and returned for
+    retries with the same key and body, without running the handler
+    again. Requests without the header are handled as usual. Must be
+    applied after the auth decorator so keys are scoped per user.
+
+    A retry while the first request is still running gets a 409, however
+    long the handler takes. If the process dies mid-request, the key can
+    be claimed again LOCK_TIMEOUT later.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters"}), 400
+
+        scope = f"{get_jwt_identity()}:{request.method}:{request.path}"
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        cache_key = (scope, key)
+
+        stored = _recall(cache_key)
+        if stored is None:
+            stored = _claim(scope, key, request_hash)
+            if stored is not None and stored['status_code'] is not None:
+                _remember(cache_key, stored)
+        if stored is not None:
+            return _replay(stored, request_hash)
+
+        entry = (current_tenant_id(), scope, key)
+        _hold(entry)
+        try:
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                _release(scope, key)
+                raise
+            stored = _finish(scope, key, response)
+        finally:
+            _drop(entry)
+        if stored is not None:
+            _remember(cache_key, stored)
+        return response
+    return decorated_function
@@ -1,6 +1,30 @@
 from functools import wraps
-from flask import jsonify, request
+from flask import g, has_request_context, jsonify, request
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
+from revocation import is_revoked
+from principals import principal_cache
+from tenancy import DEFAULT_TENANT_ID, set_request_tenant
+from models import SecurityLog, SessionLocal
+from log_queries import SECURITY, record_hourly
+
+def _authorise(claims):
+    """Error response for a verified token that may not be used, else None.
+
+    The principal (role, is_active, tenant) comes from the process
+    cache, so deactivation and role changes apply to tokens already
+    issued without a database round trip per request. The token's tenant
+    becomes the request's tenant.
+    """
+    if is_revoked(claims):
+        return jsonify({'error': 'Token has been revoked'}), 401
+    principal = principal_cache.get(claims['sub'])
+    if principal is None or not principal.is_active:
+        return jsonify({'error': 'Account is inactive'}), 401
+    if principal.tenant_id != claims.get('tid', DEFAULT_TENANT_ID):
+        return jsonify({'error': 'Authentication required'}), 401
+    g.principal = principal
+    set_request_tenant(principal.tenant_id)
+    return None
 
 def require_auth(f):
     """Decorator to require authentication"""
@@ -8,6 +32,9 @@ def require_auth(f):
     def decorated_function(*args, **kwargs):
         try:
             verify_jwt_in_request()
+            denied = _authorise(get_jwt())
+            if denied:
+                return denied
             return f(*args, **kwargs)
         except Exception as e:
             return jsonify({'error': 'Authentication required'}), 401
@@ -20,8 +47,11 @@ def require_role(required_role):
         def decorated_function(*args, **kwargs):
             try:
                 verify_jwt_in_request()
-                claims = get_jwt()
-                user_role = claims.get('role')
+                denied = _authorise(get_jwt())
+                if denied:
+                    return denied
+                # The current role, not the one the token was issued with
+                user_role = g.principal.role
                 
                 if user_role != required_role and user_role != 'admin':
                     return jsonify({'error': 'Insufficient permissions'}), 403
@@ -33,6 +63,29 @@ def require_role(required_role):
     return decorator
 
 def log_security_event(event_type, user_id, details):
-    """Log security events for monitoring"""
-    # In a real app, this would write to a security log
-    print(f"SECURITY EVENT: {event_type} - User: {user_id} - Details: {details}")
\ No newline at end of file
+    """Record a security event in security_logs for monitoring.
+
+    user_id may be 'unknown' (e.g. a failed login); the event is still
+    recorded, without a user. A failure to record is printed rather than
+    failing the request that triggered it.
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        user_id = None
+    db = SessionLocal()
+    try:
+        db.add(SecurityLog(
+            event_type=event_type,
+            user_id=user_id,
+            details=details,
+            ip_address=request.remote_addr if has_request_context() else None,
+            user_agent=request.headers.get('User-Agent') if has_request_context() else None
+        ))
+        record_hourly(db, SECURITY, {event_type: 1})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"SECURITY EVENT (not recorded: {e}): {event_type} - User: {user_id} - Details: {details}")
+    finally:
+        db.close()
\ No newline at end of file
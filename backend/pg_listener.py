@@ -0,0 +1,142 @@
+import os
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from models import DATABASE_URL
+
+class PgListener:
+    """One LISTEN connection per backend process, dispatching NOTIFY
+    payloads to the callbacks registered for each channel"""
+
+    def __init__(self, dsn=DATABASE_URL, poll_interval=5.0):
+        self.dsn = dsn
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self.on_reconnect = []
+        self._lock = threading.Lock()
+        # Signalled whenever the set of channels LISTENed on changes
+        self._synced = threading.Condition(self._lock)
+        self._listening = set()
+        self._wake_fds = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._pid = None
+
+    def listen(self, channel, callback, timeout=None):
+        """Call callback(payload) for every NOTIFY on channel.
+
+        Returns once the LISTEN is in place, so nothing published after
+        the call returns is missed; False if that took longer than timeout
+        (poll_interval by default), e.g. while the database is down.
+        """
+        with self._lock:
+            self.handlers.setdefault(channel, []).append(callback)
+        self.start()
+        # The listener thread owns the connection: wake it up to LISTEN
+        self._wake()
+        timeout = self.poll_interval if timeout is None else timeout
+        with self._synced:
+            return self._synced.wait_for(lambda: channel in self._listening, timeout)
+
+    def start(self):
+        """Start the listener thread (again, after a fork) if needed"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            # A pipe of its own: one inherited through a fork would wake
+            # the parent's thread too
+            if self._wake_fds is not None:
+                for fd in self._wake_fds:
+                    os.close(fd)
+            self._wake_fds = os.pipe()
+            os.set_blocking(self._wake_fds[1], False)
+            self._thread = threading.Thread(target=self._run, args=(self._wake_fds[0],), name='pg-listener', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_fds[1], b'\0')
+        except BlockingIOError:
+            # Full, so the thread has a wake-up pending already
+            pass
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _sync_channels(self, conn, listening):
+        with self._lock:
+            channels = set(self.handlers)
+        with conn.cursor() as cursor:
+            for channel in channels - listening:
+                cursor.execute(f'LISTEN "{channel}"')
+                listening.add(channel)
+        with self._synced:
+            if self._listening != listening:
+                self._listening = set(listening)
+                self._synced.notify_all()
+
+    def _dispatch(self, notify):
+        with self._lock:
+            callbacks = list(self.handlers.get(notify.channel, ()))
+        for callback in callbacks:
+            try:
+                callback(notify.payload)
+            except Exception as e:
+                print(f"⚠️ Listener callback failed on {notify.channel}: {e}")
+
+    def _run(self, wake_fd):
+        backoff = 1
+        while not self._stopped.is_set():
+            listening = set()
+            conn = None
+            try:
+                conn = self._connect()
+                self._sync_channels(conn, listening)
+                # Anything published while we were disconnected was missed
+                for callback in list(self.on_reconnect):
+                    callback()
+                backoff = 1
+                print(f"👂 Listening for notifications on: {', '.join(sorted(listening))}")
+
+                while not self._stopped.is_set():
+                    ready, _, _ = select.select([conn, wake_fd], [], [], self.poll_interval)
+                    if wake_fd in ready:
+                        os.read(wake_fd, 4096)
+                    if conn in ready:
+                        conn.poll()
+                        while conn.notifies:
+                            self._dispatch(conn.notifies.pop(0))
+                    self._sync_channels(conn, listening)
+            except Exception as e:
+                print(f"❌ Notification listener error: {e} - reconnecting in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                with self._lock:
+                    self._listening = set()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+_listener = None
+_listener_lock = threading.Lock()
+
+def get_listener():
+    """Return the process-wide listener, creating it on first use"""
+    global _listener
+    with _listener_lock:
+        if _listener is None or _listener._pid not in (None, os.getpid()):
+            _listener = PgListener()
+        return _listener
@@ -0,0 +1,189 @@
+"""Envelope encryption for participant PII.
+
+email, phone, address and emergency_contact are stored encrypted with
+AES-256-GCM under a data key. Data keys live in pii_data_keys wrapped by
+the master key (PII_MASTER_KEY, 32 bytes base64), one active key per
+tenant at a time: after PII_KEY_ROTATION_DAYS a new key takes over for
+encryption, and older keys stay around to decrypt what they encrypted.
+Every value records the id of its key:
+
+    key id (4 bytes, big endian) | nonce (12 bytes) | ciphertext + tag
+
+Unwrapped keys are cached per process (bounded, expiring), and reads
+decrypt whole batches of rows: a batch resolves its distinct key ids
+with at most one query, then decrypts in memory.
+
+Emails are also stored as a blind index, an HMAC of the normalised
+address, so exact lookups and uniqueness checks stay indexed without
+the plaintext.
+"""
+import base64
+import hashlib
+import hmac
+import os
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy import text
+from tenancy import current_tenant_id
+from ttl_cache import TTLCache
+
+PII_FIELDS = ('email', 'phone', 'address', 'emergency_contact')
+KEY_ROTATION_DAYS = float(os.getenv('PII_KEY_ROTATION_DAYS', '90'))
+KEY_CACHE_SECONDS = float(os.getenv('PII_KEY_CACHE_SECONDS', '3600'))
+KEY_CACHE_SIZE = int(os.getenv('PII_KEY_CACHE_SIZE', '1000'))
+# How long a process keeps encrypting with the key it found active
+ACTIVE_KEY_SECONDS = 300
+NONCE_BYTES = 12
+KEY_ID_BYTES = 4
+
+def _master_key():
+    encoded = os.getenv('PII_MASTER_KEY')
+    if not encoded:
+        # Development only; deployments must set their own
+        return hashlib.sha256(b'dev-pii-master-key').digest()
+    key = base64.b64decode(encoded)
+    if len(key) != 32:
+        raise ValueError('PII_MASTER_KEY must be 32 bytes, base64 encoded')
+    return key
+
+MASTER_KEY = _master_key()
+BLIND_INDEX_KEY = hmac.new(MASTER_KEY, b'email-blind-index', hashlib.sha256).digest()
+_master = AESGCM(MASTER_KEY)
+
+def _wrap_aad(tenant_id):
+    return f"pii-data-key:{tenant_id}".encode('ascii')
+
+def generate_data_key(tenant_id):
+    """A new data key and its wrapped form for storing in pii_data_keys"""
+    key = AESGCM.generate_key(bit_length=256)
+    nonce = os.urandom(NONCE_BYTES)
+    return key, nonce + _master.encrypt(nonce, key, _wrap_aad(tenant_id))
+
+def unwrap_key(tenant_id, wrapped):
+    wrapped = bytes(wrapped)
+    return _master.decrypt(wrapped[:NONCE_BYTES], wrapped[NONCE_BYTES:], _wrap_aad(tenant_id))
+
+def normalise_email(email):
+    return email.strip().lower()
+
+def email_index(tenant_id, email):
+    """Blind index of an email; equal for addresses differing only in case
+    or surrounding whitespace, and different across tenants"""
+    if email is None:
+        return None
+    message = f"{tenant_id}:{normalise_email(email)}".encode('utf-8')
+    return hmac.new(BLIND_INDEX_KEY, message, hashlib.sha256).digest()
+
+class DataKey:
+    """One unwrapped data key; the field name is authenticated with each
+    value, so a ciphertext copied into another column does not decrypt"""
+
+    def __init__(self, key_id, key):
+        self.key_id = key_id
+        self.prefix = key_id.to_bytes(KEY_ID_BYTES, 'big')
+        self.aead = AESGCM(key)
+
+    def encrypt(self, field, value):
+        if value is None:
+            return None
+        nonce = os.urandom(NONCE_BYTES)
+        return self.prefix + nonce + self.aead.encrypt(nonce, value.encode('utf-8'), field.encode('ascii'))
+
+    def decrypt(self, aad, blob):
+        start = KEY_ID_BYTES + NONCE_BYTES
+        return self.aead.decrypt(bytes(blob[KEY_ID_BYTES:start]), bytes(blob[start:]), aad).decode('utf-8')
+
+def key_id_of(blob):
+    return int.from_bytes(blob[:KEY_ID_BYTES], 'big')
+
+# (tenant_id, key_id) -> DataKey, and tenant_id -> its active DataKey
+_keys = TTLCache(KEY_CACHE_SECONDS, max_entries=KEY_CACHE_SIZE)
+_active_keys = TTLCache(ACTIVE_KEY_SECONDS, max_entries=KEY_CACHE_SIZE)
+
+def data_keys(db, key_ids):
+    """{key_id: DataKey} for the current tenant, loading the uncached
+    ones with a single query"""
+    tenant_id = current_tenant_id()
+    keys, missing = {}, []
+    for key_id in key_ids:
+        key = _keys.get((tenant_id, key_id))
+        if key is None:
+            missing.append(key_id)
+        else:
+            keys[key_id] = key
+    if missing:
+        rows = db.execute(
+            text("SELECT id, wrapped_key FROM pii_data_keys WHERE tenant_id = :tenant_id AND id = ANY(:ids)"),
+            {'tenant_id': tenant_id, 'ids': missing}
+        ).all()
+        for key_id, wrapped in rows:
+            key = keys[key_id] = DataKey(key_id, unwrap_key(tenant_id, wrapped))
+            _keys.put((tenant_id, key_id), key)
+        unknown = set(missing) - set(keys)
+        if unknown:
+            raise LookupError(f"Unknown PII data keys {sorted(unknown)} for tenant {tenant_id}")
+    return keys
+
+def active_key(db):
+    """The current tenant's key for new values, rotating it once it is
+    KEY_ROTATION_DAYS old"""
+    tenant_id = current_tenant_id()
+    key = _active_keys.get(tenant_id)
+    if key is not None:
+        return key
+    now = datetime.utcnow()
+    row = db.execute(
+        text("SELECT id, wrapped_key FROM pii_data_keys WHERE tenant_id = :tenant_id AND created_at > :since "
+             "ORDER BY id DESC LIMIT 1"),
+        {'tenant_id': tenant_id, 'since': now - timedelta(days=KEY_ROTATION_DAYS)}
+    ).first()
+    if row is not None:
+        key_id, raw = row[0], unwrap_key(tenant_id, row[1])
+    else:
+        raw, wrapped = generate_data_key(tenant_id)
+        # Committed on its own: values encrypted under it must stay
+        # readable even if the caller's transaction rolls back. Two
+        # processes rotating at once just leave one key unused.
+        with db.get_bind().begin() as conn:
+            key_id = conn.execute(
+                text("INSERT INTO pii_data_keys (tenant_id, wrapped_key, created_at) "
+                     "VALUES (:tenant_id, :wrapped_key, :created_at) RETURNING id"),
+                {'tenant_id': tenant_id, 'wrapped_key': wrapped, 'created_at': now}
+            ).scalar_one()
+    key = DataKey(key_id, raw)
+    _keys.put((tenant_id, key_id), key)
+    _active_keys.put(tenant_id, key)
+    return key
+
+def encrypt_fields(db, values):
+    """Copy of a column -> value dict with the PII fields encrypted, plus
+    email_index when email is among them"""
+    if not any(field in values for field in PII_FIELDS):
+        return values
+    key = active_key(db)
+    encrypted = dict(values)
+    for field in PII_FIELDS:
+        if field in values:
+            encrypted[field] = key.encrypt(field, values[field])
+    if 'email' in values:
+        encrypted['email_index'] = email_index(current_tenant_id(), values['email'])
+    return encrypted
+
+def decrypt_rows(db, rows, fields):
+    """Rows as lists with the encrypted columns decrypted in place.
+
+    fields is [(position, field name)]. The whole batch costs at most
+    one key query, for the keys not already cached.
+    """
+    rows = [list(row) for row in rows]
+    fields = [(position, field.encode('ascii')) for position, field in fields]
+    key_ids = {key_id_of(row[position]) for row in rows for position, _ in fields if row[position] is not None}
+    if not key_ids:
+        return rows
+    keys = data_keys(db, key_ids)
+    for row in rows:
+        for position, aad in fields:
+            blob = row[position]
+            if blob is not None:
+                row[position] = keys[key_id_of(blob)].decrypt(aad, blob)
+    return rows
@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+from collections import namedtuple
+from sqlalchemy import event, inspect, select, text
+from models import User, SessionLocal
+from tenancy import ALL_TENANTS
+from pg_listener import get_listener
+from ttl_cache import TTLCache
+
+PRINCIPAL_CHANNEL = 'ndis_principal_changes'
+PRINCIPAL_TTL_SECONDS = float(os.getenv('PRINCIPAL_TTL_SECONDS', '300'))
+# Unknown emails are cached briefly: long enough to absorb repeated
+# failed logins, short enough that a missed invalidation heals quickly
+UNKNOWN_EMAIL_TTL_SECONDS = float(os.getenv('UNKNOWN_EMAIL_TTL_SECONDS', '60'))
+# Evictions remembered for racing loads; past this many, they are
+# forgotten and every load in flight is treated as stale
+MAX_TRACKED_EVICTIONS = 10000
+
+Principal = namedtuple('Principal', ['user_id', 'role', 'is_active', 'tenant_id'])
+
+class PrincipalCache:
+    """Per-process cache of who a user is (role, is_active, tenant).
+
+    Entries expire after PRINCIPAL_TTL_SECONDS, but any committed change
+    to a user's role or is_active evicts them in every process at once
+    through NOTIFY, so the TTL only bounds how long a missed notification
+    could matter.
+
+    A load takes generation() before reading the database and hands it to
+    store(); if the entry was evicted since, the load may have read the
+    old row and is not cached.
+    """
+
+    def __init__(self):
+        self.principals = TTLCache(PRINCIPAL_TTL_SECONDS)
+        self.unknown_emails = TTLCache(UNKNOWN_EMAIL_TTL_SECONDS)
+        self._listening = False
+        self._listen_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Bumped by every eviction; user id or email -> value at its last one
+        self._generation = 0
+        self._evicted_at = {}
+        self._cleared_at = 0
+
+    def _ensure_listening(self):
+        if self._listening:
+            return
+        with self._listen_lock:
+            if self._listening:
+                return
+            listener = get_listener()
+            # Changes published while disconnected were missed
+            listener.on_reconnect.append(self.clear)
+            # Returns once the LISTEN is in place, so every load from here
+            # on sees an eviction either in the database or as a notification
+            listener.listen(PRINCIPAL_CHANNEL, self._on_notify)
+            self._listening = True
+
+    def _on_notify(self, payload):
+        message = json.loads(payload)
+        if message.get('all_emails'):
+            self.clear_unknown_emails()
+        self.evict(message.get('user_ids', ()), message.get('emails', ()))
+
+    def generation(self):
+        return self._generation
+
+    def evict(self, user_ids=(), emails=()):
+        with self._lock:
+            self._generation += 1
+            if len(self._evicted_at) >= MAX_TRACKED_EVICTIONS:
+                self._evicted_at.clear()
+                self._cleared_at = self._generation
+            for user_id in user_ids:
+                self._evicted_at[user_id] = self._generation
+                self.principals.pop(user_id)
+            for email in emails:
+                self._evicted_at[email] = self._generation
+                self.unknown_emails.pop(email)
+
+    def clear_unknown_emails(self):
+        with self._lock:
+            self._generation += 1
+            self._cleared_at = self._generation
+            self.unknown_emails.clear()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cleared_at = self._generation
+            self._evicted_at.clear()
+            self.principals.clear()
+            self.unknown_emails.clear()
+
+    def _current(self, key, generation):
+        # Called with the lock held
+        return self._cleared_at <= generation and self._evicted_at.get(key, 0) <= generation
+
+    def cached(self, user_id):
+        self._ensure_listening()
+        return self.principals.get(int(user_id))
+
+    def store(self, principal, generation):
+        """Cache a principal loaded after generation(); returns it"""
+        if principal is not None:
+            with self._lock:
+                if self._current(principal.user_id, generation):
+                    self.principals.put(principal.user_id, principal)
+        return principal
+
+    def get(self, user_id):
+        """Principal for a user id, loading it on a miss; None if the user
+        does not exist"""
+        principal = self.cached(user_id)
+        if principal is None:
+            generation = self.generation()
+            db = SessionLocal()
+            try:
+                principal = self.store(load_principal(db, int(user_id)), generation)
+            finally:
+                db.close()
+        return principal
+
+    def is_unknown_email(self, email):
+        self._ensure_listening()
+        return self.unknown_emails.get(email) is not None
+
+    def remember_unknown_email(self, email, generation):
+        """Cache an email found to have no account after generation()"""
+        with self._lock:
+            if self._current(email, generation):
+                self.unknown_emails.put(email, True)
+
+def load_principal(db, user_id):
+    # User ids are unique across tenants; the caller checks the tenant
+    row = db.execute(
+        select(User.id, User.role, User.is_active, User.tenant_id)
+        .where(User.id == user_id)
+        .execution_options(**{ALL_TENANTS: True})
+    ).first()
+    return Principal(row[0], row[1], bool(row[2]), row[3]) if row is not None else None
+
+principal_cache = PrincipalCache()
+
+def notify_users_created(cursor):
+    """Forget every unknown email, in all processes, once the caller's
+    transaction commits; for bulk inserts that bypass the ORM"""
+    cursor.execute("SELECT pg_notify(%s, %s)", (PRINCIPAL_CHANNEL, json.dumps({'all_emails': True})))
+
+# Publish principal changes from any session that flushes them. NOTIFY is
+# transactional, so other processes only evict once the change commits;
+# this process evicts on its own commit without waiting for the echo.
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _collect_principal_changes(session, flush_context):
+    user_ids, emails = set(), set()
+    for obj in session.new:
+        if isinstance(obj, User):
+            emails.add(obj.email)
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if state.attrs.role.history.has_changes() or state.attrs.is_active.history.has_changes():
+                user_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+    if user_ids or emails:
+        _publish_changes(session, user_ids, emails)
+
+def publish_users_deleted(session, user_ids):
+    """Evict users removed through session by a bulk DELETE, which the
+    flush hook does not see"""
+    if user_ids:
+        _publish_changes(session, set(user_ids), set())
+
+def _publish_changes(session, user_ids, emails):
+    # users live in the directory database, where the listener is
+    session.connection(bind_arguments={'mapper': User}).execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {'channel': PRINCIPAL_CHANNEL,
+         'payload': json.dumps({'user_ids': sorted(user_ids), 'emails': sorted(emails)})}
+    )
+    pending = session.info.setdefault('principal_changes', (set(), set()))
+    pending[0].update(user_ids)
+    pending[1].update(emails)
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _evict_committed(session):
+    user_ids, emails = session.info.pop('principal_changes', ((), ()))
+    if user_ids or emails:
+        principal_cache.evict(user_ids, emails)
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('principal_changes', None)
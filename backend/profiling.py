@@ -0,0 +1,276 @@
+"""On-demand profiling for production processes.
+
+Nothing here runs unless PROFILE_SECRET is set; without it the request
+hooks are not even installed.
+
+Request profiles: a request carrying a valid X-Profile-Token header
+(issued to operators by POST /debug/profile/token, signed with
+PROFILE_SECRET and short-lived) runs under cProfile, and every SQL
+statement it executes is timed. The profile is stored in profiles with
+a summary, the pstats dump and the SQL trace, and its id is returned in
+the X-Profile-Id response header. Statement parameters are not recorded.
+
+Sampling sessions: a background thread samples the stack of every
+thread in the process at a fixed interval for a bounded time and stores
+the result as folded stacks ("frame;frame;frame count" lines), which
+flamegraph.pl, speedscope and inferno read directly. Sampling is wall
+clock, so threads blocked on I/O or locks show up too. A session covers
+the process that started it, not the other workers.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import Profile, SessionLocal
+
+PROFILE_SECRET = os.getenv('PROFILE_SECRET')
+PROFILING_ENABLED = bool(PROFILE_SECRET)
+PROFILE_HEADER = 'X-Profile-Token'
+SUMMARY_LINES = 40
+MAX_STATEMENT_LENGTH = 2000
+MAX_TRACED_STATEMENTS = 1000
+
+# Request tokens
+
+def _signature(payload):
+    return hmac.new(PROFILE_SECRET.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def issue_token(user_id, minutes):
+    """Token that gets requests profiled for the next `minutes`; returns
+    (token, expires_at)"""
+    expires = int(time.time() + minutes * 60)
+    payload = f"{expires}.{user_id}"
+    return f"{payload}.{_signature(payload)}", datetime.utcfromtimestamp(expires)
+
+def verify_token(token):
+    """User id the token was issued to, or None if it is forged or expired"""
+    try:
+        expires, user_id, signature = token.split('.')
+        # As bytes: compare_digest rejects non-ASCII str with a TypeError
+        if not hmac.compare_digest(signature.encode('utf-8'), _signature(f"{expires}.{user_id}").encode('ascii')):
+            return None
+        if int(expires) < time.time():
+            return None
+        return int(user_id)
+    except ValueError:
+        return None
+
+# SQL trace: the listeners go in with the first profiled request, and
+# only record while a request profile is active in this context
+
+_sql_trace = ContextVar('sql_trace', default=None)
+_sql_trace_installed = False
+_install_lock = threading.Lock()
+
+# The start time goes on the statement's execution context, which is
+# dropped with it, so a statement that raises leaves nothing behind on
+# the pooled connection
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _sql_trace.get() is not None and context is not None:
+        context._profile_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _sql_trace.get()
+    started = getattr(context, '_profile_start', None)
+    if trace is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if len(trace) < MAX_TRACED_STATEMENTS:
+        trace.append({
+            'statement': statement[:MAX_STATEMENT_LENGTH],
+            'ms': round(elapsed * 1000, 3),
+            'rows': cursor.rowcount,
+            'executemany': executemany
+        })
+
+def _install_sql_trace():
+    global _sql_trace_installed
+    if _sql_trace_installed:
+        return
+    with _install_lock:
+        if not _sql_trace_installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _sql_trace_installed = True
+
+def _store(profile):
+    db = SessionLocal()
+    try:
+        db.add(profile)
+        db.commit()
+        return profile.id
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Failed to store profile: {str(e)}")
+        return None
+    finally:
+        db.close()
+
+class RequestProfile:
+    """cProfile plus SQL trace of one request, on the request's thread"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.profiler = cProfile.Profile()
+        self.sql = []
+        self.running = False
+
+    def start(self):
+        _install_sql_trace()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler is active (on 3.12+ cProfile is process-wide)
+            return False
+        self.trace_token = _sql_trace.set(self.sql)
+        self.started = time.perf_counter()
+        self.running = True
+        return True
+
+    def stop(self):
+        if self.running:
+            self.profiler.disable()
+            _sql_trace.reset(self.trace_token)
+            self.duration_ms = (time.perf_counter() - self.started) * 1000
+            self.running = False
+
+    def finish(self, method, path, status_code):
+        """Stop and store the profile; returns its id"""
+        self.stop()
+        stats = pstats.Stats(self.profiler)
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        return _store(Profile(
+            kind='request', method=method, path=path, status_code=status_code,
+            duration_ms=round(self.duration_ms, 3), summary=summary.getvalue(),
+            stats=marshal.dumps(stats.stats), sql=self.sql, requested_by=self.user_id,
+            finished_at=datetime.utcnow()
+        ))
+
+# Flask hooks, installed by the debug blueprint when profiling is enabled
+
+def start_request_profile():
+    token = request.headers.get(PROFILE_HEADER)
+    if token is None:
+        return
+    user_id = verify_token(token)
+    if user_id is None:
+        return
+    profile = RequestProfile(user_id)
+    if profile.start():
+        g.request_profile = profile
+
+def finish_request_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile_id = profile.finish(request.method, request.path, response.status_code)
+        if profile_id is not None:
+            response.headers['X-Profile-Id'] = str(profile_id)
+    return response
+
+def abandon_request_profile(exc):
+    # The request failed before after_request ran
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop()
+
+# Sampling sessions
+
+_labels = {}
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+def fold(frame, thread_name):
+    """The stack ending at frame as one folded line, outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ';'.join(reversed(stack))
+
+class SamplingSession(threading.Thread):
+    def __init__(self, profile_id, seconds, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.profile_id = profile_id
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def run(self):
+        try:
+            started = time.monotonic()
+            deadline = started + self.seconds
+            own = threading.get_ident()
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own:
+                        self.stacks[fold(frame, names.get(thread_id, f"thread-{thread_id}"))] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+            self._save((time.monotonic() - started) * 1000)
+        finally:
+            _end_session(self)
+
+    def _save(self, duration_ms):
+        db = SessionLocal()
+        try:
+            profile = db.get(Profile, self.profile_id)
+            profile.folded = '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+            profile.samples = self.samples
+            profile.duration_ms = round(duration_ms, 3)
+            profile.finished_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Failed to store sampling session {self.profile_id}: {str(e)}")
+        finally:
+            db.close()
+
+_session = None
+_session_lock = threading.Lock()
+
+def _end_session(session):
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+
+def start_sampling(seconds, interval_ms, user_id):
+    """Start sampling this process; returns the profile id, or None while
+    another session is running here"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            return None
+        profile_id = _store(Profile(kind='sampling', requested_by=user_id))
+        if profile_id is None:
+            return None
+        _session = SamplingSession(profile_id, seconds, interval_ms / 1000)
+        _session.start()
+        return profile_id
+
+def running_session():
+    """Profile id of this process's running sampling session, if any"""
+    session = _session
+    return session.profile_id if session is not None else None
@@ -0,0 +1,357 @@
+"""Report jobs: participant lists, staff rosters and compliance status.
+
+A report request is stored as a report_jobs row and built by the report
+worker, never by the API process: the worker claims queued jobs (FOR
+UPDATE SKIP LOCKED, so several workers can run side by side) and builds
+each one in a process pool, streaming rows from a server-side cursor
+straight into the CSV or XLSX file. Artifacts are stored under
+REPORT_FILES_DIR named by the sha256 of their content.
+
+Requests are identified by a hash of their normalised parameters: while a
+job for the same request is queued or running, or its artifact is less
+than REPORT_TTL_HOURS old, the same request gets that job back.
+
+    cd backend && python -m reports
+"""
+import csv
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+import msgspec
+from sqlalchemy import or_, select, update
+from models import AutomationLog, Booking, Participant, ReportJob, Staff, SessionLocal
+from pii import decrypt_rows
+from roster_service import WEEK, to_local, to_utc, week_of_date
+from schemas import ReportRequest
+from serializers import user_emails
+from tenancy import ALL_TENANTS, placement_databases, tenant_context
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    # openpyxl is optional - without it only CSV reports can be requested
+    Workbook = None
+
+REPORT_FILES_DIR = os.getenv('REPORT_FILES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_files'))
+REPORT_TTL_HOURS = float(os.getenv('REPORT_TTL_HOURS', '24'))
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))
+REPORT_POLL_SECONDS = float(os.getenv('REPORT_POLL_SECONDS', '2'))
+# A job running longer than this is assumed lost with its worker and is
+# claimed again
+REPORT_TIMEOUT_SECONDS = float(os.getenv('REPORT_TIMEOUT_SECONDS', '3600'))
+# Rows fetched per round trip from the server-side cursor
+FETCH_ROWS = 2000
+PRUNE_SECONDS = 300
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = 'queued', 'running', 'done', 'failed', 'expired'
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def supports_format(fmt):
+    return fmt == 'csv' or Workbook is not None
+
+def request_params(report):
+    """The request as plain JSON-able data, as stored on its job"""
+    return msgspec.to_builtins(report)
+
+def request_hash(report):
+    """sha256 of the normalised request; equal requests hash equally
+    whatever order their fields were sent in"""
+    return hashlib.sha256(msgspec.json.encode(request_params(report), order='sorted')).hexdigest()
+
+def artifact_path(tenant_id, content_hash, fmt):
+    return os.path.join(REPORT_FILES_DIR, str(tenant_id), f"{content_hash}.{fmt}")
+
+# Report definitions: the column headers and a generator of rows. Each
+# streams its query, so memory stays flat however many rows there are.
+
+def _stream(db, statement):
+    return db.execute(statement.execution_options(yield_per=FETCH_ROWS))
+
+def participant_rows(db, report):
+    statement = select(
+        Participant.id, Participant.first_name, Participant.last_name, Participant.email,
+        Participant.phone, Participant.ndis_number, Participant.status, Participant.created_at
+    ).order_by(Participant.last_name, Participant.first_name, Participant.id)
+    if report.status is not None:
+        statement = statement.where(Participant.status == report.status)
+    # Decrypted a fetch at a time, so each batch costs one key lookup
+    for rows in _stream(db, statement).partitions():
+        yield from decrypt_rows(db, rows, [(3, 'email'), (4, 'phone')])
+
+def staff_roster_rows(db, report):
+    week_start = week_of_date(report.week_start)
+    statement = select(
+        Booking.id, Booking.starts_at, Booking.ends_at, Booking.participant_id,
+        Participant.first_name, Participant.last_name, Booking.staff_id,
+        Staff.first_name, Staff.last_name, Booking.status, Booking.required_qualifications
+    ).join(Participant, Participant.id == Booking.participant_id).outerjoin(
+        Staff, Staff.id == Booking.staff_id
+    ).where(
+        Booking.starts_at >= to_utc(week_start),
+        Booking.starts_at < to_utc(week_start + WEEK),
+        Booking.status != 'cancelled'
+    ).order_by(Booking.starts_at, Booking.id)
+    for (booking_id, starts_at, ends_at, participant_id, participant_first, participant_last,
+         staff_id, staff_first, staff_last, status, qualifications) in _stream(db, statement):
+        yield (
+            booking_id, to_local(starts_at), to_local(ends_at), participant_id,
+            f"{participant_first} {participant_last}", staff_id,
+            f"{staff_first} {staff_last}" if staff_id is not None else '',
+            status, ';'.join(qualifications or ())
+        )
+
+def _checklist_items():
+    from automation.workflows import STAFF_ONBOARDING
+    return STAFF_ONBOARDING.name, STAFF_ONBOARDING.steps['checklist'].params['items']
+
+def compliance_rows(db, report):
+    workflow_type, items = _checklist_items()
+    # Each staff member's latest onboarding run
+    onboarding = select(
+        AutomationLog.entity_id, AutomationLog.status, AutomationLog.details
+    ).where(
+        AutomationLog.workflow_type == workflow_type, AutomationLog.entity_type == 'staff'
+    ).distinct(AutomationLog.entity_id).order_by(
+        AutomationLog.entity_id, AutomationLog.created_at.desc()
+    ).subquery()
+    statement = select(
+        Staff.id, Staff.first_name, Staff.last_name, Staff.user_id, Staff.position, Staff.status,
+        onboarding.c.status, onboarding.c.details
+    ).outerjoin(
+        onboarding, onboarding.c.entity_id == Staff.id
+    ).order_by(Staff.last_name, Staff.first_name, Staff.id)
+    if report.staff_status is not None:
+        statement = statement.where(Staff.status == report.staff_status)
+    # users is in the main database, so each fetch's emails are looked up
+    # there in one query rather than joined
+    for rows in _stream(db, statement).partitions():
+        emails = user_emails(db, [row[3] for row in rows])
+        for staff_id, first_name, last_name, user_id, position, status, run_status, details in rows:
+            if user_id not in emails:
+                continue
+            checklist = ((details or {}).get('steps', {}).get('checklist') or {}).get('output') or {}
+            done = {entry['item'] for entry in checklist.get('items', ()) if entry['done']}
+            outstanding = [item for item in items if item not in done]
+            yield (
+                staff_id, first_name, last_name, emails[user_id], position, status, run_status or 'not_started',
+                len(items) - len(outstanding), len(items), not outstanding,
+                *(item in done for item in items), '; '.join(outstanding)
+            )
+
+def _compliance_columns():
+    _, items = _checklist_items()
+    return ['staff_id', 'first_name', 'last_name', 'email', 'position', 'status', 'onboarding_status',
+            'items_done', 'items_total', 'compliant', *items, 'outstanding']
+
+# type -> (column headers, rows)
+REPORTS = {
+    'participants': (
+        lambda: ['id', 'first_name', 'last_name', 'email', 'phone', 'ndis_number', 'status', 'created_at'],
+        participant_rows
+    ),
+    'staff_roster': (
+        lambda: ['booking_id', 'starts_at', 'ends_at', 'participant_id', 'participant', 'staff_id',
+                 'staff', 'status', 'required_qualifications'],
+        staff_roster_rows
+    ),
+    'compliance': (_compliance_columns, compliance_rows),
+}
+
+def _write_csv(path, columns, rows):
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def _write_xlsx(path, columns, rows):
+    # Write-only mode streams rows out instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Report')
+    sheet.append(columns)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+WRITERS = {'csv': _write_csv, 'xlsx': _write_xlsx}
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_report(tenant_id, params):
+    """Build one report as tenant_id and store it by content hash; returns
+    (content_hash, row_count, byte_size). Runs in a pool process."""
+    report = msgspec.convert(params, ReportRequest)
+    fmt = report.format
+    columns, rows = REPORTS[params['type']]
+    directory = os.path.dirname(artifact_path(tenant_id, '', fmt))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=f".{fmt}.tmp")
+    os.close(fd)
+    try:
+        with tenant_context(tenant_id):
+            db = SessionLocal()
+            try:
+                row_count = WRITERS[fmt](temp_path, columns(), rows(db, report))
+            finally:
+                db.close()
+        content_hash = _file_hash(temp_path)
+        byte_size = os.path.getsize(temp_path)
+        # Same content, same name: replacing an existing copy changes nothing
+        os.replace(temp_path, artifact_path(tenant_id, content_hash, fmt))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return content_hash, row_count, byte_size
+
+def claim_jobs(db, limit, now=None):
+    """Mark up to limit queued (or abandoned) jobs running and return them
+    as (id, tenant_id, params, started_at); the caller commits"""
+    now = now or datetime.utcnow()
+    claimable = db.scalars(
+        select(ReportJob.id)
+        .where(or_(
+            ReportJob.status == QUEUED,
+            (ReportJob.status == RUNNING)
+            & (ReportJob.started_at < now - timedelta(seconds=REPORT_TIMEOUT_SECONDS))
+        ))
+        .order_by(ReportJob.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .execution_options(**{ALL_TENANTS: True})
+    ).all()
+    if not claimable:
+        return []
+    return db.execute(
+        update(ReportJob).where(ReportJob.id.in_(claimable))
+        .values(status=RUNNING, started_at=now)
+        .returning(ReportJob.id, ReportJob.tenant_id, ReportJob.params, ReportJob.started_at),
+        execution_options={ALL_TENANTS: True, 'synchronize_session': False}
+    ).all()
+
+def finish_job(db, job_id, started_at, result=None, error=None, now=None):
+    """Record a job's outcome: (content_hash, row_count, byte_size) or an
+    error message; the caller commits.
+
+    Only the claim that started the job at started_at may finish it: a
+    build that overran REPORT_TIMEOUT_SECONDS and was claimed again leaves
+    the job to the newer claim. Returns whether the outcome was recorded.
+    """
+    now = now or datetime.utcnow()
+    if error is not None:
+        values = {'status': FAILED, 'error': error}
+    else:
+        content_hash, row_count, byte_size = result
+        values = {'status': DONE, 'content_hash': content_hash, 'row_count': row_count,
+                  'byte_size': byte_size, 'expires_at': now + timedelta(hours=REPORT_TTL_HOURS)}
+    finished = db.execute(
+        update(ReportJob).where(
+            ReportJob.id == job_id, ReportJob.status == RUNNING, ReportJob.started_at == started_at
+        ).values(finished_at=now, **values),
+        execution_options={ALL_TENANTS: True, 'synchronize_session': False}
+    )
+    return finished.rowcount > 0
+
+def expire_reports(db, now=None):
+    """Mark jobs past their validity expired and delete the artifacts no
+    valid job still points at; commits"""
+    now = now or datetime.utcnow()
+    expired = db.execute(
+        update(ReportJob).where(ReportJob.status == DONE, ReportJob.expires_at <= now)
+        .values(status=EXPIRED)
+        .returning(ReportJob.tenant_id, ReportJob.content_hash, ReportJob.format),
+        execution_options={ALL_TENANTS: True, 'synchronize_session': False}
+    ).all()
+    # A later identical build may have produced the same file
+    kept = {tuple(row) for row in db.execute(
+        select(ReportJob.tenant_id, ReportJob.content_hash, ReportJob.format)
+        .where(ReportJob.status == DONE, ReportJob.content_hash.in_({row.content_hash for row in expired}))
+        .execution_options(**{ALL_TENANTS: True})
+    )} if expired else set()
+    db.commit()
+    for tenant_id, content_hash, fmt in {tuple(row) for row in expired} - kept:
+        try:
+            os.unlink(artifact_path(tenant_id, content_hash, fmt))
+        except FileNotFoundError:
+            pass
+    return len(expired)
+
+def _in_database(tenant_id, work):
+    """Run work(db) on the database tenant_id is placed in"""
+    with tenant_context(tenant_id):
+        db = SessionLocal()
+        try:
+            return work(db)
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Report worker failed (tenant {tenant_id}): {str(e)}")
+            return None
+        finally:
+            db.close()
+
+def _claim(db, limit):
+    jobs = claim_jobs(db, limit)
+    db.commit()
+    return jobs
+
+def _finish(db, job_id, started_at, result, error):
+    if not finish_job(db, job_id, started_at, result, error):
+        print(f"⚠️ Report job {job_id} was claimed again while building; result dropped")
+    db.commit()
+
+def run_worker(poll_seconds=REPORT_POLL_SECONDS):
+    """Build reports forever, REPORT_WORKERS at a time"""
+    print("📄 Report worker started")
+    databases = placement_databases()
+    running = {}
+    last_pruned = 0.0
+    # Fresh interpreters rather than forks, so no pool process inherits
+    # this one's database connections
+    with ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context('spawn')) as pool:
+        while True:
+            for database in databases:
+                free = REPORT_WORKERS - len(running)
+                if free <= 0:
+                    break
+                for job in _in_database(database, lambda db: _claim(db, free)) or ():
+                    running[pool.submit(build_report, job.tenant_id, job.params)] = (database, job.id, job.started_at)
+
+            if time.monotonic() - last_pruned >= PRUNE_SECONDS:
+                for database in databases:
+                    _in_database(database, expire_reports)
+                last_pruned = time.monotonic()
+
+            if not running:
+                time.sleep(poll_seconds)
+                continue
+            finished, _ = wait(running, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            for future in finished:
+                database, job_id, started_at = running.pop(future)
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, str(e) or type(e).__name__
+                _in_database(database, lambda db: _finish(db, job_id, started_at, result, error))
+
+if __name__ == '__main__':
+    # Go through the package module, so pool processes can find
+    # build_report by name
+    from reports import run_worker as worker
+    worker()
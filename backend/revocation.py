@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from models import RevokedToken, UserTokenRevocation, SessionLocal
+from pg_listener import get_listener
+
+REVOCATION_CHANNEL = 'ndis_token_revocations'
+# Longest lifetime of any token we issue (flask_jwt_extended's refresh
+# token default); user cutoffs older than this can no longer match
+MAX_TOKEN_LIFETIME = timedelta(days=30)
+PRUNE_INTERVAL = 60
+
+def _epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+class Denylist:
+    """Process-local copy of the revocation store.
+
+    Holds revoked jtis (jti -> expiry) and per-user cutoffs (user id ->
+    revoked_before), loaded once from Postgres and kept current through
+    NOTIFY, so checking a token is a couple of dict lookups.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._jtis = {}
+        self._user_cutoffs = {}
+        self._loaded = False
+        self._next_prune = 0.0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            listener = get_listener()
+            # Revocations published while disconnected were missed
+            listener.on_reconnect.append(self.reload)
+            # Loaded only once the LISTEN is in place, so a revocation
+            # lands in the load or in a notification; if the database is
+            # unreachable the reconnect reloads
+            listener.listen(REVOCATION_CHANNEL, self._on_notify)
+            self.reload()
+            self._loaded = True
+
+    def reload(self):
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            jtis = db.execute(
+                select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > now)
+            ).all()
+            cutoffs = db.execute(
+                select(UserTokenRevocation.user_id, UserTokenRevocation.revoked_before)
+                .where(UserTokenRevocation.revoked_before > now - MAX_TOKEN_LIFETIME)
+            ).all()
+        finally:
+            db.close()
+        for jti, expires_at in jtis:
+            self.add_jti(jti, _epoch(expires_at))
+        for user_id, revoked_before in cutoffs:
+            self.add_user_cutoff(user_id, _epoch(revoked_before))
+
+    def _on_notify(self, payload):
+        message = json.loads(payload)
+        if 'jti' in message:
+            self.add_jti(message['jti'], message['exp'])
+        else:
+            self.add_user_cutoff(message['user_id'], message['before'])
+
+    def add_jti(self, jti, expires_at):
+        with self._lock:
+            self._jtis[jti] = expires_at
+
+    def add_user_cutoff(self, user_id, revoked_before):
+        user_id = str(user_id)
+        with self._lock:
+            if revoked_before > self._user_cutoffs.get(user_id, 0):
+                self._user_cutoffs[user_id] = revoked_before
+
+    def _prune(self, now):
+        with self._lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + PRUNE_INTERVAL
+            oldest = now - MAX_TOKEN_LIFETIME.total_seconds()
+            self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+            self._user_cutoffs = {
+                user_id: before for user_id, before in self._user_cutoffs.items() if before > oldest
+            }
+
+    def is_revoked(self, claims):
+        """Check decoded JWT claims without touching the database"""
+        self._ensure_loaded()
+        now = time.time()
+        if now >= self._next_prune:
+            self._prune(now)
+        jtis = self._jtis
+        if claims.get('jti') in jtis or claims.get('sid') in jtis:
+            return True
+        cutoff = self._user_cutoffs.get(str(claims.get('sub')))
+        # iat has whole-second resolution, so a token issued in the same
+        # second as the revocation is treated as revoked too
+        return cutoff is not None and claims.get('iat', 0) <= cutoff
+
+def _notify(db, message):
+    # On the directory database with the revocation rows, where the
+    # listener is, whatever the tenant's placement
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {'channel': REVOCATION_CHANNEL, 'payload': json.dumps(message)},
+        bind_arguments={'mapper': RevokedToken}
+    )
+
+def revoke_token(db, jti, expires_at, user_id=None):
+    """Revoke a single token (or session id) in the caller's transaction;
+    every process sees it once the transaction commits"""
+    db.execute(insert(RevokedToken).values(
+        jti=jti, user_id=user_id, expires_at=expires_at, revoked_at=datetime.utcnow()
+    ).on_conflict_do_nothing())
+    _notify(db, {'jti': jti, 'exp': _epoch(expires_at)})
+
+def revoke_user_tokens(db, user_id):
+    """Revoke every token issued to a user up to now"""
+    now = datetime.utcnow()
+    statement = insert(UserTokenRevocation).values(user_id=user_id, revoked_before=now)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[UserTokenRevocation.user_id],
+        set_={'revoked_before': now}
+    ))
+    _notify(db, {'user_id': str(user_id), 'before': _epoch(now)})
+
+denylist = Denylist()
+is_revoked = denylist.is_revoked
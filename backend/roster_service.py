@@ -0,0 +1,177 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import select, text
+from models import Booking, Staff, StaffAvailability, StaffQualification
+from rostering import Booking as RosterBooking, Roster, Worker
+from serializers import RowEncoder
+from tenancy import current_tenant_id
+from bulk_copy import copy_rows
+
+WEEK = timedelta(days=7)
+# Availability is entered in local time; bookings are stored in UTC
+ROSTER_TIMEZONE = ZoneInfo(os.getenv('ROSTER_TIMEZONE', 'Australia/Sydney'))
+
+booking_encoder = RowEncoder([
+    ('id', Booking.id),
+    ('participant_id', Booking.participant_id),
+    ('starts_at', Booking.starts_at),
+    ('ends_at', Booking.ends_at),
+    ('required_qualifications', Booking.required_qualifications),
+    ('staff_id', Booking.staff_id),
+    ('status', Booking.status),
+    ('notes', Booking.notes),
+])
+
+def to_local(value):
+    """Naive UTC -> naive roster-local time"""
+    return value.replace(tzinfo=timezone.utc).astimezone(ROSTER_TIMEZONE).replace(tzinfo=None)
+
+def to_utc(value):
+    """Naive roster-local -> naive UTC time"""
+    return value.replace(tzinfo=ROSTER_TIMEZONE).astimezone(timezone.utc).replace(tzinfo=None)
+
+def week_start_of(value):
+    """Local Monday 00:00 of the week containing the (UTC) timestamp"""
+    local = to_local(value)
+    day = datetime(local.year, local.month, local.day)
+    return day - timedelta(days=day.weekday())
+
+def week_of_date(day):
+    """Local Monday 00:00 of the week containing a calendar date"""
+    return datetime(day.year, day.month, day.day) - timedelta(days=day.weekday())
+
+def _minutes(week_start, value):
+    return int((to_local(value) - week_start).total_seconds() // 60)
+
+def _merge(windows):
+    """Merge overlapping or touching availability windows"""
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def load_workers(db):
+    """Active staff with their weekly availability and qualifications"""
+    qualifications = defaultdict(list)
+    # Joined to staff so only the current tenant's rows are read
+    for staff_id, qualification in db.execute(
+        select(StaffQualification.staff_id, StaffQualification.qualification)
+        .join(Staff, Staff.id == StaffQualification.staff_id)
+    ):
+        qualifications[staff_id].append(qualification)
+
+    availability = defaultdict(list)
+    for staff_id, weekday, start, end in db.execute(select(
+        StaffAvailability.staff_id, StaffAvailability.weekday,
+        StaffAvailability.start_minute, StaffAvailability.end_minute
+    ).join(Staff, Staff.id == StaffAvailability.staff_id)):
+        availability[staff_id].append((weekday * 1440 + start, weekday * 1440 + end))
+
+    return [
+        Worker(staff_id, qualifications[staff_id], _merge(availability[staff_id]),
+               (max_hours if max_hours is not None else 38) * 60)
+        for staff_id, max_hours in db.execute(
+            select(Staff.id, Staff.max_weekly_hours).where(Staff.status == 'active')
+        )
+    ]
+
+def _roster_booking(week_start, row):
+    booking_id, participant_id, starts_at, ends_at, required, staff_id = row
+    return RosterBooking(booking_id, participant_id, _minutes(week_start, starts_at),
+                         _minutes(week_start, ends_at), required or (), staff_id)
+
+def load_bookings(db, week_start, exclude_id=None):
+    """Uncancelled bookings starting in the (local) week, as solver bookings"""
+    statement = select(
+        Booking.id, Booking.participant_id, Booking.starts_at, Booking.ends_at,
+        Booking.required_qualifications, Booking.staff_id
+    ).where(
+        Booking.starts_at >= to_utc(week_start),
+        Booking.starts_at < to_utc(week_start + WEEK),
+        Booking.status != 'cancelled'
+    )
+    if exclude_id is not None:
+        statement = statement.where(Booking.id != exclude_id)
+    return [_roster_booking(week_start, row) for row in db.execute(statement)]
+
+def lock_week(db, *week_starts):
+    """Hold the current tenant's (local) weeks until the transaction ends.
+
+    Solving reads the week's bookings and writes back assignments made
+    against that read, so two solves of the same week must not overlap or
+    both can hand one worker overlapping bookings. Several weeks are
+    locked in date order, so two callers cannot deadlock on them.
+    """
+    tenant_id = current_tenant_id()
+    for week_start in sorted(set(week_starts)):
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+            {'key': f"roster:{tenant_id}:{week_start.date().isoformat()}"}
+        )
+
+def save_assignments(db, bookings):
+    """Write solver assignments back in one statement.
+
+    Rows are COPYed into a temp table and applied with a single
+    UPDATE ... FROM rather than one UPDATE per booking.
+    """
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS roster_assignments "
+            "(booking_id INTEGER PRIMARY KEY, staff_id INTEGER) ON COMMIT DELETE ROWS"
+        )
+        cursor.execute("TRUNCATE roster_assignments")
+        copy_rows(cursor, 'roster_assignments', ('booking_id', 'staff_id'),
+                  ((booking.id, booking.staff_id) for booking in bookings))
+        cursor.execute("""
+            UPDATE bookings b
+            SET staff_id = a.staff_id,
+                status = CASE WHEN a.staff_id IS NULL THEN 'open' ELSE 'assigned' END,
+                updated_at = NOW()
+            FROM roster_assignments a
+            WHERE b.id = a.booking_id AND b.staff_id IS DISTINCT FROM a.staff_id
+        """)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def solve_week(db, week_start, time_limit=None):
+    """Roster every open booking in the week; existing valid assignments
+    are kept. The caller commits."""
+    lock_week(db, week_start)
+    roster = Roster(load_workers(db), load_bookings(db, week_start))
+    kwargs = {'time_limit': time_limit} if time_limit is not None else {}
+    unassigned = roster.solve(**kwargs)
+    changed = save_assignments(db, roster.bookings.values())
+    return {
+        'week_start': week_start.date().isoformat(),
+        'bookings': len(roster.bookings),
+        'assigned': len(roster.bookings) - len(unassigned),
+        'unassigned': sorted(unassigned),
+        'changed': changed
+    }
+
+def reassign_booking(db, booking):
+    """Incremental re-solve for one created or changed booking (flushed,
+    not yet committed). Returns the ids of bookings whose worker changed."""
+    if booking.status == 'cancelled':
+        booking.staff_id = None
+        return [booking.id]
+
+    week_start = week_start_of(booking.starts_at)
+    lock_week(db, week_start)
+    roster = Roster(load_workers(db), load_bookings(db, week_start, exclude_id=booking.id))
+    target = _roster_booking(week_start, (
+        booking.id, booking.participant_id, booking.starts_at, booking.ends_at,
+        booking.required_qualifications, booking.staff_id
+    ))
+    changed = roster.upsert_booking(target)
+    save_assignments(db, changed)
+    db.expire(booking)
+    return [b.id for b in changed]
@@ -0,0 +1,264 @@
+"""Shift rostering engine.
+
+Times are minutes from the start of the rostered week (Monday 00:00), so
+the solver only does integer arithmetic. Loading from and saving to the
+database lives in roster_service.py.
+"""
+import time
+from bisect import bisect_right
+from collections import defaultdict
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+BUCKET_MINUTES = 60
+# Travel time a worker needs between two bookings
+MIN_GAP_MINUTES = 15
+LOCAL_SEARCH_SECONDS = 2.0
+
+class Booking:
+    __slots__ = ('id', 'participant_id', 'start', 'end', 'required', 'staff_id')
+
+    def __init__(self, id, participant_id, start, end, required=(), staff_id=None):
+        self.id = id
+        self.participant_id = participant_id
+        self.start = start
+        self.end = end
+        self.required = frozenset(required)
+        self.staff_id = staff_id
+
+    @property
+    def minutes(self):
+        return self.end - self.start
+
+class Worker:
+    __slots__ = ('id', 'qualifications', 'availability', 'max_minutes')
+
+    def __init__(self, id, qualifications=(), availability=(), max_minutes=38 * 60):
+        self.id = id
+        self.qualifications = frozenset(qualifications)
+        # Non-overlapping (start, end) windows in week minutes
+        self.availability = sorted(availability)
+        self.max_minutes = max_minutes
+
+    def can_take(self, booking):
+        """Qualified and available for the whole booking"""
+        if not booking.required <= self.qualifications:
+            return False
+        i = bisect_right(self.availability, (booking.start, float('inf')))
+        return i > 0 and self.availability[i - 1][1] >= booking.end
+
+class AvailabilityIndex:
+    """Bucketed interval index over worker availability.
+
+    Every availability window is filed under each hour bucket it touches,
+    so the workers whose window covers [start, end) are found by scanning
+    the one bucket holding `start` instead of every worker.
+    """
+
+    def __init__(self, workers, bucket_minutes=BUCKET_MINUTES):
+        self.bucket_minutes = bucket_minutes
+        self.buckets = defaultdict(list)
+        for worker in workers:
+            for start, end in worker.availability:
+                for bucket in range(start // bucket_minutes, (end - 1) // bucket_minutes + 1):
+                    self.buckets[bucket].append((start, end, worker))
+
+    def covering(self, start, end, required=frozenset()):
+        """Workers holding `required` with one window covering [start, end)"""
+        return [
+            worker for window_start, window_end, worker in self.buckets.get(start // self.bucket_minutes, ())
+            if window_start <= start and window_end >= end and required <= worker.qualifications
+        ]
+
+class Schedule:
+    """One worker's assigned bookings, kept sorted for bisect overlap checks"""
+
+    __slots__ = ('worker', 'starts', 'bookings', 'minutes')
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.starts = []
+        self.bookings = []
+        self.minutes = 0
+
+    def conflicts(self, start, end, gap=MIN_GAP_MINUTES):
+        """Assigned bookings that overlap [start, end) including travel gap"""
+        i = bisect_right(self.starts, end + gap - 1)
+        found = []
+        while i > 0:
+            i -= 1
+            booking = self.bookings[i]
+            if booking.end + gap <= start:
+                # Assigned bookings never overlap each other, so nothing
+                # earlier can reach start either
+                break
+            found.append(booking)
+        return found
+
+    def add(self, booking):
+        i = bisect_right(self.starts, booking.start)
+        self.starts.insert(i, booking.start)
+        self.bookings.insert(i, booking)
+        self.minutes += booking.minutes
+
+    def remove(self, booking):
+        i = self.bookings.index(booking)
+        del self.starts[i]
+        del self.bookings[i]
+        self.minutes -= booking.minutes
+
+class Roster:
+    """Assignment state for one week plus the solver operating on it"""
+
+    def __init__(self, workers, bookings):
+        self.workers = {worker.id: worker for worker in workers}
+        self.bookings = {booking.id: booking for booking in bookings}
+        self.index = AvailabilityIndex(workers)
+        self.schedules = {worker.id: Schedule(worker) for worker in workers}
+        # participant -> {staff_id: bookings together}, for continuity of care
+        self.continuity = defaultdict(lambda: defaultdict(int))
+        self._candidates = {}
+
+        # Keep existing assignments that are still valid
+        for booking in bookings:
+            staff_id, booking.staff_id = booking.staff_id, None
+            worker = self.workers.get(staff_id)
+            if worker is not None and worker.can_take(booking) and self._fits(booking, self.schedules[staff_id]):
+                self.assign(booking, worker)
+
+    def candidates(self, booking):
+        """Schedules of every worker who could take the booking (cached)"""
+        cached = self._candidates.get(booking.id)
+        if cached is None:
+            schedules = self.schedules
+            cached = self._candidates[booking.id] = [
+                schedules[worker.id] for worker in self.index.covering(booking.start, booking.end, booking.required)
+            ]
+        return cached
+
+    def _fits(self, booking, schedule, ignore=None):
+        minutes = schedule.minutes - (ignore.minutes if ignore is not None else 0)
+        if minutes + booking.minutes > schedule.worker.max_minutes:
+            return False
+        conflicts = schedule.conflicts(booking.start, booking.end)
+        return not conflicts or conflicts == [ignore]
+
+    def assign(self, booking, worker):
+        booking.staff_id = worker.id
+        self.schedules[worker.id].add(booking)
+        self.continuity[booking.participant_id][worker.id] += 1
+
+    def unassign(self, booking):
+        if booking.staff_id is None:
+            return
+        self.schedules[booking.staff_id].remove(booking)
+        self.continuity[booking.participant_id][booking.staff_id] -= 1
+        booking.staff_id = None
+
+    def _least_loaded(self, booking, schedules, exclude=None):
+        best, best_minutes = None, None
+        for schedule in schedules:
+            minutes = schedule.minutes
+            # Comparing load is cheap; only check feasibility for an improvement
+            if (best is None or minutes < best_minutes) and schedule.worker.id != exclude \
+                    and self._fits(booking, schedule):
+                best, best_minutes = schedule, minutes
+        return best
+
+    def _best_worker(self, booking, exclude=None):
+        """Feasible worker preferring one the participant already knows,
+        then the least loaded"""
+        known = self.continuity.get(booking.participant_id)
+        if known:
+            familiar = [
+                self.schedules[staff_id] for staff_id, count in known.items()
+                if count and self.workers[staff_id].can_take(booking)
+            ]
+            best = self._least_loaded(booking, familiar, exclude)
+            if best is not None:
+                return best.worker
+        best = self._least_loaded(booking, self.candidates(booking), exclude)
+        return best.worker if best is not None else None
+
+    def _place(self, booking):
+        worker = self._best_worker(booking)
+        if worker is not None:
+            self.assign(booking, worker)
+            return True
+        return self._eject(booking)
+
+    def _eject(self, booking):
+        """One-step ejection: give booking to a worker after moving the
+        single booking blocking them to someone else"""
+        for schedule in self.candidates(booking):
+            conflicts = schedule.conflicts(booking.start, booking.end)
+            if len(conflicts) != 1:
+                continue
+            blocker = conflicts[0]
+            if not self._fits(booking, schedule, ignore=blocker):
+                continue
+            worker = schedule.worker
+            self.unassign(blocker)
+            replacement = self._best_worker(blocker, exclude=worker.id)
+            if replacement is not None:
+                self.assign(blocker, replacement)
+                self.assign(booking, worker)
+                return True
+            self.assign(blocker, worker)
+        return False
+
+    def solve(self, time_limit=LOCAL_SEARCH_SECONDS):
+        """Fill every unassigned booking: greedy, hardest first, then a
+        time-boxed local search over what is left. Returns unassigned ids."""
+        open_bookings = [booking for booking in self.bookings.values() if booking.staff_id is None]
+        # Fewest candidates first, longest first among equals
+        open_bookings.sort(key=lambda booking: (len(self.candidates(booking)), -booking.minutes))
+
+        unassigned = []
+        for booking in open_bookings:
+            worker = self._best_worker(booking)
+            if worker is None:
+                unassigned.append(booking)
+            else:
+                self.assign(booking, worker)
+
+        deadline = time.perf_counter() + time_limit
+        remaining = []
+        for booking in unassigned:
+            if time.perf_counter() > deadline or not self._eject(booking):
+                remaining.append(booking)
+        return [booking.id for booking in remaining]
+
+    def upsert_booking(self, booking):
+        """Incremental re-solve after one booking was added or changed.
+
+        The booking keeps its worker if they can still take it. Otherwise
+        only that booking is placed again; every other assignment stays as it
+        is unless a single ejection move is needed to fit it in. Returns
+        the bookings whose worker changed.
+        """
+        before = {b.id: b.staff_id for b in self.bookings.values()}
+        existing = self.bookings.get(booking.id)
+        if existing is not None:
+            before[booking.id] = existing.staff_id
+            self.unassign(existing)
+        else:
+            # Not loaded into the roster: its stored worker is the previous one
+            before[booking.id] = booking.staff_id
+        previous = self.workers.get(before[booking.id])
+        booking.staff_id = None
+        self.bookings[booking.id] = booking
+        self._candidates.pop(booking.id, None)
+
+        if previous is not None and previous.can_take(booking) \
+                and self._fits(booking, self.schedules[previous.id]):
+            # The change still fits the current worker - keep them
+            self.assign(booking, previous)
+        else:
+            self._place(booking)
+        return [b for b in self.bookings.values() if before.get(b.id) != b.staff_id]
+
+    def remove_booking(self, booking_id):
+        booking = self.bookings.pop(booking_id, None)
+        if booking is not None:
+            self.unassign(booking)
+            self._candidates.pop(booking_id, None)
@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import DBAPIError
+from middleware.security import require_role
+from middleware.compression import compress_response
+from db_routing import read_session
+from log_queries import (AUTOMATION, DEFAULT_LIMIT, SECURITY, default_range, find_automation_logs,
+                         find_security_logs, hourly_counts)
+
+admin_bp = Blueprint('admin', __name__)
+admin_bp.after_request(compress_response)
+
+def _datetime_arg(name):
+    """Naive UTC datetime from an ISO 8601 query arg, or None if absent;
+    values without an offset are taken as UTC"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def _time_range():
+    try:
+        return _datetime_arg('since'), _datetime_arg('until')
+    except ValueError:
+        return None
+
+def _run(query, *args, **kwargs):
+    """Run a log query on a read session; returns (result, error response)"""
+    db = read_session()
+    try:
+        return query(db, *args, **kwargs), None
+    except DBAPIError as e:
+        # A malformed jsonpath, or a filter combination that hit the
+        # statement timeout
+        return None, (jsonify({'error': 'Query rejected', 'detail': str(e.orig).strip()}), 400)
+    finally:
+        db.close()
+
+@admin_bp.route('/automation-logs', methods=['GET'])
+@require_role('admin')
+def get_automation_logs():
+    """Workflow runs, newest first. Filters: workflow_type, entity_type,
+    entity_id, status, since/until (ISO 8601), details_path (jsonpath);
+    page with limit and the previous response's next_cursor"""
+    time_range = _time_range()
+    if time_range is None:
+        return jsonify({'error': 'since and until must be ISO 8601 datetimes'}), 400
+    since, until = time_range
+    result, error = _run(
+        find_automation_logs,
+        workflow_type=request.args.get('workflow_type'),
+        entity_type=request.args.get('entity_type'),
+        entity_id=request.args.get('entity_id', type=int),
+        status=request.args.get('status'),
+        since=since,
+        until=until,
+        details_path=request.args.get('details_path'),
+        limit=request.args.get('limit', DEFAULT_LIMIT, type=int),
+        cursor=request.args.get('cursor')
+    )
+    if error:
+        return error
+    logs, next_cursor = result
+    return jsonify({'logs': logs, 'next_cursor': next_cursor})
+
+@admin_bp.route('/security-logs', methods=['GET'])
+@require_role('admin')
+def get_security_logs():
+    """Security events, newest first. Filters: event_type, user_id,
+    since/until (ISO 8601); page with limit and next_cursor"""
+    time_range = _time_range()
+    if time_range is None:
+        return jsonify({'error': 'since and until must be ISO 8601 datetimes'}), 400
+    since, until = time_range
+    result, error = _run(
+        find_security_logs,
+        event_type=request.args.get('event_type'),
+        user_id=request.args.get('user_id', type=int),
+        since=since,
+        until=until,
+        limit=request.args.get('limit', DEFAULT_LIMIT, type=int),
+        cursor=request.args.get('cursor')
+    )
+    if error:
+        return error
+    logs, next_cursor = result
+    return jsonify({'logs': logs, 'next_cursor': next_cursor})
+
+def _hourly(source, label_prefix):
+    time_range = _time_range()
+    if time_range is None:
+        return jsonify({'error': 'since and until must be ISO 8601 datetimes'}), 400
+    since, until = default_range(*time_range)
+    counts, error = _run(hourly_counts, source, since, until, label_prefix)
+    if error:
+        return error
+    return jsonify({'since': since.isoformat(), 'until': until.isoformat(), 'counts': counts})
+
+@admin_bp.route('/automation-logs/hourly', methods=['GET'])
+@require_role('admin')
+def get_automation_hourly():
+    """Runs started, completed and failed per hour, labelled
+    <workflow_type>.<event>; defaults to the last 24 hours"""
+    return _hourly(AUTOMATION, request.args.get('workflow_type'))
+
+@admin_bp.route('/security-logs/hourly', methods=['GET'])
+@require_role('admin')
+def get_security_hourly():
+    """Security events per hour and event type; defaults to the last 24 hours"""
+    return _hourly(SECURITY, request.args.get('event_type'))
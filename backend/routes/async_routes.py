@@ -0,0 +1,75 @@
+import asyncio
+from quart import Blueprint, g, jsonify, make_response, request
+from middleware.async_security import require_auth
+from revocation import is_revoked
+from async_db import run_read
+from serializers import list_participants, list_staff
+from search import search_participants, DEFAULT_LIMIT
+from changefeed import hub, AsyncSubscription, format_sse_event
+from routes.change_routes import HEARTBEAT_SECONDS, RETRY_MILLISECONDS
+
+async_bp = Blueprint('async_api', __name__)
+
+@async_bp.route('/participants/', methods=['GET'])
+@require_auth
+async def get_all_participants():
+    return jsonify({'participants': await run_read(list_participants)})
+
+@async_bp.route('/participants/search', methods=['GET'])
+@require_auth
+async def find_participants():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    participants, next_cursor = await run_read(search_participants, q, limit, request.args.get('cursor'))
+    return jsonify({'participants': participants, 'next_cursor': next_cursor})
+
+@async_bp.route('/staff/', methods=['GET'])
+@require_auth
+async def get_all_staff():
+    return jsonify({'staff': await run_read(list_staff)})
+
+def _last_event_id():
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+@async_bp.route('/changes/stream', methods=['GET'])
+@require_auth
+async def stream_changes():
+    subscription = AsyncSubscription(hub, asyncio.get_running_loop())
+    # Resuming may read the change_events table - keep it off the loop
+    subscription, backlog = await asyncio.to_thread(hub.subscribe, _last_event_id(), subscription)
+
+    claims = g.jwt_claims
+
+    async def generate():
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n".encode('utf-8')
+            replayed = set()
+            for event in backlog:
+                replayed.add(event['id'])
+                yield format_sse_event(event).encode('utf-8')
+
+            # Open streams end once the token is revoked (logout, deactivation)
+            while not subscription.overflowed and not is_revoked(claims):
+                event = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                if event is None:
+                    yield b": heartbeat\n\n"
+                elif event['id'] not in replayed:
+                    yield format_sse_event(event).encode('utf-8')
+        finally:
+            subscription.close()
+
+    response = await make_response(generate(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Streams stay open indefinitely; RESPONSE_TIMEOUT would cut them off
+    response.timeout = None
+    return response
@@ -1,6 +1,11 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
-from auth import authenticate_user, create_user
-from middleware.security import log_security_event
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+from auth import authenticate_user, create_user, refresh_access_token
+from middleware.security import require_auth, log_security_event
+from models import SessionLocal
+from revocation import is_revoked, revoke_token, revoke_user_tokens, MAX_TOKEN_LIFETIME
+from tenancy import set_request_tenant
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -16,6 +21,7 @@ def login():
     result = authenticate_user(email, password)
     
     if result:
+        set_request_tenant(result['user']['tenant_id'])
         log_security_event('LOGIN_SUCCESS', result['user']['id'], f"Email: {email}")
         return jsonify(result)
     else:
@@ -38,4 +44,54 @@ def register():
         log_security_event('USER_CREATED', user.id, f"Email: {email}, Role: {role}")
         return jsonify({'message': 'User created successfully'}), 201
     else:
-        return jsonify({'error': 'User already exists'}), 409
\ No newline at end of file
+        return jsonify({'error': 'User already exists'}), 409
+
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    try:
+        verify_jwt_in_request(refresh=True)
+    except Exception:
+        return jsonify({'error': 'Refresh token required'}), 401
+    
+    claims = get_jwt()
+    if is_revoked(claims):
+        return jsonify({'error': 'Token has been revoked'}), 401
+    
+    result = refresh_access_token(claims)
+    if not result:
+        return jsonify({'error': 'Account is inactive'}), 401
+    return jsonify(result)
+
+@auth_bp.route('/logout', methods=['POST'])
+@require_auth
+def logout():
+    """Revoke the current access token and its session's refresh token"""
+    claims = get_jwt()
+    db = SessionLocal()
+    try:
+        revoke_token(db, claims['jti'], datetime.utcfromtimestamp(claims['exp']), int(claims['sub']))
+        if claims.get('sid'):
+            # The refresh token's expiry is not in the access token; no
+            # token outlives MAX_TOKEN_LIFETIME
+            revoke_token(db, claims['sid'], datetime.utcnow() + MAX_TOKEN_LIFETIME, int(claims['sub']))
+        db.commit()
+    finally:
+        db.close()
+    
+    log_security_event('LOGOUT', claims['sub'], f"Session: {claims.get('sid')}")
+    return jsonify({'message': 'Logged out'})
+
+@auth_bp.route('/logout-all', methods=['POST'])
+@require_auth
+def logout_all():
+    """Revoke every token issued to the current user, on all devices"""
+    user_id = int(get_jwt()['sub'])
+    db = SessionLocal()
+    try:
+        revoke_user_tokens(db, user_id)
+        db.commit()
+    finally:
+        db.close()
+    
+    log_security_event('LOGOUT_ALL', user_id, 'All sessions revoked')
+    return jsonify({'message': 'All sessions logged out'})
@@ -0,0 +1,48 @@
+from flask import Blueprint, Response, request, stream_with_context
+from flask_jwt_extended import get_jwt
+from middleware.security import require_auth
+from revocation import is_revoked
+from changefeed import hub, format_sse_event
+
+change_bp = Blueprint('changes', __name__)
+
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+def _last_event_id():
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+@change_bp.route('/stream', methods=['GET'])
+@require_auth
+def stream_changes():
+    claims = get_jwt()
+    subscription, backlog = hub.subscribe(_last_event_id())
+
+    def generate():
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            replayed = set()
+            for event in backlog:
+                replayed.add(event['id'])
+                yield format_sse_event(event)
+
+            # Open streams end once the token is revoked (logout, deactivation)
+            while not subscription.overflowed and not is_revoked(claims):
+                event = subscription.get(timeout=HEARTBEAT_SECONDS)
+                if event is None:
+                    # SSE comment line keeps proxies from closing idle streams
+                    yield ": heartbeat\n\n"
+                elif event['id'] not in replayed:
+                    yield format_sse_event(event)
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
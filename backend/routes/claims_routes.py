@@ -0,0 +1,160 @@
+from datetime import date
+from flask import Blueprint, request, jsonify, send_from_directory
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from middleware.security import require_auth, require_role
+from middleware.compression import compress_response
+from middleware.idempotency import idempotent
+from models import Booking, ClaimBatch, Participant, PlanBudget, SupportLineItem, SessionLocal
+from db_routing import read_session
+from claims import CLAIM_FILES_DIR, participant_utilisation, run_billing
+from schemas import BillingRun, LineItemCreate, PlanBudgetIn, bulk_of, validate_body
+
+claims_bp = Blueprint('claims', __name__)
+claims_bp.after_request(compress_response)
+
+def _money(value):
+    return f"{value:.2f}"
+
+def _missing(db, model, ids):
+    """Those of ids with no row of the current tenant's in model's table"""
+    ids = set(ids)
+    if not ids:
+        return []
+    return sorted(ids - set(db.scalars(select(model.id).where(model.id.in_(ids)))))
+
+@claims_bp.route('/participants/<int:participant_id>/budgets', methods=['GET'])
+@require_auth
+def get_budgets(participant_id):
+    db = read_session()
+    try:
+        budgets = db.query(PlanBudget).filter(
+            PlanBudget.participant_id == participant_id
+        ).order_by(PlanBudget.starts_on.desc(), PlanBudget.category).all()
+        return jsonify({'budgets': [
+            {
+                'id': budget.id,
+                'category': budget.category,
+                'starts_on': budget.starts_on.isoformat(),
+                'ends_on': budget.ends_on.isoformat(),
+                'amount': _money(budget.amount),
+                'claimed': _money(budget.claimed_amount),
+                'remaining': _money(budget.amount - budget.claimed_amount),
+                'utilisation': round(float(budget.claimed_amount / budget.amount), 4) if budget.amount else 0.0
+            }
+            for budget in budgets
+        ]})
+    finally:
+        db.close()
+
+@claims_bp.route('/participants/<int:participant_id>/budgets', methods=['PUT'])
+@require_role('coordinator')
+@validate_body(bulk_of(PlanBudgetIn))
+def put_budgets(participant_id, body):
+    """Create or update plan budgets; amounts already claimed are kept"""
+    db = SessionLocal()
+    try:
+        if db.get(Participant, participant_id) is None:
+            return jsonify({'error': 'Participant not found'}), 404
+
+        statement = pg_insert(PlanBudget).values([
+            {'participant_id': participant_id, 'category': item.category,
+             'starts_on': item.starts_on, 'ends_on': item.ends_on, 'amount': item.amount}
+            for item in body
+        ])
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[PlanBudget.participant_id, PlanBudget.category, PlanBudget.starts_on],
+            set_={'ends_on': statement.excluded.ends_on, 'amount': statement.excluded.amount}
+        ))
+        db.commit()
+        return jsonify({'message': f"{len(body)} budgets saved"})
+
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@claims_bp.route('/line-items', methods=['POST'])
+@require_role('coordinator')
+@idempotent
+@validate_body(bulk_of(LineItemCreate))
+def create_line_items(body):
+    """Record delivered supports, pending until the next billing run"""
+    db = SessionLocal()
+    try:
+        # Inserts are not tenant scoped: references to another tenant's
+        # rows would pass the foreign keys
+        participant_ids = _missing(db, Participant, [item.participant_id for item in body])
+        if participant_ids:
+            return jsonify({'error': 'Participant not found', 'participant_ids': participant_ids}), 404
+        booking_ids = _missing(db, Booking, [item.booking_id for item in body if item.booking_id is not None])
+        if booking_ids:
+            return jsonify({'error': 'Booking not found', 'booking_ids': booking_ids}), 404
+
+        ids = db.scalars(insert(SupportLineItem).returning(SupportLineItem.id), [
+            {'participant_id': item.participant_id, 'booking_id': item.booking_id,
+             'support_item_code': item.support_item_code, 'service_date': item.service_date,
+             'quantity': item.quantity, 'unit_price': item.unit_price}
+            for item in body
+        ]).all()
+        db.commit()
+        return jsonify({
+            'message': f"{len(ids)} line items created successfully",
+            'line_item_ids': ids
+        }), 201
+
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@claims_bp.route('/runs', methods=['POST'])
+@require_role('admin')
+@idempotent
+@validate_body(BillingRun)
+def create_billing_run(body):
+    db = SessionLocal()
+    try:
+        summary = run_billing(db, body.period_start, body.period_end, int(get_jwt_identity()))
+        db.commit()
+        return jsonify(summary), 201
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@claims_bp.route('/runs/<int:batch_id>/file', methods=['GET'])
+@require_role('admin')
+def get_payment_request(batch_id):
+    db = SessionLocal()
+    try:
+        batch = db.get(ClaimBatch, batch_id)
+        if not batch or not batch.file_name:
+            return jsonify({'error': 'Payment request not found'}), 404
+        return send_from_directory(CLAIM_FILES_DIR, batch.file_name, as_attachment=True, mimetype='text/csv')
+    finally:
+        db.close()
+
+@claims_bp.route('/utilisation', methods=['GET'])
+@require_role('coordinator')
+def get_utilisation():
+    """Per-participant utilisation of the plans active on as_of (default
+    today), optionally only those at or above min_utilisation"""
+    try:
+        as_of = date.fromisoformat(request.args.get('as_of') or date.today().isoformat())
+    except ValueError:
+        return jsonify({'error': 'as_of must be YYYY-MM-DD'}), 400
+    min_utilisation = request.args.get('min_utilisation', type=float)
+
+    db = read_session()
+    try:
+        return jsonify({
+            'as_of': as_of.isoformat(),
+            'participants': participant_utilisation(db, as_of, min_utilisation=min_utilisation)
+        })
+    finally:
+        db.close()
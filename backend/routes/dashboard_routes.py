@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+from middleware.security import require_auth
+from db_routing import read_session
+from dashboard import get_summary
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+@dashboard_bp.route('/summary', methods=['GET'])
+@require_auth
+def get_dashboard_summary():
+    db = read_session()
+    try:
+        return jsonify(get_summary(db))
+    finally:
+        db.close()
@@ -0,0 +1,140 @@
+from functools import wraps
+from flask import Blueprint, Response, g, jsonify, request
+from middleware.security import require_role
+from middleware.compression import compress_response
+from models import Profile, SessionLocal
+from profiling import (PROFILE_HEADER, PROFILING_ENABLED, abandon_request_profile, finish_request_profile,
+                       issue_token, running_session, start_request_profile, start_sampling)
+from schemas import ProfileTokenRequest, SamplingStart, validate_body
+from tenancy import DEFAULT_TENANT_ID
+
+debug_bp = Blueprint('debug', __name__)
+debug_bp.after_request(compress_response)
+
+MAX_LISTED = 100
+
+@debug_bp.record_once
+def _install_request_profiling(state):
+    # Unless profiling is enabled requests do not even pass through a hook
+    if PROFILING_ENABLED:
+        state.app.before_request(start_request_profile)
+        state.app.after_request(finish_request_profile)
+        state.app.teardown_request(abandon_request_profile)
+
+def require_operator(f):
+    """Admins of the platform itself (the default tenant): profiles cover
+    every tenant's requests"""
+    @wraps(f)
+    @require_role('admin')
+    def decorated_function(*args, **kwargs):
+        if not PROFILING_ENABLED:
+            return jsonify({'error': 'Profiling is not enabled'}), 404
+        if g.principal.tenant_id != DEFAULT_TENANT_ID:
+            return jsonify({'error': 'Insufficient permissions'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+def _profile_json(profile, detail=False):
+    data = {
+        'id': profile.id,
+        'kind': profile.kind,
+        'method': profile.method,
+        'path': profile.path,
+        'status_code': profile.status_code,
+        'duration_ms': profile.duration_ms,
+        'sql_statements': len(profile.sql) if profile.sql is not None else None,
+        'samples': profile.samples,
+        'requested_by': profile.requested_by,
+        'created_at': profile.created_at.isoformat() if profile.created_at else None,
+        'finished_at': profile.finished_at.isoformat() if profile.finished_at else None
+    }
+    if detail:
+        data['summary'] = profile.summary
+        data['sql'] = profile.sql
+    return data
+
+@debug_bp.route('/profile/token', methods=['POST'])
+@require_operator
+@validate_body(ProfileTokenRequest)
+def create_profile_token(body):
+    """Token for the X-Profile-Token header: requests carrying it are
+    profiled until it expires"""
+    token, expires_at = issue_token(g.principal.user_id, body.minutes)
+    return jsonify({'header': PROFILE_HEADER, 'token': token, 'expires_at': expires_at.isoformat()})
+
+@debug_bp.route('/profile', methods=['POST'])
+@require_operator
+@validate_body(SamplingStart)
+def start_profile(body):
+    """Sample this process for `seconds`; poll the returned profile and
+    download its flamegraph once finished"""
+    running = running_session()
+    if running is not None:
+        return jsonify({'error': 'A sampling session is already running', 'profile_id': running}), 409
+    profile_id = start_sampling(body.seconds, body.interval_ms, g.principal.user_id)
+    if profile_id is None:
+        return jsonify({'error': 'Sampling session could not be started'}), 503
+    return jsonify({
+        'profile_id': profile_id,
+        'poll_url': f"/debug/profiles/{profile_id}",
+        'flamegraph_url': f"/debug/profiles/{profile_id}/flamegraph"
+    }), 202
+
+@debug_bp.route('/profiles', methods=['GET'])
+@require_operator
+def list_profiles():
+    """Recent profiles, newest first; kind=request or sampling"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_LISTED))
+    db = SessionLocal()
+    try:
+        query = db.query(Profile)
+        if request.args.get('kind'):
+            query = query.filter(Profile.kind == request.args['kind'])
+        profiles = query.order_by(Profile.created_at.desc(), Profile.id.desc()).limit(limit).all()
+        return jsonify({'profiles': [_profile_json(profile) for profile in profiles]})
+    finally:
+        db.close()
+
+@debug_bp.route('/profiles/<int:profile_id>', methods=['GET'])
+@require_operator
+def get_profile(profile_id):
+    db = SessionLocal()
+    try:
+        profile = db.get(Profile, profile_id)
+        if not profile:
+            return jsonify({'error': 'Profile not found'}), 404
+        return jsonify({'profile': _profile_json(profile, detail=True)})
+    finally:
+        db.close()
+
+@debug_bp.route('/profiles/<int:profile_id>/flamegraph', methods=['GET'])
+@require_operator
+def get_flamegraph(profile_id):
+    """Folded stacks of a finished sampling session"""
+    db = SessionLocal()
+    try:
+        profile = db.get(Profile, profile_id)
+        if not profile or profile.kind != 'sampling':
+            return jsonify({'error': 'Sampling session not found'}), 404
+        if profile.finished_at is None:
+            return jsonify({'error': 'Sampling session is still running'}), 409
+        return Response(profile.folded or '', mimetype='text/plain', headers={
+            'Content-Disposition': f"attachment; filename=profile_{profile.id}.folded"
+        })
+    finally:
+        db.close()
+
+@debug_bp.route('/profiles/<int:profile_id>/pstats', methods=['GET'])
+@require_operator
+def get_pstats(profile_id):
+    """pstats dump of a request profile, for pstats, snakeviz or flameprof"""
+    db = SessionLocal()
+    try:
+        profile = db.get(Profile, profile_id)
+        if not profile or profile.kind != 'request':
+            return jsonify({'error': 'Request profile not found'}), 404
+        return Response(profile.stats, mimetype='application/octet-stream', headers={
+            'Content-Disposition': f"attachment; filename=profile_{profile.id}.prof"
+        })
+    finally:
+        db.close()
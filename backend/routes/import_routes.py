@@ -0,0 +1,35 @@
+import csv
+import io
+from flask import Blueprint, request, jsonify
+from middleware.security import require_role
+from models import SessionLocal
+from csv_import import SPECS, import_csv
+
+import_bp = Blueprint('import', __name__)
+
+@import_bp.route('/<entity>', methods=['POST'])
+@require_role('admin')
+def import_entity(entity):
+    """Import a CSV export of participants or staff, sent either as the raw
+    request body (text/csv) or as a multipart `file` upload"""
+    if entity not in SPECS:
+        return jsonify({'error': 'Unknown import type'}), 404
+
+    upload = request.files.get('file')
+    raw = upload.stream if upload is not None else request.stream
+    # Decoded as it is read; the body is never held in memory whole
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+    db = SessionLocal()
+    try:
+        report = import_csv(db, entity, stream)
+        db.commit()
+        return jsonify(report), 201 if report['created'] else 200
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.rollback()
+        return jsonify({'error': 'Unreadable CSV', 'detail': str(e)}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
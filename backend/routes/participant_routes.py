@@ -1,61 +1,80 @@
+from collections import Counter
+import msgspec
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity
 from middleware.security import require_auth, require_role
+from middleware.compression import compress_response
+from middleware.idempotency import idempotent
 from models import Participant, SessionLocal
+from pii import PII_FIELDS, encrypt_fields
+from db_routing import read_session
 from automation.workflows import trigger_participant_enrollment
+from serializers import list_participants
+from changefeed import publish_change
+from dashboard import record_created, record_status_change
+from search import search_participants, DEFAULT_LIMIT
+from schemas import ParticipantCreate, ParticipantUpdate, bulk_of, provided_fields, validate_body
 
 participant_bp = Blueprint('participant', __name__)
+participant_bp.after_request(compress_response)
 
 @participant_bp.route('/', methods=['GET'])
 @require_auth
 def get_all_participants():
-    db = SessionLocal()
+    db = read_session()
     try:
-        participants_list = db.query(Participant).all()
-        result = []
-        for participant in participants_list:
-            result.append({
-                'id': participant.id,
-                'first_name': participant.first_name,
-                'last_name': participant.last_name,
-                'email': participant.email,
-                'phone': participant.phone,
-                'address': participant.address,
-                'emergency_contact': participant.emergency_contact,
-                'ndis_number': participant.ndis_number,
-                'status': participant.status,
-                'created_at': participant.created_at.isoformat() if participant.created_at else None
-            })
-        return jsonify({'participants': result})
+        return jsonify({'participants': list_participants(db)})
     finally:
         db.close()
 
+@participant_bp.route('/search', methods=['GET'])
+@require_auth
+def find_participants():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    db = read_session()
+    try:
+        participants, next_cursor = search_participants(db, q, limit, request.args.get('cursor'))
+        return jsonify({'participants': participants, 'next_cursor': next_cursor})
+    finally:
+        db.close()
+
+def _created_payload(participant):
+    # Change events are stored, so they carry no PII; clients fetch it
+    return {
+        'first_name': participant.first_name,
+        'last_name': participant.last_name,
+        'ndis_number': participant.ndis_number,
+        'status': participant.status
+    }
+
+def _without_pii(changes):
+    return {field: value for field, value in changes.items() if field not in PII_FIELDS}
+
 @participant_bp.route('/', methods=['POST'])
 @require_role('admin')
-def create_participant():
+@idempotent
+@validate_body(ParticipantCreate)
+def create_participant(body):
     db = SessionLocal()
     try:
-        data = request.get_json()
-        
         # Create participant
-        new_participant = Participant(
-            first_name=data['first_name'],
-            last_name=data['last_name'],
-            email=data.get('email'),
-            phone=data.get('phone'),
-            address=data.get('address'),
-            emergency_contact=data.get('emergency_contact'),
-            ndis_number=data.get('ndis_number')
-        )
+        new_participant = Participant(**encrypt_fields(db, msgspec.structs.asdict(body)))
         
         db.add(new_participant)
+        db.flush()
+        record_created(db, 'participants', new_participant.status)
+        publish_change(db, 'participant', new_participant.id, 'created', _created_payload(new_participant))
+        # Trigger automation workflow (Aryan's work); it starts only if
+        # the participant is committed
+        if body.email:
+            trigger_participant_enrollment(db, new_participant.id, body.email)
         db.commit()
         db.refresh(new_participant)
         
-        # Trigger automation workflow (Aryan's work)
-        if new_participant.email:
-            trigger_participant_enrollment(new_participant.id, new_participant.email)
-        
         return jsonify({
             'message': 'Participant created successfully',
             'participant_id': new_participant.id
@@ -67,25 +86,53 @@ def create_participant():
     finally:
         db.close()
 
+@participant_bp.route('/bulk', methods=['POST'])
+@require_role('admin')
+@idempotent
+@validate_body(bulk_of(ParticipantCreate))
+def create_participants_bulk(body):
+    """Create up to MAX_BULK_ITEMS participants in one transaction"""
+    db = SessionLocal()
+    try:
+        participants = [Participant(**encrypt_fields(db, msgspec.structs.asdict(item))) for item in body]
+        db.add_all(participants)
+        db.flush()
+        for status, count in Counter(p.status for p in participants).items():
+            record_created(db, 'participants', status, count)
+        for participant, item in zip(participants, body):
+            publish_change(db, 'participant', participant.id, 'created', _created_payload(participant))
+            if item.email:
+                trigger_participant_enrollment(db, participant.id, item.email)
+        db.commit()
+        
+        return jsonify({
+            'message': f"{len(participants)} participants created successfully",
+            'participant_ids': [p.id for p in participants]
+        }), 201
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
 @participant_bp.route('/<int:participant_id>', methods=['PUT'])
 @require_auth
-def update_participant(participant_id):
+@validate_body(ParticipantUpdate)
+def update_participant(participant_id, body):
     db = SessionLocal()
     try:
         participant = db.query(Participant).filter(Participant.id == participant_id).first()
         if not participant:
             return jsonify({'error': 'Participant not found'}), 404
         
-        data = request.get_json()
-        participant.first_name = data.get('first_name', participant.first_name)
-        participant.last_name = data.get('last_name', participant.last_name)
-        participant.email = data.get('email', participant.email)
-        participant.phone = data.get('phone', participant.phone)
-        participant.address = data.get('address', participant.address)
-        participant.emergency_contact = data.get('emergency_contact', participant.emergency_contact)
-        participant.ndis_number = data.get('ndis_number', participant.ndis_number)
-        participant.status = data.get('status', participant.status)
+        changes = provided_fields(body)
+        old_status = participant.status
+        for field, value in encrypt_fields(db, changes).items():
+            setattr(participant, field, value)
         
+        record_status_change(db, 'participants', old_status, participant.status)
+        publish_change(db, 'participant', participant.id, 'updated', _without_pii(changes))
         db.commit()
         return jsonify({'message': 'Participant updated successfully'})
         
@@ -93,4 +140,4 @@ def update_participant(participant_id):
         db.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,121 @@
+from datetime import datetime
+from flask import Blueprint, jsonify, send_file
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from middleware.security import require_role
+from middleware.compression import compress_response
+from models import ReportJob, SessionLocal
+from reports import (DONE, EXPIRED, FAILED, MIMETYPES, QUEUED, RUNNING, artifact_path, request_hash,
+                     request_params, supports_format)
+from schemas import ReportRequest, validate_body
+
+reports_bp = Blueprint('reports', __name__)
+reports_bp.after_request(compress_response)
+
+def _job_json(job):
+    data = {
+        'id': job.id,
+        'type': job.report_type,
+        'format': job.format,
+        'params': job.params,
+        'status': job.status,
+        'row_count': job.row_count,
+        'byte_size': job.byte_size,
+        'content_hash': job.content_hash,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'poll_url': f"/api/reports/{job.id}",
+        'file_url': None
+    }
+    if job.status == DONE:
+        data['file_url'] = f"/api/reports/{job.id}/file"
+    return data
+
+def _valid_report(db, digest, now):
+    return db.scalars(
+        select(ReportJob).where(
+            ReportJob.request_hash == digest, ReportJob.status == DONE, ReportJob.expires_at > now
+        ).order_by(ReportJob.expires_at.desc()).limit(1)
+    ).first()
+
+def _unfinished_report(db, digest):
+    return db.scalars(
+        select(ReportJob).where(ReportJob.request_hash == digest, ReportJob.status.in_((QUEUED, RUNNING)))
+    ).first()
+
+@reports_bp.route('', methods=['POST'])
+@require_role('coordinator')
+@validate_body(ReportRequest)
+def request_report(body):
+    """Queue a report, or hand back the job already building or holding a
+    valid copy of the same report. 200 with a finished job, 202 with a
+    job to poll."""
+    if not supports_format(body.format):
+        return jsonify({'error': f"{body.format} reports are not available"}), 422
+
+    digest = request_hash(body)
+    params = request_params(body)
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        job = _valid_report(db, digest, now)
+        if job is None:
+            # At most one unfinished job per request: a concurrent identical
+            # request inserts nothing and picks up the other job below
+            db.execute(
+                insert(ReportJob).values(
+                    report_type=params['type'], format=body.format, params=params, request_hash=digest,
+                    status=QUEUED, requested_by=int(get_jwt_identity()), created_at=now
+                ).on_conflict_do_nothing(
+                    index_elements=[ReportJob.tenant_id, ReportJob.request_hash],
+                    index_where=ReportJob.status.in_((QUEUED, RUNNING))
+                )
+            )
+            db.commit()
+            # ... or it finished in the meantime
+            job = _unfinished_report(db, digest) or _valid_report(db, digest, now)
+        if job is None:
+            return jsonify({'error': 'Report could not be queued, please retry'}), 503
+        status = 200 if job.status == DONE else 202
+        return jsonify({'report': _job_json(job)}), status, {'Location': f"/api/reports/{job.id}"}
+    finally:
+        db.close()
+
+@reports_bp.route('/<int:job_id>', methods=['GET'])
+@require_role('coordinator')
+def get_report(job_id):
+    db = SessionLocal()
+    try:
+        job = db.get(ReportJob, job_id)
+        if not job:
+            return jsonify({'error': 'Report not found'}), 404
+        return jsonify({'report': _job_json(job)})
+    finally:
+        db.close()
+
+@reports_bp.route('/<int:job_id>/file', methods=['GET'])
+@require_role('coordinator')
+def get_report_file(job_id):
+    db = SessionLocal()
+    try:
+        job = db.get(ReportJob, job_id)
+        if not job:
+            return jsonify({'error': 'Report not found'}), 404
+        if job.status == EXPIRED or (job.status == DONE and job.expires_at <= datetime.utcnow()):
+            return jsonify({'error': 'Report has expired, request it again'}), 410
+        if job.status == FAILED:
+            return jsonify({'error': 'Report failed', 'detail': job.error}), 409
+        if job.status != DONE:
+            return jsonify({'error': 'Report is not ready', 'report': _job_json(job)}), 409
+        # Artifacts are named by their content hash, which doubles as the ETag
+        response = send_file(
+            artifact_path(job.tenant_id, job.content_hash, job.format),
+            mimetype=MIMETYPES[job.format], as_attachment=True,
+            download_name=f"{job.report_type}_{job.id}.{job.format}", etag=job.content_hash, conditional=True
+        )
+        return response
+    finally:
+        db.close()
@@ -0,0 +1,167 @@
+from datetime import date, datetime
+from flask import Blueprint, request, jsonify
+from middleware.security import require_auth, require_role
+from middleware.compression import compress_response
+from middleware.idempotency import idempotent
+from models import Booking, Participant, Staff, StaffAvailability, StaffQualification, SessionLocal
+from db_routing import read_session
+from changefeed import publish_change
+from schemas import (BookingCreate, BookingUpdate, RosterProfile, RosterSolve,
+                     check_booking_window, provided_fields, validate_body)
+from roster_service import (WEEK, booking_encoder, lock_week, reassign_booking, solve_week, to_utc,
+                            week_of_date, week_start_of)
+
+roster_bp = Blueprint('roster', __name__)
+roster_bp.after_request(compress_response)
+
+def _requested_week():
+    """Local week start from ?week_start=YYYY-MM-DD, defaulting to this week"""
+    value = request.args.get('week_start')
+    if value is None:
+        return week_start_of(datetime.utcnow())
+    return week_of_date(date.fromisoformat(value))
+
+@roster_bp.route('/bookings', methods=['GET'])
+@require_auth
+def get_bookings():
+    try:
+        week_start = _requested_week()
+    except ValueError:
+        return jsonify({'error': 'week_start must be YYYY-MM-DD'}), 400
+    db = read_session()
+    try:
+        bookings = booking_encoder.fetch(db, booking_encoder.select().where(
+            Booking.starts_at >= to_utc(week_start),
+            Booking.starts_at < to_utc(week_start + WEEK)
+        ).order_by(Booking.starts_at, Booking.id))
+        return jsonify({'week_start': week_start.date().isoformat(), 'bookings': bookings})
+    finally:
+        db.close()
+
+@roster_bp.route('/bookings', methods=['POST'])
+@require_role('coordinator')
+@idempotent
+@validate_body(BookingCreate)
+def create_booking(body):
+    db = SessionLocal()
+    try:
+        if db.get(Participant, body.participant_id) is None:
+            return jsonify({'error': 'Participant not found'}), 404
+        
+        booking = Booking(
+            participant_id=body.participant_id,
+            starts_at=body.starts_at,
+            ends_at=body.ends_at,
+            required_qualifications=body.required_qualifications,
+            notes=body.notes
+        )
+        db.add(booking)
+        db.flush()
+        # Place only the new booking; the rest of the week's roster stays put
+        # apart from at most one moved booking
+        changed = reassign_booking(db, booking)
+        publish_change(db, 'booking', booking.id, 'created', {
+            'participant_id': booking.participant_id,
+            'staff_id': booking.staff_id,
+            'moved': [booking_id for booking_id in changed if booking_id != booking.id]
+        })
+        db.commit()
+        
+        return jsonify({
+            'message': 'Booking created successfully',
+            'booking_id': booking.id,
+            'staff_id': booking.staff_id
+        }), 201
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@roster_bp.route('/bookings/<int:booking_id>', methods=['PUT'])
+@require_role('coordinator')
+@validate_body(BookingUpdate)
+def update_booking(booking_id, body):
+    db = SessionLocal()
+    try:
+        booking = db.get(Booking, booking_id)
+        if not booking:
+            return jsonify({'error': 'Booking not found'}), 404
+        
+        changes = provided_fields(body)
+        # Before the booking row is written: a solve holding either week may
+        # be about to update that row, and one holding the week it leaves
+        # would otherwise still assign it against that week's roster
+        lock_week(db, week_start_of(booking.starts_at), week_start_of(changes.get('starts_at', booking.starts_at)))
+        for field, value in changes.items():
+            setattr(booking, field, value)
+        try:
+            check_booking_window(booking.starts_at, booking.ends_at)
+        except ValueError as e:
+            db.rollback()
+            return jsonify({'error': 'Invalid request body', 'detail': str(e)}), 422
+        
+        db.flush()
+        changed = reassign_booking(db, booking)
+        publish_change(db, 'booking', booking.id, 'updated', {
+            **{field: value for field, value in changes.items() if field in ('status', 'notes')},
+            'staff_id': booking.staff_id,
+            'moved': [other_id for other_id in changed if other_id != booking.id]
+        })
+        db.commit()
+        return jsonify({'message': 'Booking updated successfully', 'staff_id': booking.staff_id})
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@roster_bp.route('/solve', methods=['POST'])
+@require_role('coordinator')
+@validate_body(RosterSolve)
+def solve(body):
+    """Full solve for one week; assignments that are still valid are kept"""
+    db = SessionLocal()
+    try:
+        summary = solve_week(db, week_of_date(body.week_start))
+        db.commit()
+        return jsonify(summary)
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@roster_bp.route('/staff/<int:staff_id>/profile', methods=['PUT'])
+@require_role('coordinator')
+@validate_body(RosterProfile)
+def update_roster_profile(staff_id, body):
+    """Replace a worker's weekly availability and qualifications"""
+    db = SessionLocal()
+    try:
+        staff = db.get(Staff, staff_id)
+        if not staff:
+            return jsonify({'error': 'Staff not found'}), 404
+        
+        db.query(StaffAvailability).filter(StaffAvailability.staff_id == staff_id).delete()
+        db.query(StaffQualification).filter(StaffQualification.staff_id == staff_id).delete()
+        db.add_all(
+            StaffAvailability(staff_id=staff_id, weekday=window.weekday,
+                              start_minute=window.start_minute, end_minute=window.end_minute)
+            for window in body.availability
+        )
+        db.add_all(
+            StaffQualification(staff_id=staff_id, qualification=qualification)
+            for qualification in set(body.qualifications)
+        )
+        staff.max_weekly_hours = body.max_weekly_hours
+        db.commit()
+        return jsonify({'message': 'Roster profile updated successfully'})
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
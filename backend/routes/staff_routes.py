@@ -1,63 +1,74 @@
-from flask import Blueprint, request, jsonify
+from collections import Counter
+from flask import Blueprint, jsonify
 from flask_jwt_extended import get_jwt_identity
 from middleware.security import require_auth, require_role
+from middleware.compression import compress_response
+from middleware.idempotency import idempotent
 from models import Staff, User, SessionLocal
-from automation.workflows import trigger_staff_onboarding
+from tenancy import ALL_TENANTS
+from db_routing import read_session
+from automation.workflows import complete_onboarding_item, trigger_staff_onboarding
+from serializers import list_staff
+from changefeed import publish_change
+from dashboard import record_created, record_status_change
+from auth import create_users, hash_password, hash_passwords
+from revocation import revoke_user_tokens
+from schemas import MAX_STAFF_BULK_ITEMS, StaffCreate, StaffUpdate, bulk_of, provided_fields, validate_body
 
 staff_bp = Blueprint('staff', __name__)
+staff_bp.after_request(compress_response)
 
 @staff_bp.route('/', methods=['GET'])
 @require_auth
 def get_all_staff():
-    db = SessionLocal()
+    db = read_session()
     try:
-        staff_list = db.query(Staff).join(User).all()
-        result = []
-        for staff in staff_list:
-            result.append({
-                'id': staff.id,
-                'first_name': staff.first_name,
-                'last_name': staff.last_name,
-                'email': staff.user.email,
-                'phone': staff.phone,
-                'position': staff.position,
-                'status': staff.status,
-                'hire_date': staff.hire_date.isoformat() if staff.hire_date else None
-            })
-        return jsonify({'staff': result})
+        return jsonify({'staff': list_staff(db)})
     finally:
         db.close()
 
+def _created_payload(staff, email):
+    return {
+        'first_name': staff.first_name,
+        'last_name': staff.last_name,
+        'email': email,
+        'position': staff.position,
+        'status': staff.status
+    }
+
 @staff_bp.route('/', methods=['POST'])
 @require_role('admin')
-def create_staff():
+@idempotent
+@validate_body(StaffCreate)
+def create_staff(body):
     db = SessionLocal()
     try:
-        data = request.get_json()
-        
-        # Create user account first
-        from auth import create_user
-        user = create_user(data['email'], data['password'], 'staff')
+        # Create user account first; it is deleted again if the staff
+        # profile does not commit (see auth.create_users)
+        user_ids = create_users(db, [(body.email, hash_password(body.password))])
         
-        if not user:
+        if not user_ids:
             return jsonify({'error': 'Email already exists'}), 409
         
         # Create staff profile
         new_staff = Staff(
-            user_id=user.id,
-            first_name=data['first_name'],
-            last_name=data['last_name'],
-            phone=data.get('phone'),
-            position=data.get('position')
+            user_id=user_ids[0],
+            first_name=body.first_name,
+            last_name=body.last_name,
+            phone=body.phone,
+            position=body.position
         )
         
         db.add(new_staff)
+        db.flush()
+        record_created(db, 'staff', new_staff.status)
+        publish_change(db, 'staff', new_staff.id, 'created', _created_payload(new_staff, body.email))
+        # Trigger automation workflow (Aryan's work); it starts only if
+        # the staff member is committed
+        trigger_staff_onboarding(db, new_staff.id, body.email)
         db.commit()
         db.refresh(new_staff)
         
-        # Trigger automation workflow (Aryan's work)
-        trigger_staff_onboarding(new_staff.id, data['email'])
-        
         return jsonify({
             'message': 'Staff created successfully',
             'staff_id': new_staff.id
@@ -69,22 +80,84 @@ def create_staff():
     finally:
         db.close()
 
+@staff_bp.route('/bulk', methods=['POST'])
+@require_role('admin')
+@idempotent
+@validate_body(bulk_of(StaffCreate, MAX_STAFF_BULK_ITEMS))
+def create_staff_bulk(body):
+    """Create up to MAX_STAFF_BULK_ITEMS staff members and their user accounts;
+    nothing is created if any email is taken.
+
+    The accounts are committed first and deleted again if the staff
+    records do not commit (see auth.create_users), as users and a placed
+    tenant's staff are in different databases.
+    """
+    emails = [item.email for item in body]
+    if len(set(emails)) != len(emails):
+        return jsonify({'error': 'Duplicate emails in request'}), 422
+    
+    db = SessionLocal()
+    try:
+        # Emails are unique across tenants, not just within this one
+        existing = [email for (email,) in db.query(User.email).filter(
+            User.email.in_(emails)
+        ).execution_options(**{ALL_TENANTS: True})]
+        if existing:
+            return jsonify({'error': 'Email already exists', 'emails': existing}), 409
+        
+        password_hashes = hash_passwords([item.password for item in body])
+        user_ids = create_users(db, zip(emails, password_hashes))
+        if user_ids is None:
+            return jsonify({'error': 'Email already exists'}), 409
+        staff_members = [
+            Staff(user_id=user_id, first_name=item.first_name, last_name=item.last_name,
+                  phone=item.phone, position=item.position)
+            for user_id, item in zip(user_ids, body)
+        ]
+        db.add_all(staff_members)
+        db.flush()
+        for status, count in Counter(staff.status for staff in staff_members).items():
+            record_created(db, 'staff', status, count)
+        for staff, item in zip(staff_members, body):
+            publish_change(db, 'staff', staff.id, 'created', _created_payload(staff, item.email))
+            trigger_staff_onboarding(db, staff.id, item.email)
+        db.commit()
+        
+        return jsonify({
+            'message': f"{len(staff_members)} staff created successfully",
+            'staff_ids': [staff.id for staff in staff_members]
+        }), 201
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
 @staff_bp.route('/<int:staff_id>', methods=['PUT'])
 @require_auth
-def update_staff(staff_id):
+@validate_body(StaffUpdate)
+def update_staff(staff_id, body):
     db = SessionLocal()
     try:
         staff = db.query(Staff).filter(Staff.id == staff_id).first()
         if not staff:
             return jsonify({'error': 'Staff not found'}), 404
         
-        data = request.get_json()
-        staff.first_name = data.get('first_name', staff.first_name)
-        staff.last_name = data.get('last_name', staff.last_name)
-        staff.phone = data.get('phone', staff.phone)
-        staff.position = data.get('position', staff.position)
-        staff.status = data.get('status', staff.status)
+        changes = provided_fields(body)
+        old_status = staff.status
+        for field, value in changes.items():
+            setattr(staff, field, value)
         
+        if staff.status != old_status and 'inactive' in (old_status, staff.status):
+            # Deactivation locks the account and revokes every token it
+            # holds; all workers drop them as soon as this commits
+            staff.user.is_active = staff.status != 'inactive'
+            if staff.status == 'inactive':
+                revoke_user_tokens(db, staff.user_id)
+        
+        record_status_change(db, 'staff', old_status, staff.status)
+        publish_change(db, 'staff', staff.id, 'updated', changes)
         db.commit()
         return jsonify({'message': 'Staff updated successfully'})
         
@@ -92,4 +165,23 @@ def update_staff(staff_id):
         db.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@staff_bp.route('/<int:staff_id>/onboarding/checklist/<item>', methods=['POST'])
+@require_role('coordinator')
+def complete_onboarding_checklist_item(staff_id, item):
+    """Mark an onboarding checklist item (URL-encoded, as listed in the
+    workflow) done; the compliance report counts it from then on"""
+    db = SessionLocal()
+    try:
+        if db.get(Staff, staff_id) is None:
+            return jsonify({'error': 'Staff not found'}), 404
+        if not complete_onboarding_item(db, staff_id, item):
+            return jsonify({'error': 'Checklist item not found'}), 404
+        db.commit()
+        return jsonify({'message': 'Checklist item completed'})
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
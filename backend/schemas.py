@@ -0,0 +1,244 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import wraps
+from typing import Annotated, Literal, Optional, Union
+import msgspec
+from flask import jsonify, request
+
+MAX_BULK_ITEMS = 500
+# Each staff member costs a bcrypt hash, so their bulk requests are smaller
+MAX_STAFF_BULK_ITEMS = 50
+
+Name = Annotated[str, msgspec.Meta(min_length=1, max_length=100)]
+Text = Annotated[str, msgspec.Meta(max_length=500)]
+Position = Annotated[str, msgspec.Meta(max_length=100)]
+Contact = Annotated[str, msgspec.Meta(max_length=255)]
+Phone = Annotated[str, msgspec.Meta(max_length=20)]
+Email = Annotated[str, msgspec.Meta(max_length=254, pattern=r'^[^@\s]+@[^@\s]+\.[^@\s]+$')]
+Password = Annotated[str, msgspec.Meta(min_length=8, max_length=128)]
+NdisNumber = Annotated[str, msgspec.Meta(min_length=1, max_length=20)]
+StaffStatus = Literal['active', 'inactive', 'on_leave']
+ParticipantStatus = Literal['active', 'inactive', 'pending']
+
+# forbid_unknown_fields rejects typos and fields a client may not set
+# (id, user_id, created_at, ...) instead of silently ignoring them
+class StaffCreate(msgspec.Struct, forbid_unknown_fields=True):
+    first_name: Name
+    last_name: Name
+    email: Email
+    password: Password
+    phone: Optional[Phone] = None
+    position: Optional[Position] = None
+
+class StaffUpdate(msgspec.Struct, forbid_unknown_fields=True):
+    first_name: Union[Name, msgspec.UnsetType] = msgspec.UNSET
+    last_name: Union[Name, msgspec.UnsetType] = msgspec.UNSET
+    phone: Union[Phone, None, msgspec.UnsetType] = msgspec.UNSET
+    position: Union[Position, None, msgspec.UnsetType] = msgspec.UNSET
+    status: Union[StaffStatus, msgspec.UnsetType] = msgspec.UNSET
+
+class ParticipantCreate(msgspec.Struct, forbid_unknown_fields=True):
+    first_name: Name
+    last_name: Name
+    email: Optional[Email] = None
+    phone: Optional[Phone] = None
+    address: Optional[Text] = None
+    emergency_contact: Optional[Contact] = None
+    ndis_number: Optional[NdisNumber] = None
+
+class ParticipantUpdate(msgspec.Struct, forbid_unknown_fields=True):
+    first_name: Union[Name, msgspec.UnsetType] = msgspec.UNSET
+    last_name: Union[Name, msgspec.UnsetType] = msgspec.UNSET
+    email: Union[Email, None, msgspec.UnsetType] = msgspec.UNSET
+    phone: Union[Phone, None, msgspec.UnsetType] = msgspec.UNSET
+    address: Union[Text, None, msgspec.UnsetType] = msgspec.UNSET
+    emergency_contact: Union[Contact, None, msgspec.UnsetType] = msgspec.UNSET
+    ndis_number: Union[NdisNumber, None, msgspec.UnsetType] = msgspec.UNSET
+    status: Union[ParticipantStatus, msgspec.UnsetType] = msgspec.UNSET
+
+# CSV imports: the same fields as the create bodies plus status, without
+# a password (imported staff set theirs through a reset)
+class StaffImport(msgspec.Struct, forbid_unknown_fields=True):
+    first_name: Name
+    last_name: Name
+    email: Email
+    phone: Optional[Phone] = None
+    position: Optional[Position] = None
+    status: StaffStatus = 'active'
+
+class ParticipantImport(msgspec.Struct, forbid_unknown_fields=True):
+    first_name: Name
+    last_name: Name
+    email: Optional[Email] = None
+    phone: Optional[Phone] = None
+    address: Optional[Text] = None
+    emergency_contact: Optional[Contact] = None
+    ndis_number: Optional[NdisNumber] = None
+    status: ParticipantStatus = 'active'
+
+MAX_BOOKING_HOURS = 24
+Qualification = Annotated[str, msgspec.Meta(min_length=1, max_length=100)]
+Minute = Annotated[int, msgspec.Meta(ge=0, le=1440)]
+
+def _naive_utc(value):
+    # Timestamps are stored as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def check_booking_window(starts_at, ends_at):
+    if ends_at <= starts_at:
+        raise ValueError('ends_at must be after starts_at')
+    if (ends_at - starts_at).total_seconds() > MAX_BOOKING_HOURS * 3600:
+        raise ValueError(f"Bookings are limited to {MAX_BOOKING_HOURS} hours")
+
+class BookingCreate(msgspec.Struct, forbid_unknown_fields=True):
+    participant_id: int
+    starts_at: datetime
+    ends_at: datetime
+    required_qualifications: list[Qualification] = []
+    notes: Optional[Text] = None
+
+    def __post_init__(self):
+        # ValueError here is reported as a msgspec.ValidationError (422)
+        self.starts_at = _naive_utc(self.starts_at)
+        self.ends_at = _naive_utc(self.ends_at)
+        check_booking_window(self.starts_at, self.ends_at)
+
+class BookingUpdate(msgspec.Struct, forbid_unknown_fields=True):
+    starts_at: Union[datetime, msgspec.UnsetType] = msgspec.UNSET
+    ends_at: Union[datetime, msgspec.UnsetType] = msgspec.UNSET
+    required_qualifications: Union[list[Qualification], msgspec.UnsetType] = msgspec.UNSET
+    status: Union[Literal['open', 'cancelled'], msgspec.UnsetType] = msgspec.UNSET
+    notes: Union[Text, None, msgspec.UnsetType] = msgspec.UNSET
+
+    def __post_init__(self):
+        if self.starts_at is not msgspec.UNSET:
+            self.starts_at = _naive_utc(self.starts_at)
+        if self.ends_at is not msgspec.UNSET:
+            self.ends_at = _naive_utc(self.ends_at)
+
+class AvailabilityWindow(msgspec.Struct, forbid_unknown_fields=True):
+    weekday: Annotated[int, msgspec.Meta(ge=0, le=6)]
+    start_minute: Minute
+    end_minute: Minute
+
+    def __post_init__(self):
+        if self.end_minute <= self.start_minute:
+            raise ValueError('end_minute must be after start_minute')
+
+class RosterProfile(msgspec.Struct, forbid_unknown_fields=True):
+    availability: list[AvailabilityWindow]
+    qualifications: list[Qualification] = []
+    max_weekly_hours: Annotated[int, msgspec.Meta(ge=0, le=168)] = 38
+
+class RosterSolve(msgspec.Struct, forbid_unknown_fields=True):
+    week_start: date
+
+SupportItemCode = Annotated[str, msgspec.Meta(min_length=1, max_length=30)]
+
+def _check_money(value, name):
+    if value < 0 or value.as_tuple().exponent < -2:
+        raise ValueError(f"{name} must be a non-negative amount in dollars and cents")
+
+class PlanBudgetIn(msgspec.Struct, forbid_unknown_fields=True):
+    category: Name
+    starts_on: date
+    ends_on: date
+    amount: Decimal
+
+    def __post_init__(self):
+        if self.ends_on < self.starts_on:
+            raise ValueError('ends_on must not be before starts_on')
+        _check_money(self.amount, 'amount')
+
+class LineItemCreate(msgspec.Struct, forbid_unknown_fields=True):
+    participant_id: int
+    support_item_code: SupportItemCode
+    service_date: date
+    quantity: Decimal
+    unit_price: Decimal
+    booking_id: Optional[int] = None
+
+    def __post_init__(self):
+        if self.quantity <= 0 or self.quantity.as_tuple().exponent < -2:
+            raise ValueError('quantity must be positive with at most two decimal places')
+        _check_money(self.unit_price, 'unit_price')
+
+class BillingRun(msgspec.Struct, forbid_unknown_fields=True):
+    period_start: date
+    period_end: date
+
+    def __post_init__(self):
+        if self.period_end < self.period_start:
+            raise ValueError('period_end must not be before period_start')
+
+ReportFormat = Literal['csv', 'xlsx']
+
+# Report requests, told apart by their "type"; every field takes part in
+# deciding whether an earlier identical report can be reused
+class ParticipantListReport(msgspec.Struct, forbid_unknown_fields=True, tag='participants', tag_field='type'):
+    format: ReportFormat = 'csv'
+    status: Optional[ParticipantStatus] = None
+
+class StaffRosterReport(msgspec.Struct, forbid_unknown_fields=True, tag='staff_roster', tag_field='type'):
+    week_start: date
+    format: ReportFormat = 'csv'
+
+class ComplianceReport(msgspec.Struct, forbid_unknown_fields=True, tag='compliance', tag_field='type'):
+    format: ReportFormat = 'csv'
+    staff_status: Optional[StaffStatus] = None
+
+ReportRequest = Union[ParticipantListReport, StaffRosterReport, ComplianceReport]
+
+# Profiling (see profiling.py)
+class ProfileTokenRequest(msgspec.Struct, forbid_unknown_fields=True):
+    minutes: Annotated[int, msgspec.Meta(ge=1, le=60)] = 15
+
+class SamplingStart(msgspec.Struct, forbid_unknown_fields=True):
+    seconds: Annotated[float, msgspec.Meta(gt=0, le=300)] = 30.0
+    interval_ms: Annotated[int, msgspec.Meta(ge=1, le=1000)] = 10
+
+def bulk_of(schema, max_items=MAX_BULK_ITEMS):
+    """List type for bulk endpoints, reusing the single-item schema"""
+    return Annotated[list[schema], msgspec.Meta(min_length=1, max_length=max_items)]
+
+_decoders = {}
+
+def _decoder(schema):
+    # Decoders are compiled once per schema and reused for every request
+    decoder = _decoders.get(schema)
+    if decoder is None:
+        decoder = _decoders[schema] = msgspec.json.Decoder(schema)
+    return decoder
+
+def decode(schema, raw):
+    """Decode raw JSON bytes into schema; raises msgspec.ValidationError
+    or msgspec.DecodeError"""
+    return _decoder(schema).decode(raw)
+
+def validate_body(schema):
+    """Decode the request body into schema and pass it as `body`.
+
+    Runs before the handler, so invalid requests get a 422 without
+    opening a database session.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                body = decode(schema, request.get_data(cache=False))
+            except msgspec.ValidationError as e:
+                return jsonify({'error': 'Invalid request body', 'detail': str(e)}), 422
+            except msgspec.DecodeError as e:
+                return jsonify({'error': 'Malformed JSON', 'detail': str(e)}), 400
+            return f(*args, body=body, **kwargs)
+        return decorated_function
+    return decorator
+
+def provided_fields(body):
+    """Fields the client actually sent in an update body"""
+    return {
+        field: value for field in body.__struct_fields__
+        if (value := getattr(body, field)) is not msgspec.UNSET
+    }
@@ -0,0 +1,103 @@
+import base64
+import json
+import re
+from sqlalchemy import and_, func, literal, or_, select, text
+from models import Participant
+from pii import email_index
+from serializers import participant_encoder
+from tenancy import current_tenant_id
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Shorter queries only use prefix matching; trigrams need 3+ characters
+MIN_FUZZY_LENGTH = 3
+WORD_SIMILARITY_THRESHOLD = 0.4
+
+TOKEN_PATTERN = re.compile(r"[\w@.+-]+")
+
+def encode_cursor(rank, participant_id):
+    raw = json.dumps([rank, participant_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return (rank, id) from a cursor, or None if it is malformed"""
+    try:
+        rank, participant_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(rank), int(participant_id)
+    except (ValueError, TypeError):
+        return None
+
+def prefix_tsquery(q):
+    """Turn user input into a prefix tsquery: 'ali bro' -> 'ali':* & 'bro':*"""
+    tokens = TOKEN_PATTERN.findall(q.lower())
+    return ' & '.join(f"'{token}':*" for token in tokens)
+
+def find_by_ndis_number(db, ndis_number):
+    """Exact-match fast path through the unique ndis_number index"""
+    statement = participant_encoder.select().where(Participant.ndis_number == ndis_number)
+    return participant_encoder.fetch(db, statement)
+
+def find_by_email(db, email):
+    """Exact-match path through the email blind index; emails are
+    encrypted, so this is the only way to find one"""
+    statement = participant_encoder.select().where(
+        Participant.email_index == email_index(current_tenant_id(), email)
+    )
+    return participant_encoder.fetch(db, statement)
+
+def search_participants(db, q, limit=DEFAULT_LIMIT, cursor=None):
+    """Ranked prefix + typo-tolerant search over names and NDIS numbers
+    with keyset pagination; an email address finds its exact match.
+
+    Returns (participants, next_cursor).
+    """
+    q = q.strip()
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    if cursor is None and ' ' not in q and any(ch.isdigit() for ch in q):
+        exact = find_by_ndis_number(db, q)
+        if exact:
+            return exact, None
+    if cursor is None and ' ' not in q and '@' in q:
+        return find_by_email(db, q), None
+
+    tsquery_text = prefix_tsquery(q)
+    conditions = []
+    if tsquery_text:
+        tsquery = func.to_tsquery('simple', tsquery_text)
+        conditions.append(Participant.search_vector.op('@@')(tsquery))
+        rank = func.ts_rank_cd(Participant.search_vector, tsquery)
+    else:
+        rank = literal(0.0)
+
+    if len(q) >= MIN_FUZZY_LENGTH:
+        db.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {'threshold': str(WORD_SIMILARITY_THRESHOLD)}
+        )
+        # '<%' is index-assisted word similarity, tolerant of typos
+        conditions.append(literal(q.lower()).op('<%')(Participant.search_text))
+        rank = rank + func.word_similarity(q.lower(), Participant.search_text)
+
+    if not conditions:
+        return [], None
+
+    matches = select(
+        *participant_encoder.columns, rank.label('rank')
+    ).where(or_(*conditions)).subquery()
+
+    statement = select(matches).order_by(matches.c.rank.desc(), matches.c.id)
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        last_rank, last_id = position
+        statement = statement.where(or_(
+            matches.c.rank < last_rank,
+            and_(matches.c.rank == last_rank, matches.c.id > last_id)
+        ))
+
+    rows = db.execute(statement.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    return participant_encoder.encode((row[:-1] for row in rows), db), next_cursor
@@ -0,0 +1,145 @@
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Integer, any_, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from models import Participant, Staff, User
+from pii import PII_FIELDS, decrypt_rows
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional - fall back to the stdlib encoder Flask ships with
+    orjson = None
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+class RowEncoder:
+    """Precompiled encoder turning plain row tuples into response dicts"""
+
+    def __init__(self, fields, encrypted=()):
+        self.keys = tuple(key for key, _ in fields)
+        self.columns = tuple(column for _, column in fields)
+        # (position, field) of the columns stored encrypted (see pii.py)
+        self.encrypted = tuple((i, key) for i, key in enumerate(self.keys) if key in encrypted)
+        # Only the stdlib path needs datetimes converted by hand,
+        # orjson emits the same ISO 8601 strings natively
+        self.datetime_positions = tuple(
+            i for i, column in enumerate(self.columns)
+            if _python_type(column) in (datetime, date)
+        )
+
+    def select(self):
+        """Build a SELECT that returns rows as tuples (no ORM identity map)"""
+        return select(*self.columns)
+
+    def encode(self, rows, db=None):
+        """Response dicts for rows; db is needed to decrypt encrypted
+        columns, which is done for all rows at once"""
+        keys = self.keys
+        if self.encrypted:
+            rows = decrypt_rows(db, rows, self.encrypted)
+        if orjson is not None or not self.datetime_positions:
+            return [dict(zip(keys, row)) for row in rows]
+
+        positions = self.datetime_positions
+        result = []
+        for row in rows:
+            row = list(row)
+            for i in positions:
+                if row[i] is not None:
+                    row[i] = row[i].isoformat()
+            result.append(dict(zip(keys, row)))
+        return result
+
+    def fetch(self, db, statement=None):
+        """Run the statement (or the default select) and encode every row"""
+        if statement is None:
+            statement = self.select()
+        return self.encode(db.execute(statement).tuples(), db)
+
+participant_encoder = RowEncoder([
+    ('id', Participant.id),
+    ('first_name', Participant.first_name),
+    ('last_name', Participant.last_name),
+    ('email', Participant.email),
+    ('phone', Participant.phone),
+    ('address', Participant.address),
+    ('emergency_contact', Participant.emergency_contact),
+    ('ndis_number', Participant.ndis_number),
+    ('status', Participant.status),
+    ('created_at', Participant.created_at),
+], encrypted=PII_FIELDS)
+
+staff_encoder = RowEncoder([
+    ('id', Staff.id),
+    ('first_name', Staff.first_name),
+    ('last_name', Staff.last_name),
+    # The login email, filled in by list_staff (see user_emails)
+    ('email', Staff.user_id),
+    ('phone', Staff.phone),
+    ('position', Staff.position),
+    ('status', Staff.status),
+    ('hire_date', Staff.hire_date),
+])
+
+def list_participants(db):
+    """Return all participants as response dicts"""
+    return participant_encoder.fetch(
+        db, participant_encoder.select().order_by(Participant.id)
+    )
+
+def user_emails(db, user_ids):
+    """Login email by user id.
+
+    users is a directory table (see tenancy) and a placed tenant's staff
+    are in another database, so the emails are looked up in one query of
+    their own rather than joined.
+    """
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return {}
+    return dict(db.execute(
+        select(User.id, User.email).where(User.id == any_(literal(user_ids, ARRAY(Integer))))
+    ).all())
+
+def list_staff(db):
+    """Return all staff (with their login email) as response dicts"""
+    staff = staff_encoder.fetch(db, staff_encoder.select().order_by(Staff.id))
+    emails = user_emails(db, [member['email'] for member in staff])
+    for member in staff:
+        member['email'] = emails.get(member['email'])
+    return staff
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes straight to bytes with orjson"""
+
+    sort_keys = False
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options())
+        return self._app.response_class(body, mimetype=self.mimetype)
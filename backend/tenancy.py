@@ -0,0 +1,140 @@
+"""Provider tenancy: the current tenant, row scoping and placement.
+
+Every tenant-owned table carries tenant_id (TenantScoped). ORM statements
+run through a TenantScopedSession only see the current tenant's rows,
+and new rows get its id, so handlers need no tenant filters of their own.
+Raw SQL has to filter on tenant_id itself.
+
+Tenants share the main database unless TENANT_PLACEMENTS places them
+elsewhere, as JSON keyed by tenant id:
+
+    {"7": {"schema": "tenant_7"},
+     "9": {"url": "postgresql://...", "pool_size": 20}}
+
+A schema placement uses its own schema in the main database (the
+directory tables, tenants and users, still resolve from public); a url
+placement is a database of its own. Either way the tenant gets a
+connection pool of its own, so a large tenant neither queues behind the
+others for connections nor shares their tables and indexes.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, has_request_context
+from sqlalchemy import Column, ForeignKey, Integer, create_engine, event
+from sqlalchemy.orm import Session, declared_attr, with_loader_criteria
+
+DEFAULT_TENANT_ID = 1
+TENANT_PLACEMENTS = {
+    int(tenant_id): placement
+    for tenant_id, placement in json.loads(os.getenv('TENANT_PLACEMENTS') or '{}').items()
+}
+# Statements run with this execution option see every tenant's rows
+ALL_TENANTS = 'all_tenants'
+
+# Set for background work (tenant_context) and per asyncio task; sync
+# request handlers keep the tenant on flask.g instead, which is dropped
+# with the request rather than left behind on the worker thread
+_current_tenant = ContextVar('current_tenant', default=None)
+
+def current_tenant_id():
+    tenant_id = _current_tenant.get()
+    if tenant_id is None and has_request_context():
+        tenant_id = g.get('tenant_id')
+    return tenant_id if tenant_id is not None else DEFAULT_TENANT_ID
+
+@contextmanager
+def tenant_context(tenant_id):
+    """Run a block (e.g. a background job) as tenant_id"""
+    token = _current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+def set_request_tenant(tenant_id):
+    """Make tenant_id current for the rest of the request"""
+    if has_request_context():
+        g.tenant_id = tenant_id
+    else:
+        # An asyncio request runs in a task of its own, which has its own
+        # copy of the context
+        _current_tenant.set(tenant_id)
+
+class TenantScoped:
+    """Mixin for tables whose rows belong to one tenant"""
+
+    @declared_attr
+    def tenant_id(cls):
+        return Column(Integer, ForeignKey('tenants.id'), nullable=False, default=current_tenant_id)
+
+class TenantScopedSession(Session):
+    """Session whose ORM statements only touch the current tenant's rows"""
+
+@event.listens_for(TenantScopedSession, 'do_orm_execute')
+def _scope_to_tenant(execute_state):
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    if execute_state.execution_options.get(ALL_TENANTS):
+        return
+    if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+        return
+    tenant_id = current_tenant_id()
+    execute_state.statement = execute_state.statement.options(with_loader_criteria(
+        TenantScoped, lambda cls: cls.tenant_id == tenant_id, include_aliases=True
+    ))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _placement_url(placement, default_url):
+    return placement.get('url') or default_url
+
+def _connect_args(placement):
+    if placement.get('schema'):
+        return {'options': f"-csearch_path={placement['schema']},public"}
+    return {}
+
+def placement_engine(tenant_id, default_engine):
+    """Engine of the tenant's placement, or default_engine if it shares
+    the main database"""
+    placement = TENANT_PLACEMENTS.get(tenant_id)
+    if placement is None:
+        return default_engine
+    engine = _engines.get(tenant_id)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(tenant_id)
+            if engine is None:
+                engine = create_engine(
+                    _placement_url(placement, default_engine.url),
+                    pool_size=int(placement.get('pool_size', 5)),
+                    pool_pre_ping=True,
+                    connect_args=_connect_args(placement)
+                )
+                _engines[tenant_id] = engine
+    return engine
+
+def placed_tenants():
+    """Tenants with a placement of their own; the rest share the main database"""
+    return sorted(TENANT_PLACEMENTS)
+
+def placement_databases():
+    """A tenant id per placement for background workers to run as; the
+    default tenant stands for the main database and everyone in it"""
+    return [DEFAULT_TENANT_ID, *(t for t in placed_tenants() if t != DEFAULT_TENANT_ID)]
+
+# Directory tables (and the process-wide profiles) live in the main
+# database whatever the tenant
+DIRECTORY_TABLES = {'tenants', 'users', 'revoked_tokens', 'user_token_revocations', 'profiles'}
+
+class TenantSession(TenantScopedSession):
+    """Tenant-scoped session bound to the current tenant's placement"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        default = super().get_bind(mapper, clause=clause, **kw)
+        if mapper is not None and mapper.persist_selectable.name in DIRECTORY_TABLES:
+            return default
+        return placement_engine(current_tenant_id(), default)
@@ -0,0 +1,6 @@
+"""Offline load-test and benchmark suite for the NDIS platform.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.run --participants 10000 --output bench.json
+"""
@@ -0,0 +1,128 @@
+"""Compare the sync (Flask) and async (Quart + asyncpg) read endpoints
+under increasing concurrency and while many change streams are held open.
+
+    python -m benchmarks.async_compare --concurrency 16 128 512 --streams 1000
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from urllib.parse import urlsplit
+from benchmarks import seed as seeding
+from benchmarks.http_load import login, run_scenario
+from benchmarks.report import process_rss_kb, summarize
+from benchmarks.run import DEFAULT_DATABASE_URL, REPO_ROOT, start_server
+
+STACKS = {
+    'sync': None,
+    'async': lambda port: [sys.executable, '-m', 'hypercorn', 'asgi:app', '--bind', f"127.0.0.1:{port}"],
+}
+SCENARIO_METRICS = ['p50_ms', 'p99_ms', 'throughput_rps', 'errors']
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark sync vs async read endpoints')
+    parser.add_argument('--database-url', default=os.getenv('BENCHMARK_DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--participants', type=int, default=10000)
+    parser.add_argument('--staff', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse the data already loaded')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 128, 512])
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario and concurrency')
+    parser.add_argument('--streams', type=int, default=500,
+                        help='Change streams held open during the streams scenario')
+    parser.add_argument('--output', default='bench_async.json')
+    return parser.parse_args(argv)
+
+def open_streams(base_url, token, count):
+    """Open count SSE connections on raw sockets without reading them,
+    like slow clients parked on the change stream"""
+    parts = urlsplit(base_url)
+    request = (
+        f"GET /api/changes/stream HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        f"Authorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n"
+    ).encode('ascii')
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection((parts.hostname, parts.port), timeout=10)
+        sock.sendall(request)
+        sockets.append(sock)
+    return sockets
+
+def benchmark_stack(name, args, token):
+    """Run every scenario against one server; returns {scenario: summary}"""
+    server, base_url = start_server(os.path.join(REPO_ROOT, 'backend'), args.database_url, STACKS[name])
+    headers = {'Authorization': f"Bearer {token}"}
+    names = seeding.generate_data.LAST_NAMES
+
+    def search(rng, i):
+        return 'GET', '/api/participants/search', {'headers': headers, 'params': {'q': rng.choice(names)[:4]}}
+
+    def list_staff(rng, i):
+        return 'GET', '/api/staff/', {'headers': headers}
+
+    results = {}
+    try:
+        for concurrency in args.concurrency:
+            for scenario, make_request in (('search', search), ('list_staff', list_staff)):
+                result = run_scenario(f"{name}:{scenario}@{concurrency}", base_url, make_request,
+                                      args.requests, concurrency, args.seed)
+                results[f"{scenario}@{concurrency}"] = summarize(result)
+
+        print(f"🔌 {name}: holding {args.streams} change streams open")
+        streams = []
+        try:
+            streams = open_streams(base_url, token, args.streams)
+            time.sleep(1)
+            result = run_scenario(f"{name}:search_with_streams", base_url, search,
+                                  args.requests, args.concurrency[0], args.seed)
+            results[f"search_with_{args.streams}_streams"] = summarize(result)
+        except OSError as e:
+            results[f"search_with_{args.streams}_streams"] = {'error': f"opened {len(streams)} streams: {e}"}
+        finally:
+            for sock in streams:
+                sock.close()
+        results['memory'] = process_rss_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return results
+
+def print_table(report):
+    print(f"\n{'scenario':<30}{'metric':<16}{'sync':>12}{'async':>12}")
+    for scenario in report['sync']:
+        if scenario == 'memory':
+            continue
+        for metric in SCENARIO_METRICS:
+            values = [str(report[stack].get(scenario, {}).get(metric)) for stack in STACKS]
+            print(f"{scenario:<30}{metric:<16}{values[0]:>12}{values[1]:>12}")
+    values = [str(report[stack]['memory'].get('peak_rss_kb')) for stack in STACKS]
+    print(f"{'server':<30}{'peak_rss_kb':<16}{values[0]:>12}{values[1]:>12}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.skip_seed:
+        counts = seeding.seed(args.database_url, os.path.join(REPO_ROOT, 'database', 'init.sql'),
+                              participants=args.participants, staff=args.staff, seed_value=args.seed)
+        print(f"🌱 Seeded {counts}")
+
+    # Tokens come from the sync login; both stacks share JWT_SECRET_KEY
+    server, base_url = start_server(os.path.join(REPO_ROOT, 'backend'), args.database_url)
+    try:
+        token = login(base_url, seeding.ADMIN_EMAIL, seeding.BENCH_PASSWORD)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    report = {'meta': {'participants': args.participants, 'staff': args.staff, 'requests': args.requests}}
+    for name in STACKS:
+        report[name] = benchmark_stack(name, args, token)
+    print_table(report)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report written to {args.output}")
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Times automation sweeps of one checkout against an SMTP sink.
+
+Usage: python automation_timing.py send_daily_reminders [...]
+
+Invoked by benchmarks.run as a subprocess with the checkout's automation
+directory as working directory, so the code under test is imported
+rather than the harness's own copy. Prints a BENCHMARK_RESULT line.
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+RESULT_MARKER = 'BENCHMARK_RESULT '
+
+def main():
+    sys.path.insert(0, os.getcwd())
+    results = {}
+    try:
+        from notification_workflows import NotificationWorkflows
+        workflows = NotificationWorkflows()
+    except Exception as e:
+        print(RESULT_MARKER + json.dumps({'error': f"{type(e).__name__}: {e}"}))
+        return
+
+    for name in sys.argv[1:]:
+        if not hasattr(workflows, name):
+            # Older checkouts send directly and have no dispatch sweeps
+            results[name] = {'seconds': None, 'error': None, 'skipped': True}
+            continue
+        # The workflows log every email; keep that noise out of the timing
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            try:
+                getattr(workflows, name)()
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+        results[name] = {'seconds': round(elapsed, 4), 'error': error}
+
+    print(RESULT_MARKER + json.dumps(results))
+
+if __name__ == '__main__':
+    main()
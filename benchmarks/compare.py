@@ -0,0 +1,80 @@
+"""Compare two benchmark reports, or benchmark two commits and compare them.
+
+    python -m benchmarks.compare before.json after.json
+    python -m benchmarks.compare --commits main HEAD -- --participants 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from benchmarks import run
+
+HTTP_METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps']
+
+def _delta(before, after):
+    if before in (None, 0) or after is None:
+        return '   n/a'
+    return f"{(after - before) / before * 100:+6.1f}%"
+
+def compare(before, after):
+    """Print per-scenario deltas between two reports"""
+    print(f"before: {before['meta'].get('commit')}")
+    print(f"after:  {after['meta'].get('commit')}\n")
+    print(f"{'scenario':<22}{'metric':<16}{'before':>12}{'after':>12}{'change':>10}")
+    for scenario in sorted(set(before['http']) | set(after['http'])):
+        a = before['http'].get(scenario, {})
+        b = after['http'].get(scenario, {})
+        for metric in HTTP_METRICS:
+            print(f"{scenario:<22}{metric:<16}{str(a.get(metric)):>12}{str(b.get(metric)):>12}"
+                  f"{_delta(a.get(metric), b.get(metric)):>10}")
+
+    for sweep in sorted(set(before['automation']) | set(after['automation'])):
+        a = before['automation'].get(sweep, {}).get('seconds')
+        b = after['automation'].get(sweep, {}).get('seconds')
+        print(f"{sweep:<22}{'seconds':<16}{str(a):>12}{str(b):>12}{_delta(a, b):>10}")
+
+    a = before['memory']['server'].get('peak_rss_kb')
+    b = after['memory']['server'].get('peak_rss_kb')
+    print(f"{'server':<22}{'peak_rss_kb':<16}{str(a):>12}{str(b):>12}{_delta(a, b):>10}")
+
+def benchmark_commits(commits, run_args):
+    """Run the benchmark against a temporary worktree of each commit"""
+    reports = []
+    for commit in commits:
+        worktree = tempfile.mkdtemp(prefix='ndis-bench-')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, commit],
+                       cwd=run.REPO_ROOT, check=True)
+        try:
+            output = os.path.join(tempfile.gettempdir(), f"ndis-bench-{commit.replace('/', '_')}.json")
+            reports.append(run.main(run_args + ['--checkout', worktree, '--output', output]))
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=run.REPO_ROOT)
+    return reports
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    run_args = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, run_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description='Compare two NDIS benchmark runs')
+    parser.add_argument('reports', nargs='*', help='Two report files: before after')
+    parser.add_argument('--commits', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args(argv)
+
+    if args.commits:
+        before, after = benchmark_commits(args.commits, run_args)
+    elif len(args.reports) == 2:
+        with open(args.reports[0]) as f:
+            before = json.load(f)
+        with open(args.reports[1]) as f:
+            after = json.load(f)
+    else:
+        parser.error('pass two report files or --commits BEFORE AFTER')
+    compare(before, after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+class ScenarioResult:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+def _worker(base_url, make_request, count, seed_value, result, lock):
+    session = requests.Session()
+    rng = random.Random(seed_value)
+    latencies = []
+    errors = 0
+    for i in range(count):
+        method, path, kwargs = make_request(rng, i)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - started)
+        if not ok:
+            errors += 1
+    with lock:
+        result.latencies.extend(latencies)
+        result.errors += errors
+
+def run_scenario(name, base_url, make_request, total_requests, concurrency, seed_value=42):
+    """Issue total_requests spread over `concurrency` threads.
+
+    make_request(rng, i) returns (method, path, requests_kwargs).
+    """
+    result = ScenarioResult(name)
+    lock = threading.Lock()
+    per_worker = [total_requests // concurrency] * concurrency
+    for i in range(total_requests % concurrency):
+        per_worker[i] += 1
+
+    print(f"🏃 {name}: {total_requests} requests at concurrency {concurrency}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(_worker, base_url, make_request, count, seed_value + n, result, lock)
+            for n, count in enumerate(per_worker) if count
+        ]
+        for future in futures:
+            future.result()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+def login(base_url, email, password):
+    response = requests.post(f"{base_url}/api/auth/login",
+                             json={'email': email, 'password': password}, timeout=60)
+    response.raise_for_status()
+    return response.json()['token']
@@ -0,0 +1,71 @@
+import json
+import math
+import platform
+import resource
+import subprocess
+from datetime import datetime
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+def summarize(result):
+    latencies = sorted(result.latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': result.errors,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'throughput_rps': round(len(latencies) / result.elapsed, 2) if result.elapsed else None,
+    }
+
+def process_rss_kb(pid):
+    """Current and peak RSS of a process from /proc (Linux only)"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        return {'rss_kb': None, 'peak_rss_kb': None}
+    return {'rss_kb': values.get('VmRSS'), 'peak_rss_kb': values.get('VmHWM')}
+
+def self_peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def git_commit(path):
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_report(config, commit, http_results, automation_results, server_rss):
+    return {
+        'meta': {
+            'commit': commit,
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            **config,
+        },
+        'http': {result.name: summarize(result) for result in http_results},
+        'automation': automation_results,
+        'memory': {
+            'server': server_rss,
+            'harness_peak_rss_kb': self_peak_rss_kb(),
+        },
+    }
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report written to {path}")
@@ -0,0 +1,41 @@
+import os
+import sys
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import generate_data
+from generate_data import ADMIN_EMAIL, staff_email
+
+BENCH_PASSWORD = 'benchmark123'
+POSITIONS = [position for position, _ in generate_data.POSITIONS]
+
+def load_schema(conn, init_sql_path):
+    """Recreate the public schema from a database/init.sql file.
+
+    The CREATE DATABASE and \\c lines are skipped since we are already
+    connected to the benchmark database.
+    """
+    with open(init_sql_path) as f:
+        statements = [
+            line for line in f.read().splitlines()
+            if not line.startswith('\\') and not line.upper().startswith('CREATE DATABASE')
+        ]
+    with conn.cursor() as cursor:
+        cursor.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+        cursor.execute("\n".join(statements))
+    conn.commit()
+
+def seed(database_url, init_sql_path, participants=10000, staff=1000, seed_value=42):
+    """Recreate the schema and load synthetic data with the COPY-based
+    generator in scripts/generate_data.py; returns counts per table"""
+    conn = psycopg2.connect(database_url)
+    try:
+        load_schema(conn, init_sql_path)
+    finally:
+        conn.close()
+    return generate_data.generate(database_url, staff=staff, participants=participants,
+                                  seed=seed_value, password=BENCH_PASSWORD)
+
+def worker_email(index):
+    """Login email of the index-th generated worker (user ids start after the admin)"""
+    return staff_email(index + 2)
@@ -0,0 +1,59 @@
+"""WSGI app used by the benchmark: the backend blueprints mounted at the
+same /api paths the frontend calls.
+
+Run as a subprocess with the backend directory as working directory
+(python <path>/server.py <port>) so that the commit under test is the
+code that gets imported.
+"""
+import importlib
+import os
+import sys
+from datetime import timedelta
+
+BLUEPRINTS = [
+    ('routes.auth_routes', 'auth_bp', '/api/auth'),
+    ('routes.staff_routes', 'staff_bp', '/api/staff'),
+    ('routes.participant_routes', 'participant_bp', '/api/participants'),
+    ('routes.dashboard_routes', 'dashboard_bp', '/api/dashboard'),
+    ('routes.change_routes', 'change_bp', '/api/changes'),
+    ('routes.roster_routes', 'roster_bp', '/api/roster'),
+    ('routes.claims_routes', 'claims_bp', '/api/claims'),
+    ('routes.import_routes', 'import_bp', '/api/import'),
+    ('routes.admin_routes', 'admin_bp', '/api/admin'),
+    ('routes.report_routes', 'reports_bp', '/api/reports'),
+    ('routes.debug_routes', 'debug_bp', '/debug'),
+]
+
+def create_app():
+    sys.path.insert(0, os.getcwd())
+    from flask import Flask, jsonify
+    from flask_jwt_extended import JWTManager
+
+    app = Flask('ndis-benchmark')
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'benchmark-secret-key')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=2)
+    JWTManager(app)
+
+    try:
+        from serializers import OrjsonProvider
+        app.json = OrjsonProvider(app)
+    except ImportError:
+        pass
+
+    # Older commits may not have every blueprint yet
+    for module_name, attr, prefix in BLUEPRINTS:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        app.register_blueprint(getattr(module, attr), url_prefix=prefix)
+
+    @app.route('/api/health')
+    def health():
+        return jsonify({'status': 'ok'})
+
+    return app
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5050
+    create_app().run(host='127.0.0.1', port=port, threaded=True)
@@ -0,0 +1,69 @@
+import socketserver
+import threading
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and discard messages"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        self.reply("220 ndis-benchmark-sink ESMTP")
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    self.server.sink.record()
+                    self.reply("250 OK queued")
+                continue
+
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply("250 ndis-benchmark-sink")
+            elif command.startswith(('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply("250 OK")
+            elif command == 'DATA':
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class SMTPSink:
+    """Local SMTP server that counts the messages it receives"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = _Server((host, port), _SMTPHandler)
+        self._server.sink = self
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def record(self):
+        with self._lock:
+            self.messages += 1
+
+    def reset(self):
+        with self._lock:
+            count, self.messages = self.messages, 0
+        return count
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
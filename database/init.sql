@@ -4,9 +4,27 @@ CREATE DATABASE ndis_platform;
 -- Connect to the database
 \c ndis_platform;
 
+-- Trigram matching for fuzzy participant search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Plain columns in GIN indexes, for the tenant-leading search indexes
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- Provider organisations; tenant-owned rows carry their tenant_id
+CREATE TABLE tenants (
+    id SERIAL PRIMARY KEY,
+    slug VARCHAR(100) UNIQUE NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Rows written by plain SQL without a tenant belong to the default tenant
+INSERT INTO tenants (id, slug, name) VALUES (1, 'default', 'Default provider');
+SELECT setval('tenants_id_seq', 1);
+
 -- Users table
 CREATE TABLE users (
     id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
     email VARCHAR(255) UNIQUE NOT NULL,
     password_hash VARCHAR(255) NOT NULL,
     role VARCHAR(50) NOT NULL CHECK (role IN ('admin', 'staff', 'coordinator')),
@@ -18,6 +36,7 @@ CREATE TABLE users (
 -- Staff table
 CREATE TABLE staff (
     id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     first_name VARCHAR(100) NOT NULL,
     last_name VARCHAR(100) NOT NULL,
@@ -25,26 +44,133 @@ CREATE TABLE staff (
     position VARCHAR(100),
     hire_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     status VARCHAR(20) DEFAULT 'active' CHECK (status IN ('active', 'inactive', 'on_leave')),
+    max_weekly_hours INTEGER DEFAULT 38,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Participants table
 CREATE TABLE participants (
     id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
     first_name VARCHAR(100) NOT NULL,
     last_name VARCHAR(100) NOT NULL,
-    email VARCHAR(255),
-    phone VARCHAR(20),
-    address TEXT,
-    emergency_contact VARCHAR(255),
-    ndis_number VARCHAR(50) UNIQUE,
+    -- Contact details are encrypted by the application (backend/pii.py)
+    email BYTEA,
+    phone BYTEA,
+    address BYTEA,
+    emergency_contact BYTEA,
+    -- Keyed hash of the normalised email, for exact lookups
+    email_index BYTEA,
+    ndis_number VARCHAR(50),
     status VARCHAR(20) DEFAULT 'active' CHECK (status IN ('active', 'inactive', 'pending')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Search columns, kept up to date by Postgres
+    search_text TEXT GENERATED ALWAYS AS (
+        lower(first_name || ' ' || last_name || ' ' || coalesce(ndis_number, ''))
+    ) STORED,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        to_tsvector('simple', first_name || ' ' || last_name || ' ' || coalesce(ndis_number, ''))
+    ) STORED,
+    -- NDIS numbers are national, but each provider keeps its own record
+    UNIQUE (tenant_id, ndis_number)
+);
+
+-- Data keys for participant PII, wrapped with the master key; the newest
+-- one of a tenant encrypts, older ones only decrypt
+CREATE TABLE pii_data_keys (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    wrapped_key BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Rostering: recurring weekly availability, qualifications and bookings
+CREATE TABLE staff_availability (
+    id SERIAL PRIMARY KEY,
+    staff_id INTEGER NOT NULL REFERENCES staff(id) ON DELETE CASCADE,
+    weekday SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6), -- 0 = Monday
+    start_minute SMALLINT NOT NULL CHECK (start_minute BETWEEN 0 AND 1440),
+    end_minute SMALLINT NOT NULL CHECK (end_minute BETWEEN 0 AND 1440),
+    CHECK (start_minute < end_minute)
+);
+
+CREATE TABLE staff_qualifications (
+    staff_id INTEGER NOT NULL REFERENCES staff(id) ON DELETE CASCADE,
+    qualification VARCHAR(100) NOT NULL,
+    PRIMARY KEY (staff_id, qualification)
+);
+
+CREATE TABLE bookings (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    participant_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+    starts_at TIMESTAMP NOT NULL,
+    ends_at TIMESTAMP NOT NULL,
+    required_qualifications TEXT[] NOT NULL DEFAULT '{}',
+    staff_id INTEGER REFERENCES staff(id) ON DELETE SET NULL,
+    status VARCHAR(20) DEFAULT 'open' CHECK (status IN ('open', 'assigned', 'cancelled')),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (starts_at < ends_at)
+);
+
+-- Plan budgets and claims
+CREATE TABLE support_items (
+    code VARCHAR(30) PRIMARY KEY, -- NDIS support item number
+    name VARCHAR(255) NOT NULL,
+    category VARCHAR(100) NOT NULL,
+    unit VARCHAR(5) NOT NULL DEFAULT 'H',
+    price_limit NUMERIC(10, 2) NOT NULL CHECK (price_limit >= 0)
+);
+
+CREATE TABLE plan_budgets (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    participant_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+    category VARCHAR(100) NOT NULL,
+    starts_on DATE NOT NULL,
+    ends_on DATE NOT NULL,
+    amount NUMERIC(12, 2) NOT NULL CHECK (amount >= 0),
+    claimed_amount NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    UNIQUE (participant_id, category, starts_on),
+    CHECK (starts_on <= ends_on)
+);
+
+CREATE TABLE claim_batches (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    claimed_count INTEGER NOT NULL DEFAULT 0,
+    rejected_count INTEGER NOT NULL DEFAULT 0,
+    total_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    file_name VARCHAR(255),
+    created_by INTEGER REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE support_line_items (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    participant_id INTEGER NOT NULL REFERENCES participants(id) ON DELETE CASCADE,
+    booking_id INTEGER REFERENCES bookings(id) ON DELETE SET NULL,
+    support_item_code VARCHAR(30) NOT NULL REFERENCES support_items(code),
+    service_date DATE NOT NULL,
+    quantity NUMERIC(8, 2) NOT NULL CHECK (quantity > 0),
+    unit_price NUMERIC(10, 2) NOT NULL CHECK (unit_price >= 0),
+    claim_status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (claim_status IN ('pending', 'claimed', 'rejected')),
+    claim_batch_id INTEGER REFERENCES claim_batches(id),
+    plan_budget_id INTEGER REFERENCES plan_budgets(id),
+    claimed_amount NUMERIC(12, 2),
+    rejection_reason VARCHAR(50),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Security logs table (Emanuel's monitoring)
 CREATE TABLE security_logs (
     id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
     event_type VARCHAR(100) NOT NULL,
     user_id INTEGER REFERENCES users(id),
     details TEXT,
@@ -56,18 +182,200 @@ CREATE TABLE security_logs (
 -- Automation logs table (Aryan's workflows)
 CREATE TABLE automation_logs (
     id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
     workflow_type VARCHAR(100) NOT NULL,
     entity_type VARCHAR(50), -- 'staff', 'participant', etc.
     entity_id INTEGER,
     status VARCHAR(20) DEFAULT 'pending',
     details JSONB,
+    next_run_at TIMESTAMP, -- set while a workflow run is active
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     completed_at TIMESTAMP
 );
 
--- Create indexes for performance
+-- Report jobs: built by the report worker, artifacts stored by content hash
+CREATE TABLE report_jobs (
+    id SERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    report_type VARCHAR(50) NOT NULL,
+    format VARCHAR(10) NOT NULL DEFAULT 'csv' CHECK (format IN ('csv', 'xlsx')),
+    params JSONB NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed', 'expired')),
+    content_hash VARCHAR(64),
+    row_count INTEGER,
+    byte_size BIGINT,
+    error TEXT,
+    requested_by INTEGER REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    expires_at TIMESTAMP
+);
+
+-- Request profiles and sampling sessions (backend/profiling.py)
+CREATE TABLE profiles (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL CHECK (kind IN ('request', 'sampling')),
+    method VARCHAR(10),
+    path TEXT,
+    status_code INTEGER,
+    duration_ms DOUBLE PRECISION,
+    summary TEXT,
+    stats BYTEA,
+    sql JSONB,
+    folded TEXT,
+    samples INTEGER,
+    requested_by INTEGER REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Per-hour event counts for the admin log charts, kept in step with the
+-- inserts so charts never scan the log tables
+CREATE TABLE log_hourly_counts (
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    source VARCHAR(20) NOT NULL, -- 'automation', 'security'
+    hour TIMESTAMP NOT NULL,
+    label VARCHAR(150) NOT NULL, -- '<workflow_type>.started' etc., or the event type
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant_id, source, hour, label)
+);
+
+-- Outgoing notifications: queued by workflows, sent as per-recipient digests
+CREATE TABLE notification_dead_letters (
+    id BIGSERIAL PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    item_count INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    failure_reason TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'retrying' CHECK (status IN ('retrying', 'delivered', 'dead')),
+    next_retry_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE notification_queue (
+    id BIGSERIAL PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    details TEXT NOT NULL,
+    entity_type VARCHAR(50),
+    entity_id INTEGER,
+    dedupe_key VARCHAR(255) UNIQUE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    dead_letter_id BIGINT REFERENCES notification_dead_letters(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Change feed for the real-time dashboard (LISTEN/NOTIFY + SSE)
+CREATE TABLE change_events (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    payload JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Incrementally maintained dashboard aggregates
+CREATE TABLE dashboard_counters (
+    tenant_id INTEGER NOT NULL DEFAULT 1 REFERENCES tenants(id),
+    metric VARCHAR(100) NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tenant_id, metric)
+);
+
+-- Stored responses for Idempotency-Key retries on create endpoints
+CREATE TABLE idempotency_keys (
+    scope VARCHAR(255) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    content_type VARCHAR(100),
+    response_body BYTEA,
+    locked_until TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, key)
+);
+
+-- Revoked access/refresh tokens by jti, kept until the token expires
+CREATE TABLE revoked_tokens (
+    jti VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tokens a user was issued at or before revoked_before are invalid
+CREATE TABLE user_token_revocations (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    revoked_before TIMESTAMP NOT NULL
+);
+
+-- Recompute every counter from the base tables (run by the automation service)
+CREATE OR REPLACE FUNCTION reconcile_dashboard_counters() RETURNS void AS $$
+BEGIN
+    -- Blocks concurrent counter updates until the recount is committed
+    LOCK TABLE dashboard_counters IN EXCLUSIVE MODE;
+    DELETE FROM dashboard_counters;
+    INSERT INTO dashboard_counters (tenant_id, metric, value)
+    SELECT tenant_id, 'staff.status.' || COALESCE(status, 'unknown'), COUNT(*) FROM staff GROUP BY 1, 2
+    UNION ALL
+    SELECT tenant_id, 'participants.status.' || COALESCE(status, 'unknown'), COUNT(*) FROM participants GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create indexes for performance. Indexes serving tenant queries lead with
+-- tenant_id, so a tenant's queries only read its own part of each index
+-- however large the other tenants grow.
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_staff_user_id ON staff(user_id);
-CREATE INDEX idx_security_logs_user_id ON security_logs(user_id);
-CREATE INDEX idx_security_logs_created_at ON security_logs(created_at);
-CREATE INDEX idx_automation_logs_entity ON automation_logs(entity_type, entity_id);
\ No newline at end of file
+CREATE INDEX idx_staff_tenant ON staff(tenant_id, id);
+CREATE INDEX idx_participants_tenant ON participants(tenant_id, id);
+-- The log indexes end in (created_at, id) so every filter of the admin log
+-- API reads its page straight off one index in keyset order
+CREATE INDEX idx_security_logs_user_id ON security_logs(tenant_id, user_id, created_at, id);
+CREATE INDEX idx_security_logs_created_at ON security_logs(tenant_id, created_at, id);
+CREATE INDEX idx_security_logs_event_type ON security_logs(tenant_id, event_type, created_at, id);
+CREATE INDEX idx_automation_logs_entity ON automation_logs(tenant_id, entity_type, entity_id, created_at, id);
+CREATE INDEX idx_automation_logs_created_at ON automation_logs(tenant_id, created_at, id);
+CREATE INDEX idx_automation_logs_workflow ON automation_logs(tenant_id, workflow_type, created_at, id);
+-- jsonb_path_ops serves the @? jsonpath and @> containment filters on details
+CREATE INDEX idx_automation_logs_details ON automation_logs USING GIN (tenant_id, details jsonb_path_ops);
+-- Workflow ticks only look at active runs, of every tenant
+CREATE INDEX idx_automation_logs_due ON automation_logs(next_run_at) WHERE status IN ('running', 'waiting');
+CREATE INDEX idx_participants_search_vector ON participants USING GIN (tenant_id, search_vector);
+CREATE INDEX idx_participants_search_trgm ON participants USING GIN (tenant_id, search_text gin_trgm_ops);
+CREATE INDEX idx_participants_email_index ON participants(tenant_id, email_index);
+CREATE INDEX idx_profiles_created_at ON profiles(created_at);
+CREATE INDEX idx_pii_data_keys_tenant ON pii_data_keys(tenant_id, created_at);
+CREATE INDEX idx_change_events_created_at ON change_events(created_at);
+CREATE INDEX idx_change_events_tenant ON change_events(tenant_id, id);
+CREATE INDEX idx_notification_queue_unsent ON notification_queue(recipient, id) WHERE status IN ('pending', 'sending');
+CREATE INDEX idx_notification_queue_dead_letter ON notification_queue(dead_letter_id) WHERE dead_letter_id IS NOT NULL;
+CREATE INDEX idx_notification_queue_sent_at ON notification_queue(sent_at) WHERE status = 'sent';
+CREATE INDEX idx_notification_dead_letters_retry ON notification_dead_letters(next_retry_at) WHERE status = 'retrying';
+CREATE INDEX idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+CREATE INDEX idx_revoked_tokens_expires_at ON revoked_tokens(expires_at);
+CREATE INDEX idx_staff_availability_staff_id ON staff_availability(staff_id);
+CREATE INDEX idx_bookings_starts_at ON bookings(tenant_id, starts_at);
+CREATE INDEX idx_bookings_staff_id ON bookings(staff_id, starts_at);
+CREATE INDEX idx_plan_budgets_participant ON plan_budgets(participant_id, category, starts_on);
+CREATE INDEX idx_plan_budgets_tenant ON plan_budgets(tenant_id, ends_on);
+-- At most one unfinished job per distinct request; finished ones are
+-- found through idx_report_jobs_request while they are valid
+CREATE UNIQUE INDEX uq_report_jobs_unfinished ON report_jobs(tenant_id, request_hash) WHERE status IN ('queued', 'running');
+CREATE INDEX idx_report_jobs_request ON report_jobs(tenant_id, request_hash, expires_at) WHERE status = 'done';
+CREATE INDEX idx_report_jobs_queue ON report_jobs(created_at) WHERE status IN ('queued', 'running');
+CREATE INDEX idx_report_jobs_expires ON report_jobs(expires_at) WHERE status = 'done';
+-- Billing runs only ever scan pending line items
+CREATE INDEX idx_support_line_items_pending ON support_line_items(tenant_id, service_date) WHERE claim_status = 'pending';
+CREATE INDEX idx_support_line_items_participant ON support_line_items(participant_id, service_date);
\ No newline at end of file
@@ -10,8 +10,12 @@ INSERT INTO staff (user_id, first_name, last_name, phone, position) VALUES
 (2, 'Sarah', 'Smith', '+61400234567', 'Coordinator'),
 (3, 'Mike', 'Johnson', '+61400345678', 'Support Worker');
 
--- Insert sample participants
-INSERT INTO participants (first_name, last_name, email, phone, ndis_number) VALUES
-('Alice', 'Brown', 'alice@email.com', '+61400456789', 'NDIS001'),
-('Bob', 'Wilson', 'bob@email.com', '+61400567890', 'NDIS002'),
-('Carol', 'Davis', 'carol@email.com', '+61400678901', 'NDIS003');
\ No newline at end of file
+-- Insert sample participants; contact details are encrypted by the
+-- application, so add them through the API
+INSERT INTO participants (first_name, last_name, ndis_number) VALUES
+('Alice', 'Brown', 'NDIS001'),
+('Bob', 'Wilson', 'NDIS002'),
+('Carol', 'Davis', 'NDIS003');
+
+-- Seed the dashboard counters from the rows above
+SELECT reconcile_dashboard_counters();
\ No newline at end of file
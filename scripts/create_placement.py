@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Create the tables of a tenant placed by TENANT_PLACEMENTS.
+
+The DDL is database/init.sql without the directory tables (tenants,
+users, token revocations, profiles), which stay in the main database,
+and without the foreign keys to them: in a database of its own those
+tables do not exist, and in a schema the copies would shadow public's.
+Rows inserted by plain SQL without a tenant default to the placed tenant.
+
+    python scripts/create_placement.py 7
+    python scripts/create_placement.py 7 --print > tenant_7.sql
+"""
+import argparse
+import os
+import re
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+INIT_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'init.sql')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Create the tables of a placed tenant')
+    parser.add_argument('tenant_id', type=int)
+    parser.add_argument('--print', action='store_true', dest='print_only', help='Print the DDL instead of running it')
+    return parser.parse_args(argv)
+
+def statements(sql):
+    """init.sql split into statements, keeping $$ bodies whole"""
+    current, quoted = [], False
+    for line in sql.splitlines():
+        current.append(line)
+        if line.count('$$') % 2:
+            quoted = not quoted
+        if not quoted and line.rstrip().endswith(';'):
+            yield '\n'.join(current).strip()
+            current = []
+
+def placement_ddl(tenant_id, directory_tables):
+    tables = '|'.join(sorted(directory_tables))
+    skipped = re.compile(
+        rf"^(CREATE DATABASE|\\c|SELECT setval\('tenants_id_seq'|INSERT INTO tenants\b"
+        rf"|CREATE TABLE ({tables}) \(|CREATE (UNIQUE )?INDEX \w+ ON ({tables})\()"
+    )
+    references = re.compile(rf" REFERENCES ({tables})\(id\)( ON DELETE (CASCADE|SET NULL))?")
+    with open(INIT_SQL) as f:
+        sql = f.read()
+    kept = []
+    for statement in statements(sql):
+        code = '\n'.join(line for line in statement.splitlines() if not line.startswith('--')).strip()
+        if skipped.match(code):
+            continue
+        statement = statement.replace('tenant_id INTEGER NOT NULL DEFAULT 1 ', f'tenant_id INTEGER NOT NULL DEFAULT {tenant_id} ')
+        kept.append(references.sub('', statement))
+    return '\n\n'.join(kept) + '\n'
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, BACKEND_DIR)
+    from sqlalchemy.engine import make_url
+    from tenancy import DIRECTORY_TABLES, TENANT_PLACEMENTS
+
+    placement = TENANT_PLACEMENTS.get(args.tenant_id)
+    if placement is None:
+        print(f"Tenant {args.tenant_id} has no placement in TENANT_PLACEMENTS", file=sys.stderr)
+        return 1
+    ddl = placement_ddl(args.tenant_id, DIRECTORY_TABLES)
+    schema = placement.get('schema')
+    if schema:
+        ddl = f'CREATE SCHEMA IF NOT EXISTS "{schema}";\nSET search_path TO "{schema}", public;\n\n{ddl}'
+    if args.print_only:
+        sys.stdout.write(ddl)
+        return 0
+
+    import psycopg2
+    from models import DATABASE_URL
+    url = make_url(placement.get('url') or DATABASE_URL).set(drivername='postgresql')
+    conn = psycopg2.connect(url.render_as_string(hide_password=False))
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(ddl)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Created the tables of tenant {args.tenant_id} in {schema or url.database}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
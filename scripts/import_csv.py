@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Import participants or staff from another system's CSV export.
+
+The file is streamed, so memory stays flat for exports of millions of
+rows. Nothing is written unless the whole file is processed.
+
+    python scripts/import_csv.py participants export.csv --rejects rejected.csv
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Import participants or staff from CSV')
+    parser.add_argument('entity', choices=['participants', 'staff'])
+    parser.add_argument('path', help='CSV file with a header row')
+    parser.add_argument('--database-url', default=None, help='Defaults to DATABASE_URL')
+    parser.add_argument('--rejects', help='Write rejected rows with their line and reason here')
+    parser.add_argument('--chunk-rows', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='Validate and stage, then roll back')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    sys.path.insert(0, BACKEND_DIR)
+    from models import SessionLocal
+    from csv_import import CHUNK_ROWS, import_csv
+
+    rejects_file = writer = None
+    if args.rejects:
+        rejects_file = open(args.rejects, 'w', newline='')
+        writer = csv.writer(rejects_file)
+        writer.writerow(['line', 'reason', 'detail'])
+
+    def on_reject(line, reason, detail, row):
+        if writer is not None:
+            writer.writerow([line, reason, detail])
+
+    print(f"📥 Importing {args.entity} from {args.path}")
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        with open(args.path, newline='', encoding='utf-8-sig') as f:
+            report = import_csv(db, args.entity, f, chunk_rows=args.chunk_rows or CHUNK_ROWS,
+                                on_reject=on_reject)
+        if args.dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        if rejects_file is not None:
+            rejects_file.close()
+
+    action = 'Would create' if args.dry_run else 'Created'
+    print(f"✅ {action} {report['created']} of {report['rows']} rows in "
+          f"{time.perf_counter() - started:.1f}s; rejected {report['rejected']} {report['rejections']}")
+    if report['skipped']:
+        print(f"⚠️  {report['skipped']} rows were added by someone else during the import and skipped")
+
+if __name__ == '__main__':
+    main()